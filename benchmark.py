@@ -0,0 +1,189 @@
+import argparse
+import sys
+import cv2
+import numpy as np
+
+import src.visualization_utils as viz_utils
+from src.benchmark import StageBenchmark, find_regressions, load_baseline, print_results, save_baseline
+from src.depth_frame import DepthFrame
+from src.depth_registration import SparseDepthRegistration
+from src.keyboard_manager import ANNOTATION_FILENAME, LAYOUT_CACHE_DIR, POINTS_PER_KEY, THRESHOLDS_FILENAME, KeyboardManager
+from src.press_detector import PressDetector
+from src.replay_camera_manager import ReplayCameraManager
+from src.simulated_camera_manager import SimulatedCameraManager
+from src.typist_simulator import TypistSimulator
+
+BENCHMARK_TEXT = "the quick brown fox jumps over the lazy dog"
+
+
+def synthetic_registration(width, height, depth_scale):
+    """A depth-to-color registration shaped like a D400's (15 mm baseline, same intrinsics) for synthetic frames."""
+    intrinsics = {'width': width, 'height': height, 'fx': 0.7 * width, 'fy': 0.7 * width,
+                  'ppx': width / 2.0, 'ppy': height / 2.0}
+    return SparseDepthRegistration(intrinsics, intrinsics, np.eye(3), (0.015, 0.0, 0.0), depth_scale)
+
+
+def collect_frames(camera_manager, count):
+    # Frames are copied, since a camera manager may reuse or unmap the buffers behind them
+    frames = []
+    camera_manager.start_stream()
+    while len(frames) < count and not camera_manager.finished:
+        color_image, depth_frame, _ = camera_manager.get_frames()
+        if color_image is None:
+            continue
+        frames.append((color_image.copy(), depth_frame.get_data().copy(), depth_frame.depth_scale,
+                       depth_frame.registration))
+    camera_manager.stop_stream()
+    return frames
+
+
+def build_stages(keyboard_manager, camera_factory, frames, session, with_hand_tracker=True):
+    """StageBenchmarks of every per-frame stage of main.py, fed with recorded or simulated frames."""
+    # --- Per-frame inputs ---
+    num_frames = len(frames)
+    tip_points = np.round(session.tip_points[:num_frames].reshape(num_frames, -1, 2)).astype(np.int32)
+    tip_depths = session.tip_depths[:num_frames].reshape(num_frames, -1)
+    landmarks = np.zeros((num_frames, 2, 21, 3), dtype=np.float32)
+    landmarks[..., :2] = session.landmarks[:num_frames]
+    key_ids = [keyboard_manager.keys_at(points) for points in tip_points]
+    height, width = frames[0][0].shape[:2]
+    depth_frames = []
+    for _, depth_image, depth_scale, registration in frames:
+        if registration is None:
+            registration = synthetic_registration(width, height, depth_scale)
+        depth_frames.append(DepthFrame(depth_image, depth_scale, registration=registration))
+    indices = range(num_frames)
+    stages = []
+
+    # --- Capture: frames served by the camera manager, restarted whenever it runs out ---
+    camera_manager = camera_factory()
+    camera_manager.start_stream()
+
+    def capture(_):
+        if camera_manager.finished:
+            camera_manager.start_stream()
+        camera_manager.get_frames()
+
+    stages.append(StageBenchmark('capture', capture, [None]))
+
+    # --- Align: map the ten fingertips into the unaligned depth image and sample their depths ---
+    stages.append(StageBenchmark('align', lambda i: depth_frames[i].sample_distances(tip_points[i]), indices))
+
+    # --- Hand tracking (needs MediaPipe) ---
+    if with_hand_tracker:
+        try:
+            from src.hand_tracker import HandTracker
+        except ImportError as e:
+            print(f"Warning: Skipping the hand tracking stages, MediaPipe is unavailable ({e}).")
+        else:
+            hand_tracker = HandTracker()
+            results = [hand_tracker.process_frame(frame[0]) for frame in frames]
+            stages.append(StageBenchmark('hand_tracker', lambda i: hand_tracker.process_frame(frames[i][0]), indices))
+            stages.append(StageBenchmark('extract_landmarks',
+                                         lambda i: hand_tracker.extract_landmarks(results[i], (height, width)),
+                                         indices))
+
+    # --- Hit testing: the polygon test against every key versus the precompiled label map ---
+    annotated_keys = keyboard_manager.get_annotated_keys()
+
+    def hit_test_polygons(i):
+        for x, y in tip_points[i].tolist():
+            for key_data in annotated_keys:
+                if keyboard_manager.is_point_in_keycap((x, y), key_data):
+                    break
+
+    stages.append(StageBenchmark('hit_test_polygons', hit_test_polygons, indices))
+    stages.append(StageBenchmark('hit_test_label_map', lambda i: keyboard_manager.keys_at(tip_points[i]), indices))
+
+    # --- Press decision ---
+    press_detector = PressDetector(*keyboard_manager.get_key_thresholds())
+    stages.append(StageBenchmark('press_decision', lambda i: press_detector.pressing(key_ids[i], tip_depths[i]),
+                                 indices))
+
+    # --- Drawing, onto one scratch copy of the frame ---
+    canvas = frames[0][0].copy()
+    pressed_keys = [{keyboard_manager.key_names[key_id] for key_id in ids.tolist() if key_id >= 0} for ids in key_ids]
+    keycap_overlay = viz_utils.KeycapOverlay(annotated_keys, keyboard_manager.points_per_key)
+    stages.append(StageBenchmark('draw_keycaps',
+                                 lambda i: viz_utils.draw_keycap_annotations(canvas, annotated_keys, pressed_keys[i],
+                                                                             keyboard_manager.points_per_key),
+                                 indices))
+    stages.append(StageBenchmark('draw_keycap_overlay', lambda i: keycap_overlay.draw(canvas, pressed_keys[i]),
+                                 indices))
+    stages.append(StageBenchmark('draw_hand_landmarks', lambda i: viz_utils.draw_hand_landmarks(canvas, landmarks[i]),
+                                 indices))
+    return stages
+
+
+def run_benchmark(replay_path=None, num_frames=120, rounds=7, ops_per_round=100, stage_names=None,
+                  baseline_path=None, tolerance=0.2, save_path=None, with_hand_tracker=True):
+    """
+    Benchmarks every per-frame stage of the pipeline on a recording (`replay_path`) or on simulated
+    typing, prints ns/op, frames/s and memory per stage and compares them with a saved baseline.
+    Returns the stages that regressed by more than `tolerance`.
+    """
+    cv2.setNumThreads(1)  # single-threaded OpenCV, so timings do not depend on the machine's load
+    keyboard_manager = KeyboardManager(annotation_filename=ANNOTATION_FILENAME, points_per_key=POINTS_PER_KEY,
+                                       thresholds_filename=THRESHOLDS_FILENAME, cache_dir=LAYOUT_CACHE_DIR)
+    # Landmarks always come from the simulated typist, so every stage sees the same hands on every machine
+    simulator = TypistSimulator(keyboard_manager, wpm=60)
+    session = simulator.simulate(BENCHMARK_TEXT)
+    if replay_path is not None:
+        def camera_factory():
+            return ReplayCameraManager(replay_path, realtime=False, loop=True)
+    else:
+        def camera_factory():
+            return SimulatedCameraManager(session, simulator, realtime=False)
+    frames = collect_frames(camera_factory(), min(num_frames, len(session)))
+    if not frames:
+        print("Error: No frames to benchmark with.")
+        return []
+
+    stages = build_stages(keyboard_manager, camera_factory, frames, session, with_hand_tracker)
+    if stage_names:
+        stages = [stage for stage in stages if stage.name in stage_names]
+    print(f"Benchmarking {len(stages)} stage(s) on {len(frames)} {'recorded' if replay_path else 'simulated'} "
+          f"frame(s), {rounds} round(s) of {ops_per_round} op(s)...")
+    results = {stage.name: stage.run(rounds, ops_per_round) for stage in stages}
+
+    baseline = load_baseline(baseline_path) if baseline_path else None
+    print_results(results, baseline)
+    if save_path:
+        save_baseline(save_path, results, {'replay': replay_path, 'frames': len(frames), 'rounds': rounds,
+                                           'ops_per_round': ops_per_round})
+    if baseline is None:
+        return []
+    regressions = find_regressions(results, baseline, tolerance)
+    for name, reference, current in regressions:
+        print(f"Regression: {name} takes {current:,.0f} ns/op, {current / reference - 1.0:+.1%} over the baseline "
+              f"({reference:,.0f} ns/op, tolerance {tolerance:.0%})")
+    if not regressions:
+        print(f"No stage regressed by more than {tolerance:.0%}.")
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark every stage of the keyboard pipeline")
+    parser.add_argument('--replay', metavar='DIR', default=None,
+                        help="Benchmark on a recording made with --record instead of simulated frames")
+    parser.add_argument('--frames', type=int, default=120, help="Number of distinct frames to cycle through")
+    parser.add_argument('--rounds', type=int, default=7, help="Timed rounds per stage; the median round is reported")
+    parser.add_argument('--ops', type=int, default=100, help="Operations (frames) per round")
+    parser.add_argument('--stage', action='append', default=None, metavar='NAME',
+                        help="Only benchmark this stage (may be given several times)")
+    parser.add_argument('--no-hand-tracker', action='store_true', help="Skip the MediaPipe stages")
+    parser.add_argument('--baseline', metavar='FILE', default=None,
+                        help="Compare with this baseline and exit with status 1 if a stage regressed")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="Allowed slowdown over the baseline, as a fraction (0.2 = 20%%)")
+    parser.add_argument('--save-baseline', metavar='FILE', default=None, help="Save the results as a baseline")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    regressions = run_benchmark(replay_path=args.replay, num_frames=args.frames, rounds=args.rounds,
+                                ops_per_round=args.ops, stage_names=args.stage, baseline_path=args.baseline,
+                                tolerance=args.tolerance, save_path=args.save_baseline,
+                                with_hand_tracker=not args.no_hand_tracker)
+    sys.exit(1 if regressions else 0)
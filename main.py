@@ -1,36 +1,32 @@
+import argparse
+import collections
 import cv2
-import json
+import numpy as np
 import tkinter as tk
 from tkinter import scrolledtext
 import threading
-from pynput.keyboard import Controller, Key
+import time
 
 from src.camera_manager import CameraManager
-from src.hand_tracker import HandTracker
-from src.keyboard_manager import KeyboardManager
+from src.frame_recorder import FrameRecorder
+from src.replay_camera_manager import ReplayCameraManager
+from src.simulated_camera_manager import SimulatedCameraManager
+from src.surface_model import create_keyboard_surface_estimator
+from src.typist_simulator import TypistSimulator
+from src.depth_contact_detector import DepthContactDetector
+from src.hand_tracker import HandTracker, LandmarkResults
+from src.inference_worker import InferencePool
+from src.frame_scheduler import FrameScheduler, DEGRADATION_LEVELS, NO_OVERLAY, LIGHT_MODEL, LOW_RESOLUTION
+from src.instrumentation import Profiler
+from src.metrics_server import MetricsServer, PipelineMetrics
+from src.motion_gate import MotionGate
+from src.key_injector import KeyInjector
+from src.landmark_trace import LandmarkTraceRecorder, key_events_between
+from src.press_detector import PressDetector
+from src.preview_renderer import PreviewRenderer
+from src.keyboard_manager import ANNOTATION_FILENAME, LAYOUT_CACHE_DIR, POINTS_PER_KEY, THRESHOLDS_FILENAME, KeyboardManager
 import src.visualization_utils as viz_utils
 
-# --- pynput Key Mapping ---
-# Maps string representations from your JSON to pynput's Key objects
-KEY_MAP = {
-    "BACKSPACE": Key.backspace,
-    "ENTER": Key.enter,
-    "SPACE": Key.space,
-    "SHIFT": Key.shift,
-    "CTRL": Key.ctrl,
-    "ALT": Key.alt,
-    "WIN": Key.cmd,  # 'cmd' is used for the Windows key in pynput
-    "ESC": Key.esc,
-    "DEL": Key.delete,
-    "UP": Key.up,
-    "DOWN": Key.down,
-    "LEFT": Key.left,
-    "RIGHT": Key.right,
-    "TAB": Key.tab,
-    "CAPS": Key.caps_lock,
-}
-
-
 def ui_thread():
     """Function to run the tkinter UI in a separate thread."""
     try:
@@ -53,146 +49,427 @@ def ui_thread():
         print(f"Error in UI thread: {e}")
 
 
-def run_keyboard_interface():
+def run_keyboard_interface(replay_path=None, record_path=None, realtime_replay=True, inference_workers=0,
+                           roi_margin=None, inference_size=None, model_complexity=1, track_interval=1,
+                           use_surface_model=False, press_height=0.012, display_mode='window', preview_fps=10,
+                           profile=False, trace_path=None, trace_seconds=None, metrics_port=None, motion_gate=False,
+                           depth_contacts=False, identity_interval=5, adaptive_quality=False, latency_budget=None,
+                           landmark_trace_path=None, simulate_path=None, simulate_wpm=40):
     """
     Initializes and runs the main loop for the virtual keyboard interface.
+    Frames come from the RealSense camera, or from a recording when `replay_path` is given;
+    `record_path` saves the incoming frames for later replay. With `inference_workers` > 0 hand
+    inference runs in that many worker processes, pipelined with capture. With `roi_margin` set, inference
+    only sees the keyboard's bounding box grown by that many pixels, downscaled to `inference_size`.
+    `track_interval` > 1 runs Hands only every that many frames and tracks landmarks with optical flow in between
+    (not with several inference workers, which run Hands on every frame).
+    `use_surface_model` replaces the per-key thresholds with "fingertip less than `press_height` metres
+    above the measured keyboard surface".
+    `display_mode` is 'window' (draw and show every frame), 'preview' (draw on a render thread at
+    `preview_fps`) or 'headless' (no drawing, no windows and no tkinter UI).
+    `profile` times every stage and prints latency percentiles at exit; `trace_path` also writes a
+    Chrome trace of the first `trace_seconds` (or the whole run) there. With `metrics_port` set, Prometheus
+    metrics are served at http://127.0.0.1:<metrics_port>/metrics. `motion_gate` skips hand inference
+    while the keyboard area is static and no hands were found.
+    `depth_contacts` finds pressing fingertips in the depth image against the surface model on every
+    frame and only runs hand inference every `identity_interval` frames to tell which finger is which.
+    `adaptive_quality` sheds work (overlay, model size, inference resolution, alternate frames) while
+    processing a frame takes longer than `latency_budget` seconds (default: the camera frame period);
+    frames with a fingertip near the surface are always processed.
+    `landmark_trace_path` records the landmarks, fingertip depths and key events of every processed
+    frame as a landmark trace, which trace_replay.py re-runs through the press logic. It cannot be
+    combined with `depth_contacts`, whose key events come from the depth image, not the landmarks.
+    `simulate_path` replaces the camera with rendered frames of a simulated typist typing that text
+    file at `simulate_wpm` words per minute.
     """
     # --- Configuration ---
-    ANNOTATION_FILENAME = 'assets/keyboard_annotations.json'
-    THRESHOLDS_FILENAME = 'assets/key_thresholds.json'
-    POINTS_PER_KEY = 4
-    KEY_DEPTH_THRESHOLDS = {}
-
-    def load_key_thresholds_from_file(filename: str) -> bool:
-        nonlocal KEY_DEPTH_THRESHOLDS
-        try:
-            with open(filename, 'r') as f:
-                data = json.load(f)
-                KEY_DEPTH_THRESHOLDS = {key: tuple(value) for key, value in data.items()}
-            print(f"Successfully loaded key thresholds from '{filename}'.")
-            return True
-        except Exception as e:
-            print(f"Error loading thresholds: {e}")
-            return False
-
-    def is_finger_pressing_key(key_data: dict, finger_depth: float) -> bool:
-        key_name = key_data.get("key")
-        if not key_name:
-            return False
-        threshold = KEY_DEPTH_THRESHOLDS.get(key_name)
-        if not threshold:
-            return False
-        min_depth, max_depth = threshold
-        return min_depth <= finger_depth < max_depth
+    SURFACE_MODEL_FILENAME = 'assets/surface_model.npy'
+    NUM_FINGERS_PER_HAND = 5
+    MOTION_GATE_MARGIN = 80  # pixels around the keyboard watched for motion by the motion gate
+    NEAR_SURFACE_MARGIN = 0.005  # metres above the press height that still count as "near the surface"
+    DEGRADED_INFERENCE_SIZE = 256  # inference image size at the scheduler's low-resolution level
 
     # --- Initialize ---
-    if not load_key_thresholds_from_file(THRESHOLDS_FILENAME):
+    if depth_contacts and landmark_trace_path:
+        print("Error: --record-trace cannot be combined with --depth-contacts: the key events would come from "
+              "the depth image, which a landmark trace does not hold, so trace_replay.py could not reproduce them.")
         return
+    # Depth contacts are heights above the measured surface
+    use_surface_model = use_surface_model or depth_contacts
+    keyboard_manager = KeyboardManager(annotation_filename=ANNOTATION_FILENAME, points_per_key=POINTS_PER_KEY,
+                                       thresholds_filename=THRESHOLDS_FILENAME, cache_dir=LAYOUT_CACHE_DIR)
+    if not keyboard_manager.thresholds_loaded and not use_surface_model:
+        return
+    key_min_depths, key_max_depths = keyboard_manager.get_key_thresholds()
+    press_detector = PressDetector(key_min_depths, key_max_depths, press_height, NEAR_SURFACE_MARGIN)
 
     # Start the UI in a separate thread
-    ui = threading.Thread(target=ui_thread, daemon=True)
-    ui.start()
-
-    keyboard = Controller()
-    camera_manager = CameraManager()
-    hand_tracker = HandTracker()
-    keyboard_manager = KeyboardManager(annotation_filename=ANNOTATION_FILENAME, points_per_key=POINTS_PER_KEY)
+    if display_mode != 'headless':
+        ui = threading.Thread(target=ui_thread, daemon=True)
+        ui.start()
+    # Only the 'window' mode draws on the detection thread
+    draw_inline = display_mode == 'window'
+    keycap_overlay = viz_utils.KeycapOverlay(keyboard_manager.get_annotated_keys(), POINTS_PER_KEY)
+    preview_renderer = None
+
+    # Per-stage latency histograms; a disabled profiler makes every span a no-op
+    profiler = Profiler(enabled=profile or trace_path is not None or metrics_port is not None)
+    pipeline_metrics = PipelineMetrics()
+    metrics_server = None
+
+    # Presses and releases are injected from their own thread so OS stalls never block the vision loop
+    key_injector = KeyInjector(profiler=profiler)
+    if replay_path:
+        camera_manager = ReplayCameraManager(replay_path, realtime=realtime_replay)
+    elif simulate_path:
+        with open(simulate_path, 'r') as f:
+            simulator = TypistSimulator(keyboard_manager, wpm=simulate_wpm)
+            camera_manager = SimulatedCameraManager(simulator.simulate(f.read()), simulator, realtime=realtime_replay)
+    else:
+        # Threaded capture keeps the camera draining while we process, so each iteration gets the newest frame.
+        # Only the fingertip pixels need depth, so skip full-frame alignment and register just those.
+        # Frames awaiting an inference result stay held, so size the ring for the pipeline depth.
+        held_frames = max(2, inference_workers + 1)
+        camera_manager = CameraManager(threaded=True, align_mode='sparse',
+                                       buffer_size=held_frames + 2, held_frames=held_frames, profiler=profiler)
+    frame_recorder = None
+    trace_recorder = None
+    previous_pressed_keys = set()
+    inference_pool = None
+    # Frames submitted to the inference pool, oldest first, waiting for their landmarks
+    pending_frames = collections.deque()
+    color_width, color_height = camera_manager.get_resolution()[:2]
+    roi = None
+    if roi_margin is not None:
+        roi = keyboard_manager.get_keyboard_bbox(roi_margin, (color_width, color_height))
+    tracker_kwargs = {'model_complexity': model_complexity, 'roi': roi, 'roi_target_size': inference_size,
+                      'track_interval': track_interval}
+    hand_tracker = HandTracker(**tracker_kwargs)
+    gate = None
+    if motion_gate:
+        gate = MotionGate(keyboard_manager.get_keyboard_bbox(MOTION_GATE_MARGIN, (color_width, color_height)))
+    hands_present = False
+    num_hands = 0  # hands found by the last frame that ran inference
+
+    # The frame scheduler degrades only what this configuration can change at runtime
+    scheduler = None
+    light_tracker = None
+    applied_level = 0
+    near_surface = False
+    if adaptive_quality:
+        levels = [level for level in DEGRADATION_LEVELS
+                  if not (level == NO_OVERLAY and not draw_inline)
+                  and not (level in (LIGHT_MODEL, LOW_RESOLUTION) and inference_workers)
+                  and not (level == LIGHT_MODEL and model_complexity == 0)]
+        scheduler = FrameScheduler(camera_manager.get_resolution()[4], latency_budget, levels)
+        active_tracker = hand_tracker
 
     # --- Application State ---
-    last_pressed_keys = set()
+    surface_model = None
+    surface_estimator = None
+    contact_detector = None
+    frame_index = 0
 
     try:
         if not camera_manager.start_stream():
             print("Failed to start camera stream. Exiting.")
             return
 
+        if display_mode == 'preview':
+            preview_renderer = PreviewRenderer(keyboard_manager.get_annotated_keys(), POINTS_PER_KEY, preview_fps)
+        elif display_mode == 'headless':
+            print("Running headless; press Ctrl+C to stop.")
+
+        if record_path:
+            frame_recorder = FrameRecorder(record_path, camera_manager.depth_scale, camera_manager.fps,
+                                           registration=camera_manager.registration)
+        if landmark_trace_path:
+            trace_recorder = LandmarkTraceRecorder(landmark_trace_path, (color_width, color_height),
+                                                   keyboard_manager.key_names, hand_tracker.max_num_hands)
+
+        if metrics_port is not None:
+            metrics_server = MetricsServer(pipeline_metrics, metrics_port, camera_manager=camera_manager,
+                                           profiler=profiler, key_injector=key_injector, scheduler=scheduler)
+            metrics_server.start()
+
+        if trace_path:
+            profiler.start_trace(trace_seconds)
+
         while True:
-            color_image, aligned_depth_frame, depth_frame_dims = camera_manager.get_frames()
+            with profiler.span('capture'):
+                color_image, aligned_depth_frame, depth_frame_dims = camera_manager.get_frames()
+            # At the end of a recording, keep going until the frames still in the inference pipeline are processed
+            draining = False
             if color_image is None or aligned_depth_frame is None:
-                continue
+                if not camera_manager.finished:
+                    continue
+                if not pending_frames:
+                    break
+                draining = True
+
+            if frame_recorder and not draining:
+                frame_recorder.write(color_image, aligned_depth_frame)
+
+            if use_surface_model and surface_estimator is None and not draining:
+                surface_model, surface_estimator = create_keyboard_surface_estimator(
+                    aligned_depth_frame, keyboard_manager, (color_width, color_height),
+                    camera_manager.depth_scale, SURFACE_MODEL_FILENAME)
+                if depth_contacts:
+                    contact_detector = DepthContactDetector(surface_model, roi=surface_estimator.roi,
+                                                            contact_height=press_height)
+
+            if scheduler is not None:
+                # Skip this frame if the scheduler sheds it, then apply a changed degradation level
+                if not draining and not scheduler.should_process(near_surface):
+                    continue
+                if scheduler.level != applied_level:
+                    applied_level = scheduler.level
+                    if scheduler.degraded(LIGHT_MODEL) and light_tracker is None:
+                        light_tracker = HandTracker(**{**tracker_kwargs, 'model_complexity': 0})
+                    active_tracker = light_tracker if scheduler.degraded(LIGHT_MODEL) else hand_tracker
+                    low_size = min(inference_size or DEGRADED_INFERENCE_SIZE, DEGRADED_INFERENCE_SIZE)
+                    for tracker in (hand_tracker, light_tracker):
+                        if tracker is not None:
+                            tracker.set_roi(roi, low_size if scheduler.degraded(LOW_RESOLUTION) else inference_size)
+            frame_start = time.perf_counter()
+            near_surface = False
+
+            # With depth contacts, hand inference only runs every identity_interval-th frame to name the fingers
+            identity_frame = contact_detector is None or frame_index % identity_interval == 0
+            frame_index += 1
+            # The motion gate lets a frame skip inference while the keyboard is static and empty
+            infer = not draining and identity_frame and (gate is None or gate.should_infer(color_image, hands_present))
+            inferred = infer or bool(pending_frames)
+            # Whether the landmarks came from optical-flow tracking rather than a Hands inference
+            tracked = False
+            if not inferred:
+                results = LandmarkResults.empty()
+            elif inference_workers:
+                # Pipeline: queue this frame for inference, then process the oldest frame whose
+                # result is due, so capture of frame N+1 overlaps inference of frame N.
+                # A gated frame (or the end of a recording) is not queued; it only drains one frame from the pipeline.
+                if inference_pool is None:
+                    inference_pool = InferencePool(color_image.shape, num_workers=inference_workers, **tracker_kwargs)
+                if infer:
+                    if inference_pool.submit(color_image) is not None:
+                        pending_frames.append((color_image, aligned_depth_frame))
+                    if inference_pool.in_flight() < inference_workers:
+                        continue
+                with profiler.span('inference'):
+                    results = inference_pool.get_result()
+                color_image, aligned_depth_frame = pending_frames.popleft()
+                if results is None:
+                    # Nothing came back for this frame; process it without hands
+                    results = LandmarkResults.empty()
+                    inferred = False
+                tracked = results.tracked
+            else:
+                tracker = hand_tracker if scheduler is None else active_tracker
+                with profiler.span('inference'):
+                    results = tracker.process_frame(color_image)
+                tracked = not tracker.last_frame_inferred
 
             current_pressed_keys = set()
-            results = hand_tracker.process_frame(color_image)
-
-            if results.multi_hand_landmarks:
-                for hand_landmarks in results.multi_hand_landmarks:
-                    hand_tracker.draw_landmarks(color_image, hand_landmarks)
-
-                    finger_tips = {
-                        'thumb': hand_tracker.get_thumb_finger_tip(hand_landmarks, color_image.shape),
-                        'index': hand_tracker.get_index_finger_tip(hand_landmarks, color_image.shape),
-                        'middle': hand_tracker.get_middle_finger_tip(hand_landmarks, color_image.shape),
-                        'ring': hand_tracker.get_ring_finger_tip(hand_landmarks, color_image.shape),
-                        'pinky': hand_tracker.get_pinky_finger_tip(hand_landmarks, color_image.shape),
-                    }
-
-                    for finger_name, (tip_coords, _) in finger_tips.items():
-                        if not tip_coords: continue
-                        px, py = tip_coords
-                        depth_frame_width, depth_frame_height = depth_frame_dims
-                        clamped_px = max(0, min(px, depth_frame_width - 1))
-                        clamped_py = max(0, min(py, depth_frame_height - 1))
-                        depth_m = aligned_depth_frame.get_distance(clamped_px, clamped_py)
-
+            tip_points = tip_depths = tip_heights = None
+
+            landmarks, handedness = hand_tracker.extract_landmarks(results, color_image.shape)
+            if inferred:
+                num_hands = len(landmarks)
+                hands_present = num_hands > 0
+
+            if len(landmarks):
+                if draw_inline:
+                    for hand_landmarks in results.multi_hand_landmarks:
+                        hand_tracker.draw_landmarks(color_image, hand_landmarks)
+
+                # All fingertips of all hands as one (N, 2) pixel array, and one batched,
+                # hole-robust depth lookup for them (clamped to the frame)
+                tip_points = hand_tracker.get_finger_tips(landmarks)[..., :2].reshape(-1, 2).astype(np.int32)
+                with profiler.span('depth'):
+                    tip_depths = aligned_depth_frame.sample_distances(tip_points)
+                # Key under every fingertip in one label-map lookup (-1 = no key)
+                with profiler.span('hit_test'):
+                    tip_keys = keyboard_manager.keys_at(tip_points)
+
+                if draw_inline:
+                    for (px, py), depth_m in zip(tip_points.tolist(), tip_depths.tolist()):
                         viz_utils.draw_finger_tip_info(color_image, px, py, depth_m)
 
-                        finger_point = (px, py)
-                        for key_data in keyboard_manager.get_annotated_keys():
-                            if keyboard_manager.is_point_in_keycap(finger_point, key_data):
-                                if is_finger_pressing_key(key_data, depth_m):
-                                    current_pressed_keys.add(key_data['key'])
-                                    break  # Assume one finger can only press one key
-
-            # --- Simulate Key Presses using pynput ---
-            newly_pressed = current_pressed_keys - last_pressed_keys
-            newly_released = last_pressed_keys - current_pressed_keys
-
-            for key_str in newly_pressed:
-                try:
-                    if key_str in KEY_MAP:
-                        keyboard.press(KEY_MAP[key_str])
-                    elif len(key_str) == 1:  # Handle standard characters
-                        keyboard.press(key_str.lower())
-                except Exception as e:
-                    print(f"Could not press key '{key_str}': {e}")
-
-            for key_str in newly_released:
-                try:
-                    if key_str in KEY_MAP:
-                        keyboard.release(KEY_MAP[key_str])
-                    elif len(key_str) == 1:
-                        keyboard.release(key_str.lower())
-                except Exception as e:
-                    print(f"Could not release key '{key_str}': {e}")
-
-            last_pressed_keys = current_pressed_keys
+                if contact_detector is not None:
+                    # Finger ID = handedness * 5 + finger, used to name the depth contacts until the next inference
+                    finger_ids = (handedness[:, None] * NUM_FINGERS_PER_HAND + np.arange(NUM_FINGERS_PER_HAND)).ravel()
+                    contact_detector.set_finger_tips(tip_points, finger_ids)
+                else:
+                    # Each finger can only press the one key it is over
+                    with profiler.span('press'):
+                        if surface_model is not None:
+                            # Heights stay NaN, which never presses, until the surface is measured
+                            if surface_model.ready:
+                                tip_depth_pixels = aligned_depth_frame.to_depth_pixels(tip_points)
+                                tip_heights = surface_model.height_above(tip_depth_pixels, tip_depths)
+                            else:
+                                tip_heights = np.full(len(tip_depths), np.nan, dtype=np.float32)
+                        pressing = press_detector.pressing(tip_keys, tip_depths, tip_heights)
+                        near_surface = bool(press_detector.near_surface(tip_keys, tip_depths, tip_heights).any())
+                        current_pressed_keys = {keyboard_manager.key_names[key_id]
+                                                for key_id in tip_keys[pressing].tolist()}
+            elif surface_estimator is not None and inferred:
+                # Empty scene: feed the background surface re-estimation
+                surface_estimator.offer(aligned_depth_frame.get_data())
+
+            if contact_detector is not None:
+                # Fingertips touching the surface, found in the depth image on every frame
+                with profiler.span('depth_contacts'):
+                    contact_points, _, contact_fingers = contact_detector.detect(aligned_depth_frame)
+                with profiler.span('hit_test'):
+                    contact_keys = keyboard_manager.keys_at(contact_points)
+                current_pressed_keys = {keyboard_manager.key_names[key_id]
+                                        for key_id in contact_keys[contact_keys >= 0].tolist()}
+                near_surface = bool((contact_detector.tip_heights < press_height + NEAR_SURFACE_MARGIN).any())
+                if draw_inline:
+                    viz_utils.draw_contact_points(color_image, contact_points, contact_fingers)
+
+            # --- Simulate Key Presses using pynput (on the injector thread) ---
+            keys_pressed = key_injector.update(current_pressed_keys)
+            if trace_recorder:
+                trace_recorder.write(aligned_depth_frame.get_timestamp(), landmarks, handedness, tip_depths,
+                                     tip_heights, key_events_between(previous_pressed_keys, current_pressed_keys),
+                                     inferred, tracked)
+            previous_pressed_keys = current_pressed_keys
+            pipeline_metrics.record_frame(num_hands, keys_pressed, camera_manager.frames_captured)
+            if camera_manager.system_clock_timestamps:
+                profiler.record_end_to_end(aligned_depth_frame.get_timestamp())
 
             # --- Visualization ---
-            viz_utils.draw_keycap_annotations(color_image, keyboard_manager.get_annotated_keys(), current_pressed_keys,
-                                              POINTS_PER_KEY)
-            cv2.imshow('Virtual Keyboard Interface', color_image)
-
-            if cv2.waitKey(1) & 0xFF == ord('q'):
-                break
-
+            if draw_inline:
+                with profiler.span('draw'):
+                    if scheduler is None or not scheduler.degraded(NO_OVERLAY):
+                        keycap_overlay.draw(color_image, current_pressed_keys)
+                    cv2.imshow('Virtual Keyboard Interface', color_image)
+                    key_pressed = cv2.waitKey(1) & 0xFF
+
+                if key_pressed == ord('q'):
+                    break
+            elif preview_renderer:
+                with profiler.span('draw'):
+                    preview_renderer.submit(color_image, landmarks, tip_points, tip_depths, current_pressed_keys)
+                if preview_renderer.quit_requested:
+                    break
+
+            if scheduler is not None:
+                scheduler.frame_done(time.perf_counter() - frame_start)
+
+    except KeyboardInterrupt:
+        print("Interrupted.")
     finally:
         # --- Clean Up ---
         print("Application stopping...")
+        if metrics_server:
+            metrics_server.close()
         # Release all pressed keys
-        for key_str in last_pressed_keys:
-            try:
-                if key_str in KEY_MAP:
-                    keyboard.release(KEY_MAP[key_str])
-                elif len(key_str) == 1:
-                    keyboard.release(key_str.lower())
-            except Exception as e:
-                print(f"Could not release key '{key_str}' during cleanup: {e}")
-
+        key_injector.close()
+        stats = key_injector.get_stats()
+        print(f"Key injection: {stats['events_injected']} event(s), mean latency {stats['mean_latency_ms']:.2f} ms, "
+              f"max latency {stats['max_latency_ms']:.2f} ms, max queue depth {stats['max_queue_depth']}")
+
+        if preview_renderer:
+            preview_renderer.close()
+        if frame_recorder:
+            frame_recorder.close()
+        if trace_recorder:
+            trace_recorder.close()
+        # Inferred and tracked frames, from the workers or from the inline tracker(s)
+        tracking_stats = [tracker.get_stats() for tracker in (inference_pool, hand_tracker, light_tracker)
+                          if tracker is not None]
+        print(f"Hand tracker: {sum(stats['inferred_frames'] for stats in tracking_stats)} frame(s) inferred, "
+              f"{sum(stats['tracked_frames'] for stats in tracking_stats)} tracked with optical flow")
+        if inference_pool:
+            inference_pool.close()
+        if scheduler is not None:
+            stats = scheduler.get_stats()
+            print(f"Frame scheduler: level {stats['level']} ({stats['level_name']}) at exit, "
+                  f"{stats['level_changes']} level change(s), {stats['skipped_frames']} frame(s) skipped")
+        if light_tracker is not None:
+            light_tracker.close()
+        if gate is not None:
+            print(f"Motion gate: {gate.gated_frames} frame(s) skipped, {gate.inferred_frames} inferred")
         camera_manager.stop_stream()
         hand_tracker.close()
-        cv2.destroyAllWindows()
+        if draw_inline:
+            cv2.destroyAllWindows()
+        if trace_path:
+            profiler.save_chrome_trace(trace_path)
+        if profile or trace_path:
+            profiler.print_summary()
         print("Application stopped.")
 
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Camera-based virtual keyboard")
+    parser.add_argument('--record', metavar='DIR', help="Record the camera frames to DIR while running")
+    parser.add_argument('--replay', metavar='DIR', help="Replay a recording from DIR instead of using the camera")
+    parser.add_argument('--simulate', metavar='FILE', default=None,
+                        help="Render a simulated typist typing the text in FILE instead of using the camera")
+    parser.add_argument('--simulate-wpm', type=float, default=40, metavar='WPM',
+                        help="Typing speed of the simulated typist, in words per minute")
+    parser.add_argument('--fast-replay', action='store_true',
+                        help="Replay (or simulate) frames as fast as they can be processed instead of in real time")
+    parser.add_argument('--inference-workers', type=int, default=0, metavar='N',
+                        help="Run hand inference in N worker processes pipelined with capture (0 = inline)")
+    parser.add_argument('--roi-margin', type=int, default=None, metavar='PX',
+                        help="Only run hand inference on the keyboard area grown by PX pixels")
+    parser.add_argument('--inference-size', type=int, default=None, metavar='PX',
+                        help="Downscale the inference image so its longer side is at most PX pixels")
+    parser.add_argument('--model-complexity', type=int, choices=(0, 1), default=1,
+                        help="MediaPipe Hands model: 0 is lighter and faster, 1 is more accurate")
+    parser.add_argument('--track-interval', type=int, default=1, metavar='N',
+                        help="Run Hands every N frames and track landmarks with optical flow in between "
+                             "(ignored with more than one inference worker)")
+    parser.add_argument('--surface-model', action='store_true',
+                        help="Detect presses by fingertip height above a measured keyboard surface")
+    parser.add_argument('--press-height', type=float, default=0.012, metavar='M',
+                        help="Fingertip height above the surface, in metres, below which a key is pressed")
+    display = parser.add_mutually_exclusive_group()
+    display.add_argument('--headless', action='store_true',
+                         help="Skip all drawing, the preview window and the text UI")
+    display.add_argument('--preview-fps', type=float, default=None, metavar='FPS',
+                         help="Draw the preview on a separate thread at FPS frames per second instead of every frame")
+    parser.add_argument('--profile', action='store_true',
+                        help="Time every pipeline stage and print p50/p95/p99 latencies at exit")
+    parser.add_argument('--trace', metavar='FILE', default=None,
+                        help="Write a Chrome trace_event JSON of the pipeline stages to FILE (implies --profile)")
+    parser.add_argument('--trace-seconds', type=float, default=None, metavar='S',
+                        help="Only trace the first S seconds of the run")
+    parser.add_argument('--motion-gate', action='store_true',
+                        help="Skip hand inference while the keyboard area is static and no hands are present")
+    parser.add_argument('--depth-contacts', action='store_true',
+                        help="Detect touching fingertips in the depth image every frame (implies --surface-model)")
+    parser.add_argument('--identity-interval', type=int, default=5, metavar='N',
+                        help="With --depth-contacts, run hand inference every N frames to identify the fingers")
+    parser.add_argument('--record-trace', metavar='DIR', default=None,
+                        help="Record the landmarks, fingertip depths and key events to DIR for trace_replay.py "
+                             "(not with --depth-contacts)")
+    parser.add_argument('--adaptive-quality', action='store_true',
+                        help="Shed work (overlay, model size, resolution, alternate frames) when processing falls behind")
+    parser.add_argument('--latency-budget', type=float, default=None, metavar='MS',
+                        help="Per-frame processing budget for --adaptive-quality (default: the camera frame period)")
+    parser.add_argument('--metrics-port', type=int, default=None, metavar='PORT',
+                        help="Serve Prometheus metrics at http://127.0.0.1:PORT/metrics")
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
-    run_keyboard_interface()
+    args = parse_args()
+    run_keyboard_interface(replay_path=args.replay, record_path=args.record, realtime_replay=not args.fast_replay,
+                           inference_workers=args.inference_workers, roi_margin=args.roi_margin,
+                           inference_size=args.inference_size, model_complexity=args.model_complexity,
+                           track_interval=args.track_interval, use_surface_model=args.surface_model,
+                           press_height=args.press_height,
+                           display_mode='headless' if args.headless else 'preview' if args.preview_fps else 'window',
+                           preview_fps=args.preview_fps, profile=args.profile, trace_path=args.trace,
+                           trace_seconds=args.trace_seconds, metrics_port=args.metrics_port,
+                           motion_gate=args.motion_gate, depth_contacts=args.depth_contacts,
+                           identity_interval=args.identity_interval, adaptive_quality=args.adaptive_quality,
+                           latency_budget=args.latency_budget / 1000.0 if args.latency_budget else None,
+                           landmark_trace_path=args.record_trace, simulate_path=args.simulate,
+                           simulate_wpm=args.simulate_wpm)
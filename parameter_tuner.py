@@ -0,0 +1,75 @@
+import argparse
+import time
+
+from src.keyboard_manager import ANNOTATION_FILENAME, LAYOUT_CACHE_DIR, POINTS_PER_KEY, THRESHOLDS_FILENAME, save_thresholds
+from src.parameter_tuner import ParameterTuner
+
+
+def run_parameter_tuner(trace_paths, logic='press', use_surface_model=False, output_filename=None, workers=None,
+                        eta=3, rungs=3, false_press_weight=1.0, latency_weight=1.0, top=5):
+    """
+    Searches the detection parameters of main.py (`logic='press'`) or tapboard_main.py (`logic='tap'`)
+    on labelled landmark traces. For the press logic the depth bands of the best configuration are
+    written as a new thresholds file in the format of assets/key_thresholds.json; for the tap logic
+    the constants to put in create_tap_detector() are printed.
+    """
+    keyboard_kwargs = {
+        'annotation_filename': ANNOTATION_FILENAME,
+        'points_per_key': POINTS_PER_KEY,
+        'thresholds_filename': THRESHOLDS_FILENAME,
+        'cache_dir': LAYOUT_CACHE_DIR,
+    }
+
+    tuner = ParameterTuner(trace_paths, keyboard_kwargs, logic, use_surface_model, workers, eta, rungs,
+                           false_press_weight, latency_weight)
+    start = time.perf_counter()
+    ranked = tuner.search()
+    print(f"Searched in {time.perf_counter() - start:.1f} s with {tuner.workers} worker(s)")
+
+    print(f"{'cost':>8}{'errors':>9}{'false':>9}{'found':>9}{'latency':>10}  parameters")
+    for params, stats in ranked[:top]:
+        print(f"{stats['cost']:>8.4f}{stats['key_error_rate']:>9.3f}{stats['false_press_rate']:>9.3f}"
+              f"{stats['detection_rate']:>9.3f}{stats['latency_ms']:>8.1f}ms  {params}")
+
+    best_params, _ = ranked[0]
+    if logic == 'tap':
+        # create_tap_detector() has its own constants and never reads a thresholds file
+        band_name = 'height' if use_surface_model else 'depth'
+        print(f"Tap constants for create_tap_detector(): TAP_VELOCITY_THRESHOLD = {best_params['tap_velocity']}, "
+              f"{band_name} band [{best_params['band_min']}, {best_params['band_max']}), interaction {band_name}s "
+              f"[{best_params['band_min'] - best_params['range_margin']:.4f}, "
+              f"{best_params['band_max'] + best_params['hover_margin']:.4f}]")
+    elif 'press_height' in best_params:
+        print(f"Best press height above the surface: {best_params['press_height']} m (no thresholds file to write)")
+    elif output_filename:
+        thresholds = tuner.thresholds(best_params)
+        save_thresholds(output_filename, thresholds)
+        print(f"Saved thresholds for {len(thresholds)} key(s) to '{output_filename}'")
+    return ranked
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Tune the detection parameters on labelled landmark traces")
+    parser.add_argument('traces', metavar='DIR', nargs='+',
+                        help="Landmark traces from --record-trace or typist_simulator.py --trace")
+    parser.add_argument('--logic', choices=('press', 'tap'), default='press',
+                        help="Press logic of main.py or tap logic of tapboard_main.py")
+    parser.add_argument('--surface-model', action='store_true',
+                        help="Tune on the heights above the keyboard surface instead of the depth thresholds")
+    parser.add_argument('--output', metavar='FILE', default='assets/key_thresholds_tuned.json',
+                        help="Thresholds file to write the best depth bands of the press logic to")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: one per CPU)")
+    parser.add_argument('--eta', type=int, default=3, help="Successive halving keeps the best 1/eta per rung")
+    parser.add_argument('--rungs', type=int, default=3, help="Successive halving rungs")
+    parser.add_argument('--false-press-weight', type=float, default=1.0,
+                        help="Cost of a false press relative to one key error")
+    parser.add_argument('--latency-weight', type=float, default=1.0,
+                        help="Cost of one second of mean detection latency relative to a key error rate of 1")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    run_parameter_tuner(args.traces, logic=args.logic, use_surface_model=args.surface_model,
+                        output_filename=args.output, workers=args.workers, eta=args.eta, rungs=args.rungs,
+                        false_press_weight=args.false_press_weight, latency_weight=args.latency_weight)
@@ -0,0 +1,124 @@
+import json
+import os
+import platform
+import time
+import tracemalloc
+import numpy as np
+
+BASELINE_VERSION = 1
+
+
+class StageBenchmark:
+    """
+    Times one pipeline stage over a list of per-frame inputs.
+
+    `function(item)` processes one frame's worth of input; the inputs are cycled through in `rounds`
+    rounds of `ops_per_round` calls each, after `warmup` untimed calls. The reported ns/op is the
+    median round, which is robust to the odd slow round on a busy machine. Memory is measured in one
+    separate pass under tracemalloc (which NumPy reports its buffers to), since tracing slows every
+    allocation down: `peak_bytes` is the most memory a single op had allocated at once, and
+    `retained_blocks` the memory blocks per op still allocated after the pass (caches or leaks).
+    """
+
+    def __init__(self, name, function, inputs):
+        self.name = name
+        self.function = function
+        self.inputs = list(inputs)
+
+    def run(self, rounds=7, ops_per_round=100, warmup=10):
+        function = self.function
+        inputs = self.inputs
+        count = len(inputs)
+        for i in range(warmup):
+            function(inputs[i % count])
+
+        round_times = []
+        for _ in range(rounds):
+            start = time.perf_counter_ns()
+            for i in range(ops_per_round):
+                function(inputs[i % count])
+            round_times.append((time.perf_counter_ns() - start) / ops_per_round)
+        ns_per_op = float(np.median(round_times))
+
+        peak_bytes, retained_blocks = self._measure_memory(ops_per_round)
+        return {
+            'ns_per_op': ns_per_op,
+            'min_ns_per_op': float(min(round_times)),
+            'frames_per_second': 1e9 / ns_per_op if ns_per_op > 0 else float('inf'),
+            'peak_bytes': peak_bytes,
+            'retained_blocks': retained_blocks,
+        }
+
+    def _measure_memory(self, ops):
+        function = self.function
+        inputs = self.inputs
+        peak_bytes = 0
+        tracemalloc.start()
+        try:
+            before = tracemalloc.take_snapshot()
+            for i in range(ops):
+                tracemalloc.reset_peak()
+                start_bytes = tracemalloc.get_traced_memory()[0]
+                function(inputs[i % len(inputs)])
+                peak_bytes = max(peak_bytes, tracemalloc.get_traced_memory()[1] - start_bytes)
+            after = tracemalloc.take_snapshot()
+        finally:
+            tracemalloc.stop()
+        retained_blocks = sum(stat.count_diff for stat in after.compare_to(before, 'filename'))
+        return peak_bytes, max(0, retained_blocks) / ops
+
+
+def environment():
+    """The machine a set of results was measured on, saved with baselines so comparisons can be judged."""
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def save_baseline(filename, results, config=None):
+    directory = os.path.dirname(filename)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(filename, 'w') as f:
+        json.dump({'version': BASELINE_VERSION, 'environment': environment(), 'config': config or {},
+                   'stages': results}, f, indent=4)
+    print(f"Saved the baseline of {len(results)} stage(s) to '{filename}'")
+
+
+def load_baseline(filename):
+    with open(filename) as f:
+        baseline = json.load(f)
+    if baseline.get('version') != BASELINE_VERSION:
+        print(f"Warning: Baseline '{filename}' has version {baseline.get('version')}, expected {BASELINE_VERSION}.")
+    if baseline.get('environment') != environment():
+        print(f"Warning: Baseline '{filename}' was measured on a different environment; timings may not be comparable.")
+    return baseline
+
+
+def find_regressions(results, baseline, tolerance=0.2):
+    """
+    (stage, baseline ns/op, current ns/op) for every stage in both `results` and the `baseline` whose
+    time per op grew by more than `tolerance` (a fraction, 0.2 = 20%).
+    """
+    regressions = []
+    for name, stats in results.items():
+        reference = baseline['stages'].get(name)
+        if reference is not None and stats['ns_per_op'] > reference['ns_per_op'] * (1.0 + tolerance):
+            regressions.append((name, reference['ns_per_op'], stats['ns_per_op']))
+    return regressions
+
+
+def print_results(results, baseline=None):
+    header = f"{'stage':<24}{'ns/op':>14}{'frames/s':>12}{'peak KiB':>10}{'kept/op':>9}"
+    print(header + ("  vs baseline" if baseline else ""))
+    for name, stats in results.items():
+        line = (f"{name:<24}{stats['ns_per_op']:>14,.0f}{stats['frames_per_second']:>12,.0f}"
+                f"{stats['peak_bytes'] / 1024.0:>10.1f}{stats['retained_blocks']:>9.1f}")
+        reference = baseline['stages'].get(name) if baseline else None
+        if reference is not None:
+            line += f"  {stats['ns_per_op'] / reference['ns_per_op'] - 1.0:+8.1%}"
+        print(line)
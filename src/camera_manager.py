@@ -1,8 +1,18 @@
+import collections
+import threading
 import pyrealsense2 as rs
 import numpy as np
 
+from src.depth_frame import DepthFrame
+from src.depth_registration import SparseDepthRegistration
+from src.instrumentation import Profiler
+
 class CameraManager:
-    def __init__(self, color_width=1280, color_height=720, depth_width=1280, depth_height=720, fps=30):
+    # How long wait_for_frames() blocks for a frameset before raising (librealsense's default)
+    FRAME_TIMEOUT_MS = 5000
+
+    def __init__(self, color_width=1280, color_height=720, depth_width=1280, depth_height=720, fps=30,
+                 threaded=False, buffer_size=4, held_frames=2, align_mode='full', profiler=None):
         self.pipeline = rs.pipeline()
         self.config = rs.config()
         self.color_width = color_width
@@ -11,9 +21,51 @@ class CameraManager:
         self.depth_height = depth_height
         self.fps = fps
         self.depth_scale = 0.0
-        self.align = rs.align(rs.stream.color)
 
+        # --- Depth-to-color alignment ---
+        # 'full' aligns the whole depth frame to the color viewpoint with rs.align on every frame.
+        # 'sparse' leaves depth unaligned and only maps the color pixels that are actually queried
+        # (see SparseDepthRegistration); depth is then returned as a DepthFrame taking color coordinates.
+        if align_mode not in ('full', 'sparse'):
+            raise ValueError(f"align_mode must be 'full' or 'sparse', got '{align_mode}'")
+        self.align_mode = align_mode
+        self.align = rs.align(rs.stream.color) if align_mode == 'full' else None
+        self.registration = None
+
+        # --- Threaded capture ---
+        # A producer thread fills a fixed ring of preallocated color/depth slots. The newest unread
+        # slot is handed out by get_frames(); an older unread frame is dropped when a newer one lands.
+        # The last `held_frames` slots handed to the consumer are never overwritten, so the main loop
+        # may keep working on the previous frame while it fetches the next one.
+        if threaded and buffer_size < held_frames + 2:
+            raise ValueError(f"buffer_size must be at least held_frames + 2 ({held_frames + 2}), got {buffer_size}")
+        self.threaded = threaded
+        self.buffer_size = buffer_size
+        self.held_frames = held_frames
+        self._capture_thread = None
+        self._running = False
+        self._frame_ready = threading.Condition()
+        self._color_ring = None
+        self._depth_ring = None
+        self._timestamp_ring = np.zeros(buffer_size, dtype=np.float64)
+        self._frame_number_ring = np.zeros(buffer_size, dtype=np.int64)
+        self._write_slot = -1
+        self._latest_slot = -1
+        self._latest_sequence = 0
+        self._delivered_sequence = 0
+        self._held_slots = collections.deque(maxlen=held_frames)
 
+        # --- Capture statistics ---
+        self.frames_captured = 0
+        self.frames_dropped = 0
+        self.frames_delivered = 0
+        self.last_frame_timestamp = 0.0
+        # True once frames are known to carry RealSense global-time (system clock) timestamps,
+        # which is what end-to-end latency is measured against
+        self.system_clock_timestamps = False
+        self.profiler = profiler if profiler is not None else Profiler()
+        # A live camera never runs out of frames; replay sources set this when the recording ends.
+        self.finished = False
 
         self._configure_streams()
 
@@ -36,17 +88,46 @@ class CameraManager:
     def get_resolution(self):
         return self.color_width, self.color_height, self.depth_width, self.depth_height, self.fps
 
+    def get_capture_stats(self):
+        """Returns frame counters; in threaded mode `frames_dropped` counts frames replaced before being read."""
+        return {
+            'frames_captured': self.frames_captured,
+            'frames_dropped': self.frames_dropped,
+            'frames_delivered': self.frames_delivered,
+        }
+
+    def get_depth_image(self, depth_frame):
+        """Zero-copy uint16 view of a frame's raw depth; multiply by `depth_scale` for metres."""
+        return np.asanyarray(depth_frame.get_data())
+
     def start_stream(self):
         print("Starting RealSense camera stream...")
         profile = self.pipeline.start(self.config)
         self.depth_scale = profile.get_device().first_depth_sensor().get_depth_scale()
+        if self.align_mode == 'sparse':
+            self.registration = SparseDepthRegistration.from_realsense_profile(profile, self.depth_scale)
+        if self.threaded:
+            self._running = True
+            self._capture_thread = threading.Thread(target=self._capture_loop, daemon=True)
+            self._capture_thread.start()
         return True
 
+    def _wait_for_frames(self):
+        frames = self.pipeline.wait_for_frames(self.FRAME_TIMEOUT_MS)
+        if self.align is not None:
+            with self.profiler.span('align'):
+                frames = self.align.process(frames)
+        depth_frame = frames.get_depth_frame()
+        if self.frames_captured == 0 and depth_frame:
+            self.system_clock_timestamps = (
+                depth_frame.get_frame_timestamp_domain() == rs.timestamp_domain.global_time)
+        return depth_frame, frames.get_color_frame()
+
     def get_frames(self):
-        frames = self.pipeline.wait_for_frames()
-        aligned_frames = self.align.process(frames)
-        aligned_depth_frame = aligned_frames.get_depth_frame()
-        color_frame = aligned_frames.get_color_frame()
+        if self.threaded:
+            return self._get_buffered_frames()
+
+        aligned_depth_frame, color_frame = self._wait_for_frames()
 
         if not aligned_depth_frame or not color_frame:
             return None, None, None
@@ -56,8 +137,93 @@ class CameraManager:
         # It's set to False by MediaPipe internally, so we set it back to True here.
         color_image.flags.writeable = True
 
-        return color_image, aligned_depth_frame, (aligned_depth_frame.get_width(), aligned_depth_frame.get_height())
+        self.frames_captured += 1
+        self.frames_delivered += 1
+        self.last_frame_timestamp = aligned_depth_frame.get_timestamp()
+
+        # Zero-copy uint16 view of the rs frame's buffer; the DepthFrame keeps the rs frame alive
+        depth_frame = DepthFrame(np.asanyarray(aligned_depth_frame.get_data()), self.depth_scale,
+                                 self.last_frame_timestamp, aligned_depth_frame.get_frame_number(),
+                                 self.registration, source_frame=aligned_depth_frame)
+
+        return color_image, depth_frame, (depth_frame.get_width(), depth_frame.get_height())
+
+    # --- Threaded capture ---
+    def _allocate_ring(self, color_shape, depth_shape):
+        self._color_ring = np.zeros((self.buffer_size,) + color_shape, dtype=np.uint8)
+        self._depth_ring = np.zeros((self.buffer_size,) + depth_shape, dtype=np.uint16)
+
+    def _next_free_slot(self):
+        # Round-robin over the ring, skipping the unread latest slot and any slot the consumer still holds.
+        # Must be called with self._frame_ready held.
+        slot = self._write_slot
+        for _ in range(self.buffer_size):
+            slot = (slot + 1) % self.buffer_size
+            if slot != self._latest_slot and slot not in self._held_slots:
+                break
+        self._write_slot = slot
+        return slot
+
+    def _capture_loop(self):
+        while self._running:
+            try:
+                aligned_depth_frame, color_frame = self._wait_for_frames()
+            except RuntimeError as e:
+                if self._running:
+                    print(f"Warning: Capture thread could not get frames: {e}")
+                continue
+
+            if not aligned_depth_frame or not color_frame:
+                continue
+
+            color_image = np.asanyarray(color_frame.get_data())
+            depth_image = np.asanyarray(aligned_depth_frame.get_data())
+            if self._color_ring is None:
+                self._allocate_ring(color_image.shape, depth_image.shape)
+
+            with self._frame_ready:
+                slot = self._next_free_slot()
+
+            # The slot is neither readable nor held by the consumer, so it can be filled without the lock.
+            np.copyto(self._color_ring[slot], color_image)
+            np.copyto(self._depth_ring[slot], depth_image)
+            self._timestamp_ring[slot] = aligned_depth_frame.get_timestamp()
+            self._frame_number_ring[slot] = aligned_depth_frame.get_frame_number()
+
+            with self._frame_ready:
+                if self._latest_sequence > self._delivered_sequence:
+                    self.frames_dropped += 1
+                self._latest_slot = slot
+                self._latest_sequence += 1
+                self.frames_captured += 1
+                self._frame_ready.notify_all()
+
+    def _get_buffered_frames(self, timeout=1.0):
+        with self._frame_ready:
+            has_new_frame = self._frame_ready.wait_for(
+                lambda: self._latest_sequence > self._delivered_sequence or not self._running, timeout)
+            if not has_new_frame or not self._running:
+                return None, None, None
+            slot = self._latest_slot
+            self._delivered_sequence = self._latest_sequence
+            self._held_slots.append(slot)
+            self.frames_delivered += 1
+
+        self.last_frame_timestamp = float(self._timestamp_ring[slot])
+        color_image = self._color_ring[slot]
+        depth_frame = DepthFrame(self._depth_ring[slot], self.depth_scale,
+                                 self.last_frame_timestamp, int(self._frame_number_ring[slot]), self.registration)
+        return color_image, depth_frame, (depth_frame.get_width(), depth_frame.get_height())
 
     def stop_stream(self):
         print("Stopping RealSense camera stream.")
-        self.pipeline.stop()
\ No newline at end of file
+        if self._capture_thread is not None:
+            with self._frame_ready:
+                self._running = False
+                self._frame_ready.notify_all()
+            # The thread may be blocked in wait_for_frames(); it must be out of it before the pipeline stops
+            self._capture_thread.join(timeout=self.FRAME_TIMEOUT_MS / 1000.0 + 1.0)
+            if self._capture_thread.is_alive():
+                print("Warning: Capture thread did not stop in time.")
+            self._capture_thread = None
+        self.pipeline.stop()
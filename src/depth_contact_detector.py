@@ -0,0 +1,137 @@
+import cv2
+import numpy as np
+
+_OPEN_KERNEL = np.ones((3, 3), dtype=np.uint8)
+
+
+class DepthContactDetector:
+    """
+    Finds fingertips touching the keyboard from the depth image alone, without running MediaPipe.
+
+    Inside `roi` (x0, y0, x1, y1, depth-image pixels) every pixel between `min_height` and
+    `max_height` metres above the SurfaceModel is foreground. Each foreground blob large enough to be a
+    hand is reduced to its fingertip candidates: the contour points farthest from where the blob enters
+    the region (the wrist side), taken as local maxima of that distance along the contour that rise
+    clearly above the gaps between fingers, at least `tip_separation` pixels apart. A fingertip's height
+    is the median height of the foreground pixels around it, and a tip lower than `contact_height` is
+    a contact.
+
+    `detect()` returns the contacts as (N, 2) color pixel coordinates, the same points
+    `KeyboardManager.keys_at` takes for landmark fingertips, so it runs at full camera rate.
+    MediaPipe is only needed now and then to say which finger each contact is: `set_finger_tips()`
+    stores the latest landmark fingertips with their finger IDs, and contacts take the ID of the
+    nearest one within `identity_radius` color pixels (-1 otherwise).
+    """
+
+    def __init__(self, surface_model, roi=None, min_height=0.004, max_height=0.10, contact_height=0.012,
+                 min_blob_area=150, tip_separation=12, tip_patch_radius=3, identity_radius=60):
+        self.surface_model = surface_model
+        self.roi = roi
+        self.min_height = min_height
+        self.max_height = max_height
+        self.contact_height = contact_height
+        self.min_blob_area = min_blob_area
+        self.tip_separation = tip_separation
+        self.tip_patch_radius = tip_patch_radius
+        self.identity_radius = identity_radius
+        self._finger_tip_points = np.zeros((0, 2), dtype=np.float32)
+        self._finger_tip_ids = np.zeros(0, dtype=np.intp)
+
+        # Outputs of the last detect(), for drawing
+        self.tip_points = np.zeros((0, 2), dtype=np.intp)  # every fingertip candidate, depth pixels
+        self.tip_heights = np.zeros(0, dtype=np.float32)
+
+    def set_finger_tips(self, tip_points, finger_ids):
+        """Latest MediaPipe fingertips, (N, 2) color pixels, with their finger IDs."""
+        self._finger_tip_points = np.asarray(tip_points, dtype=np.float32).reshape(-1, 2)
+        self._finger_tip_ids = np.asarray(finger_ids, dtype=np.intp).reshape(-1)
+
+    def _foreground(self, depth_image, depth_scale):
+        height, width = depth_image.shape[:2]
+        x0, y0, x1, y1 = self.roi if self.roi is not None else (0, 0, width, height)
+        x0, y0, x1, y1 = max(0, x0), max(0, y0), min(width, x1), min(height, y1)
+        depths = depth_image[y0:y1, x0:x1].astype(np.float32) * depth_scale
+        heights = self.surface_model.surface[y0:y1, x0:x1] - depths
+        mask = ((depths > 0) & (heights > self.min_height) & (heights < self.max_height)).astype(np.uint8)
+        return cv2.morphologyEx(mask, cv2.MORPH_OPEN, _OPEN_KERNEL), heights, depths, (x0, y0)
+
+    def _blob_tips(self, contour, mask_shape):
+        # Where the blob crosses the region border is the arm; with no crossing use the blob centre
+        points = contour[:, 0, :]
+        height, width = mask_shape
+        on_border = ((points[:, 0] <= 0) | (points[:, 1] <= 0) |
+                     (points[:, 0] >= width - 1) | (points[:, 1] >= height - 1))
+        anchor = points[on_border].mean(axis=0) if on_border.any() else points.mean(axis=0)
+
+        # Distance from the anchor around the closed contour, smoothed over about half a finger width
+        window = max(3, self.tip_separation // 2) | 1
+        distance = np.hypot(*(points - anchor).T)
+        if len(distance) < 4 * window:
+            return []
+        padded = np.concatenate([distance[-window:], distance, distance[:window]])
+        smoothed = np.convolve(padded, np.ones(window) / window, mode='same')[window:-window]
+
+        # A fingertip is the farthest point within one finger width along the contour and stands
+        # clearly above the valleys on either side (the gaps between fingers)
+        reach = 2 * self.tip_separation
+        circular = np.concatenate([smoothed[-reach:], smoothed, smoothed[:reach]])
+        neighbourhoods = np.lib.stride_tricks.sliding_window_view(circular, 2 * reach + 1)
+        is_peak = ((smoothed >= neighbourhoods[:, reach - window:reach + window + 1].max(axis=1)) &
+                   (smoothed - neighbourhoods.min(axis=1) > self.tip_separation / 2) &
+                   (smoothed > 0.5 * smoothed.max()))
+        candidates = np.flatnonzero(is_peak)
+        candidates = candidates[np.argsort(-smoothed[candidates])]
+
+        # Greedy non-maximum suppression, farthest tips first
+        tips = []
+        for index in candidates.tolist():
+            point = points[index]
+            if all(np.hypot(*(point - kept)) > self.tip_separation for kept in tips):
+                tips.append(point)
+        return tips
+
+    def detect(self, depth_frame):
+        """
+        Returns (contact_points, contact_heights, finger_ids): (N, 2) int color pixels, (N,) heights in
+        metres above the surface and (N,) finger IDs (-1 when unknown) of the fingertips in contact.
+        """
+        empty = (np.zeros((0, 2), dtype=np.intp), np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.intp))
+        self.tip_points, self.tip_heights = empty[0], empty[1]
+        if not self.surface_model.ready:
+            return empty
+
+        mask, heights, depths, (x0, y0) = self._foreground(depth_frame.get_data(), depth_frame.depth_scale)
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
+        tips = [tip for contour in contours if cv2.contourArea(contour) >= self.min_blob_area
+                for tip in self._blob_tips(contour, mask.shape)]
+        if not tips:
+            return empty
+
+        # Median foreground height and depth in a small patch around each tip
+        tips = np.array(tips, dtype=np.intp)
+        r = self.tip_patch_radius
+        offsets = np.arange(-r, r + 1)
+        ys = np.clip(tips[:, 1, None, None] + offsets[None, :, None], 0, mask.shape[0] - 1)
+        xs = np.clip(tips[:, 0, None, None] + offsets[None, None, :], 0, mask.shape[1] - 1)
+        in_blob = mask[ys, xs].astype(bool).reshape(len(tips), -1)
+        tip_heights = np.nanmedian(np.where(in_blob, heights[ys, xs].reshape(len(tips), -1), np.nan), axis=1)
+        tip_depths = np.nanmedian(np.where(in_blob, depths[ys, xs].reshape(len(tips), -1), np.nan), axis=1)
+
+        self.tip_points = tips + (x0, y0)
+        self.tip_heights = tip_heights.astype(np.float32)
+        in_contact = tip_heights < self.contact_height
+        if not in_contact.any():
+            return empty
+
+        contact_points = depth_frame.to_color_pixels(self.tip_points[in_contact], tip_depths[in_contact])
+        return contact_points, self.tip_heights[in_contact], self._identify(contact_points)
+
+    def _identify(self, contact_points):
+        finger_ids = np.full(len(contact_points), -1, dtype=np.intp)
+        if not len(self._finger_tip_points) or not len(contact_points):
+            return finger_ids
+        distances = np.linalg.norm(contact_points[:, None, :] - self._finger_tip_points[None, :, :], axis=2)
+        nearest = np.argmin(distances, axis=1)
+        matched = distances[np.arange(len(contact_points)), nearest] <= self.identity_radius
+        finger_ids[matched] = self._finger_tip_ids[nearest[matched]]
+        return finger_ids
@@ -0,0 +1,118 @@
+import numpy as np
+
+
+def _patch_offsets(patch_radius):
+    # (dx, dy) offsets of a square patch, ordered from the centre outwards
+    r = np.arange(-patch_radius, patch_radius + 1)
+    dx, dy = np.meshgrid(r, r)
+    offsets = np.stack([dx.ravel(), dy.ravel()], axis=1)
+    return offsets[np.argsort(np.hypot(offsets[:, 0], offsets[:, 1]), kind='stable')]
+
+
+_PATCH_OFFSETS_CACHE = {}
+
+
+def sample_depths(depth_image, depth_scale, pixels, patch_radius=2):
+    """
+    Robust depth, in metres, at each of the (N, 2) integer `pixels` of a uint16 depth image.
+
+    Each sample is the median of the valid (non-zero) pixels in a (2r+1)^2 patch. When the
+    centre pixel itself is a hole the nearest valid pixel in the patch is used instead, and
+    0.0 is returned when the whole patch is empty.
+    """
+    offsets = _PATCH_OFFSETS_CACHE.get(patch_radius)
+    if offsets is None:
+        offsets = _PATCH_OFFSETS_CACHE.setdefault(patch_radius, _patch_offsets(patch_radius))
+
+    height, width = depth_image.shape[:2]
+    pixels = np.asarray(pixels, dtype=np.intp).reshape(-1, 2)
+    xs = np.clip(pixels[:, 0, None] + offsets[:, 0], 0, width - 1)
+    ys = np.clip(pixels[:, 1, None] + offsets[:, 1], 0, height - 1)
+    patches = depth_image[ys, xs]  # (N, P), centre first, then by distance
+    valid = patches > 0
+    valid_counts = valid.sum(axis=1)
+
+    # Median of the valid pixels: zeros sort to the front, so the valid values are the last `count`
+    sorted_patches = np.sort(patches, axis=1)
+    patch_size = patches.shape[1]
+    lower = np.clip(patch_size - valid_counts + (valid_counts - 1) // 2, 0, patch_size - 1)
+    upper = np.clip(patch_size - valid_counts + valid_counts // 2, 0, patch_size - 1)
+    rows = np.arange(len(pixels))
+    medians = (sorted_patches[rows, lower].astype(np.float64) + sorted_patches[rows, upper]) / 2.0
+
+    # Centre hole: fall back to the nearest valid pixel
+    nearest = patches[rows, np.argmax(valid, axis=1)]
+    raw = np.where(valid[:, 0], medians, nearest)
+    return np.where(valid_counts > 0, raw, 0.0) * depth_scale
+
+
+class DepthFrame:
+    """
+    A depth image held as a uint16 NumPy array plus its depth scale.
+
+    Mirrors the parts of `rs.depth_frame` the application uses (`get_distance`,
+    `get_width`, `get_height`, `get_data`, `get_timestamp`), so code written against
+    the live RealSense frame keeps working on buffered or recorded depth.
+
+    When a `SparseDepthRegistration` is attached the depth image is left unaligned and
+    coordinates passed to `get_distance` (and the reported width/height) are in the
+    color image; each query is mapped into the depth image on demand.
+    """
+
+    def __init__(self, depth_image, depth_scale, timestamp=0.0, frame_number=0, registration=None,
+                 source_frame=None):
+        self.depth_image = depth_image
+        self.depth_scale = depth_scale
+        self.timestamp = timestamp
+        self.frame_number = frame_number
+        self.registration = registration
+        # The rs.frame whose buffer `depth_image` views, kept alive for as long as this object is
+        self.source_frame = source_frame
+
+    def get_width(self):
+        if self.registration is not None:
+            return self.registration.color_width
+        return self.depth_image.shape[1]
+
+    def get_height(self):
+        if self.registration is not None:
+            return self.registration.color_height
+        return self.depth_image.shape[0]
+
+    def get_data(self):
+        return self.depth_image
+
+    def get_timestamp(self):
+        return self.timestamp
+
+    def get_frame_number(self):
+        return self.frame_number
+
+    def get_distance(self, x, y):
+        if self.registration is not None:
+            _, depths = self.registration.register(((x, y),), self.depth_image)
+            return float(depths[0])
+        return float(self.depth_image[y, x]) * self.depth_scale
+
+    def to_depth_pixels(self, points):
+        """Maps (N, 2) color pixel coordinates to integer pixels of `depth_image`, clamped to the frame."""
+        points = np.asarray(points).reshape(-1, 2)
+        if self.registration is not None:
+            points = np.clip(points, 0, (self.registration.color_width - 1, self.registration.color_height - 1))
+            depth_pixels, _ = self.registration.register(points, self.depth_image)
+            return depth_pixels
+        height, width = self.depth_image.shape[:2]
+        return np.clip(np.rint(points).astype(np.intp), 0, (width - 1, height - 1))
+
+    def to_color_pixels(self, depth_pixels, depths):
+        """Maps (N, 2) pixels of `depth_image` with their depths in metres to integer color pixel coordinates."""
+        depth_pixels = np.asarray(depth_pixels).reshape(-1, 2)
+        if self.registration is None:
+            return np.rint(depth_pixels).astype(np.intp)
+        color_pixels = np.nan_to_num(self.registration.depth_to_color(depth_pixels, depths), nan=-1.0)
+        return np.clip(np.rint(color_pixels).astype(np.intp), 0,
+                       (self.registration.color_width - 1, self.registration.color_height - 1))
+
+    def sample_distances(self, points, patch_radius=2):
+        """Robust depths in metres at (N, 2) color pixel coordinates; see `sample_depths`."""
+        return sample_depths(self.depth_image, self.depth_scale, self.to_depth_pixels(points), patch_radius)
@@ -0,0 +1,122 @@
+import numpy as np
+
+
+class SparseDepthRegistration:
+    """
+    Maps individual color pixels into an unaligned depth image.
+
+    `rs.align` reprojects every depth pixel into the color viewpoint, but the application only
+    reads depth at a handful of fingertips. This class does the reverse for just the queried
+    pixels: each color pixel's viewing ray is walked through a fixed set of candidate depths,
+    every candidate is projected into the depth image, and the candidate whose measured depth
+    best agrees with its own distance along the ray wins. This is the same search
+    `rs2_project_color_pixel_to_depth_pixel` performs, vectorized over all queries at once.
+
+    Candidate depths are spaced uniformly in inverse depth, which is uniform in disparity and so
+    gives roughly one candidate per depth pixel along the epipolar line. Lens distortion is
+    ignored; the D400 color and depth streams report (near) zero distortion coefficients.
+    """
+
+    def __init__(self, depth_intrinsics, color_intrinsics, depth_to_color_rotation, depth_to_color_translation,
+                 depth_scale, depth_min=0.1, depth_max=1.0, search_steps=64):
+        self.depth_intrinsics = dict(depth_intrinsics)
+        self.color_intrinsics = dict(color_intrinsics)
+        self.depth_scale = depth_scale
+        self.depth_min = depth_min
+        self.depth_max = depth_max
+        self.search_steps = search_steps
+
+        self.color_width = self.color_intrinsics['width']
+        self.color_height = self.color_intrinsics['height']
+        self.depth_width = self.depth_intrinsics['width']
+        self.depth_height = self.depth_intrinsics['height']
+
+        # --- Cached camera constants ---
+        self._depth_to_color_rotation = np.asarray(depth_to_color_rotation, dtype=np.float64).reshape(3, 3)
+        self._depth_to_color_translation = np.asarray(depth_to_color_translation, dtype=np.float64).reshape(3)
+        # The inverse of a rigid transform: R^T and -R^T t
+        self._color_to_depth_rotation = self._depth_to_color_rotation.T
+        self._color_to_depth_translation = -self._color_to_depth_rotation @ self._depth_to_color_translation
+        self._color_focal = np.array([self.color_intrinsics['fx'], self.color_intrinsics['fy']])
+        self._color_principal = np.array([self.color_intrinsics['ppx'], self.color_intrinsics['ppy']])
+        self._depth_focal = np.array([self.depth_intrinsics['fx'], self.depth_intrinsics['fy']])
+        self._depth_principal = np.array([self.depth_intrinsics['ppx'], self.depth_intrinsics['ppy']])
+        self._candidate_depths = 1.0 / np.linspace(1.0 / depth_min, 1.0 / depth_max, search_steps)
+
+    @classmethod
+    def from_realsense_profile(cls, profile, depth_scale, **kwargs):
+        """Builds the registration from a started `rs.pipeline_profile`."""
+        import pyrealsense2 as rs
+
+        depth_profile = profile.get_stream(rs.stream.depth).as_video_stream_profile()
+        color_profile = profile.get_stream(rs.stream.color).as_video_stream_profile()
+        extrinsics = depth_profile.get_extrinsics_to(color_profile)
+
+        def intrinsics_dict(intrinsics):
+            return {'width': intrinsics.width, 'height': intrinsics.height, 'fx': intrinsics.fx,
+                    'fy': intrinsics.fy, 'ppx': intrinsics.ppx, 'ppy': intrinsics.ppy}
+
+        # librealsense stores rotation matrices column-major
+        rotation = np.asarray(extrinsics.rotation, dtype=np.float64).reshape(3, 3).T
+        return cls(intrinsics_dict(depth_profile.get_intrinsics()), intrinsics_dict(color_profile.get_intrinsics()),
+                   rotation, extrinsics.translation, depth_scale, **kwargs)
+
+    def to_dict(self):
+        return {
+            'depth_intrinsics': self.depth_intrinsics,
+            'color_intrinsics': self.color_intrinsics,
+            'depth_to_color_rotation': self._depth_to_color_rotation.tolist(),
+            'depth_to_color_translation': self._depth_to_color_translation.tolist(),
+            'depth_scale': self.depth_scale,
+            'depth_min': self.depth_min,
+            'depth_max': self.depth_max,
+            'search_steps': self.search_steps,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+    def register(self, points, depth_image):
+        """
+        Maps (N, 2) color pixel coordinates into `depth_image`.
+        Returns the matched (N, 2) int depth pixels and the (N,) depths in metres (0 where no match).
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+
+        # Viewing ray of each color pixel at z = 1, then the 3D candidates along it: (N, K, 3)
+        rays = np.empty((len(points), 3))
+        rays[:, :2] = (points - self._color_principal) / self._color_focal
+        rays[:, 2] = 1.0
+        candidates = rays[:, None, :] * self._candidate_depths[None, :, None]
+
+        # Move the candidates into the depth camera and project them onto the depth image
+        candidates = candidates @ self._color_to_depth_rotation.T + self._color_to_depth_translation
+        candidate_z = candidates[..., 2]
+        depth_pixels = candidates[..., :2] / candidate_z[..., None] * self._depth_focal + self._depth_principal
+        depth_pixels = np.rint(depth_pixels).astype(np.int32)
+        in_bounds = ((depth_pixels[..., 0] >= 0) & (depth_pixels[..., 0] < self.depth_width) &
+                     (depth_pixels[..., 1] >= 0) & (depth_pixels[..., 1] < self.depth_height))
+        np.clip(depth_pixels[..., 0], 0, self.depth_width - 1, out=depth_pixels[..., 0])
+        np.clip(depth_pixels[..., 1], 0, self.depth_height - 1, out=depth_pixels[..., 1])
+
+        measured = depth_image[depth_pixels[..., 1], depth_pixels[..., 0]] * self.depth_scale
+        valid = in_bounds & (measured > 0)
+
+        # The true surface point is where the measured depth matches the candidate's own depth
+        error = np.where(valid, np.abs(measured - candidate_z), np.inf)
+        best = np.argmin(error, axis=1)
+        rows = np.arange(len(points))
+        matched = valid[rows, best]
+        return depth_pixels[rows, best], np.where(matched, measured[rows, best], 0.0)
+
+    def depth_to_color(self, depth_pixels, depths):
+        """Projects (N, 2) depth pixels with (N,) depths in metres into (N, 2) float color pixel coordinates."""
+        depth_pixels = np.asarray(depth_pixels, dtype=np.float64).reshape(-1, 2)
+        depths = np.asarray(depths, dtype=np.float64).reshape(-1)
+        points = np.empty((len(depth_pixels), 3))
+        points[:, :2] = (depth_pixels - self._depth_principal) / self._depth_focal * depths[:, None]
+        points[:, 2] = depths
+        points = points @ self._depth_to_color_rotation.T + self._depth_to_color_translation
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return points[:, :2] / points[:, 2:3] * self._color_focal + self._color_principal
@@ -1,183 +1,303 @@
-import pyrealsense2 as rs
+import argparse
 import numpy as np
 import cv2
-import mediapipe as mp
 import time
-from camera_manager import CameraManager # Import CameraManager
-
-# --- Configuration for RealSense Camera ---
-# Define camera resolution (consistent for both color and depth)
-# These values will be passed to CameraManager
-
-# Initialize CameraManager
-camera_manager = CameraManager()
-
-# --- Initialize MediaPipe Hands ---
-mp_drawing = mp.solutions.drawing_utils
-mp_hands = mp.solutions.hands
-hands = mp_hands.Hands(min_detection_confidence=0.5, min_tracking_confidence=0.5)
-
-# --- Depth Tracking Variables ---
-# min/max depths for the currently active tracking period
-current_period_min_depth = float('inf')
-current_period_max_depth = float('-inf')
-
-# min/max depths to display (could be current period or last finished period)
-display_min_depth = None
-display_max_depth = None
-
-current_finger_depth = 0.0 # To display current depth
-
-tracking_active = False # True when recording, False otherwise
-tracking_start_time = 0.0 # Timestamp when tracking started
-
-# --- Main Program ---
-try:
-    # Start streaming using CameraManager
-    if not camera_manager.start_stream():
-        print("Failed to start camera stream. Exiting.")
-        exit()
-
-    # The depth scale is now managed by CameraManager if needed elsewhere
-    # depth_scale = camera_manager.depth_scale # You can access it like this if required
-
-    print("\n--- Finger Depth Tracking Program (Manual Control) ---")
-    print("Move your index finger in front of the camera.")
-    print("Press 'SPACE' to START tracking the min/max depth of your finger.")
-    print("Press 'SPACE' again to STOP tracking and display the results.")
-    print("Press 'r' to RESET the displayed min/max depths.")
-    print("Press 'q' to QUIT the program.")
-
-    while True:
-        # Get frames from CameraManager
-        color_image, aligned_depth_frame, depth_frame_dims = camera_manager.get_frames()
-
-        if color_image is None or aligned_depth_frame is None:
-            continue
-
-        # Get actual width and height of the depth frame for clamping from the returned tuple
-        depth_frame_width = depth_frame_dims[0]
-        depth_frame_height = depth_frame_dims[1]
-
-        # Reset current finger depth for this frame
-        current_finger_depth = 0.0
-        finger_detected_this_frame = False
-
-        # Process the color image with MediaPipe Hands
-        # The CameraManager already sets color_image.flags.writeable = True
-        RGB_frame = cv2.cvtColor(color_image, cv2.COLOR_BGR2RGB)
-        result = hands.process(RGB_frame)
-
-        # Draw hand landmarks and get finger depth
-        if result.multi_hand_landmarks:
-            for hand_landmarks in result.multi_hand_landmarks:
-                mp_drawing.draw_landmarks(color_image, hand_landmarks, mp_hands.HAND_CONNECTIONS)
-
-                # Get the landmark for the tip of the index finger
-                index_finger_tip = hand_landmarks.landmark[mp_hands.HandLandmark.INDEX_FINGER_TIP.value]
-
-                # Convert normalized coordinates (0.0 to 1.0) to pixel coordinates
-                h, w, _ = color_image.shape
-                finger_pixel_x, finger_pixel_y = int(index_finger_tip.x * w), int(index_finger_tip.y * h)
-
-                # Clamp coordinates to ensure they are within the depth frame's bounds
-                # Use depth_frame_width for X and depth_frame_height for Y
-                clamped_finger_pixel_x = max(0, min(finger_pixel_x, depth_frame_width - 1))
-                clamped_finger_pixel_y = max(0, min(finger_pixel_y, depth_frame_height - 1))
-
-                # Get depth value at the landmark's pixel location
-                depth_at_finger_m = aligned_depth_frame.get_distance(clamped_finger_pixel_x, clamped_finger_pixel_y)
-
-                # Only consider valid depths (non-zero and within a reasonable range, e.g., < 5m)
-                if depth_at_finger_m > 0 and depth_at_finger_m < 5.0:
-                    current_finger_depth = depth_at_finger_m
-                    finger_detected_this_frame = True
-
-                    # Draw a circle at the landmark and display the depth
-                    cv2.circle(color_image, (finger_pixel_x, finger_pixel_y), 5, (0, 255, 255), -1) # Yellow circle
-                    cv2.putText(color_image, f"Current Depth: {current_finger_depth:.3f}m",
-                                (finger_pixel_x + 10, finger_pixel_y - 10),
-                                cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 255), 2)
-
-                    # --- Depth Tracking Logic (only if active) ---
-                    if tracking_active:
-                        current_period_min_depth = min(current_period_min_depth, current_finger_depth)
-                        current_period_max_depth = max(current_period_max_depth, current_finger_depth)
-                        display_min_depth = current_period_min_depth # Update display values live
-                        display_max_depth = current_period_max_depth
-
-                break # Only track one hand for simplicity
-
-        # --- Display Tracking Information ---
-        status_text = ""
-        if tracking_active:
-            elapsed_time = time.time() - tracking_start_time
-            status_text = f"Tracking... Elapsed: {elapsed_time:.1f}s"
-            status_color = (0, 255, 0) # Green for active
-        else:
-            status_text = "Tracking PAUSED. Press 'SPACE' to START."
-            status_color = (0, 165, 255) # Orange for paused
+import os
+import sys
+# Make the `src` package importable when this tool is run from inside the src directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.camera_manager import CameraManager # Import CameraManager
+from src.key_calibration import KeyCalibrator
+from src.keyboard_manager import ANNOTATION_FILENAME, LAYOUT_CACHE_DIR, POINTS_PER_KEY, THRESHOLDS_FILENAME, KeyboardManager
+from src.replay_camera_manager import ReplayCameraManager
+from src.tap_detector import NUM_FINGERTIPS, fingertip_slots
+import src.visualization_utils as viz_utils
+
+
+def run_manual_tracking(camera_manager):
+    """Tracks the min/max depth of the index finger between two presses of SPACE, for one key at a time."""
+    import mediapipe as mp
+
+    # --- Initialize MediaPipe Hands ---
+    mp_drawing = mp.solutions.drawing_utils
+    mp_hands = mp.solutions.hands
+    hands = mp_hands.Hands(min_detection_confidence=0.5, min_tracking_confidence=0.5)
+
+    # --- Depth Tracking Variables ---
+    # min/max depths for the currently active tracking period
+    current_period_min_depth = float('inf')
+    current_period_max_depth = float('-inf')
+
+    # min/max depths to display (could be current period or last finished period)
+    display_min_depth = None
+    display_max_depth = None
+
+    current_finger_depth = 0.0 # To display current depth
+
+    tracking_active = False # True when recording, False otherwise
+    tracking_start_time = 0.0 # Timestamp when tracking started
+
+    try:
+        # Start streaming using CameraManager
+        if not camera_manager.start_stream():
+            print("Failed to start camera stream. Exiting.")
+            return
+
+        # The depth scale is now managed by CameraManager if needed elsewhere
+        # depth_scale = camera_manager.depth_scale # You can access it like this if required
+
+        print("\n--- Finger Depth Tracking Program (Manual Control) ---")
+        print("Move your index finger in front of the camera.")
+        print("Press 'SPACE' to START tracking the min/max depth of your finger.")
+        print("Press 'SPACE' again to STOP tracking and display the results.")
+        print("Press 'r' to RESET the displayed min/max depths.")
+        print("Press 'q' to QUIT the program.")
+
+        while True:
+            # Get frames from CameraManager
+            color_image, aligned_depth_frame, depth_frame_dims = camera_manager.get_frames()
+
+            if color_image is None or aligned_depth_frame is None:
+                continue
+
+            # Get actual width and height of the depth frame for clamping from the returned tuple
+            depth_frame_width = depth_frame_dims[0]
+            depth_frame_height = depth_frame_dims[1]
+
+            # Reset current finger depth for this frame
+            current_finger_depth = 0.0
+            finger_detected_this_frame = False
+
+            # Process the color image with MediaPipe Hands
+            # The CameraManager already sets color_image.flags.writeable = True
+            RGB_frame = cv2.cvtColor(color_image, cv2.COLOR_BGR2RGB)
+            result = hands.process(RGB_frame)
+
+            # Draw hand landmarks and get finger depth
+            if result.multi_hand_landmarks:
+                for hand_landmarks in result.multi_hand_landmarks:
+                    mp_drawing.draw_landmarks(color_image, hand_landmarks, mp_hands.HAND_CONNECTIONS)
+
+                    # Get the landmark for the tip of the index finger
+                    index_finger_tip = hand_landmarks.landmark[mp_hands.HandLandmark.INDEX_FINGER_TIP.value]
+
+                    # Convert normalized coordinates (0.0 to 1.0) to pixel coordinates
+                    h, w, _ = color_image.shape
+                    finger_pixel_x, finger_pixel_y = int(index_finger_tip.x * w), int(index_finger_tip.y * h)
+
+                    # Clamp coordinates to ensure they are within the depth frame's bounds
+                    # Use depth_frame_width for X and depth_frame_height for Y
+                    clamped_finger_pixel_x = max(0, min(finger_pixel_x, depth_frame_width - 1))
+                    clamped_finger_pixel_y = max(0, min(finger_pixel_y, depth_frame_height - 1))
+
+                    # Get depth value at the landmark's pixel location
+                    depth_at_finger_m = aligned_depth_frame.get_distance(clamped_finger_pixel_x, clamped_finger_pixel_y)
+
+                    # Only consider valid depths (non-zero and within a reasonable range, e.g., < 5m)
+                    if depth_at_finger_m > 0 and depth_at_finger_m < 5.0:
+                        current_finger_depth = depth_at_finger_m
+                        finger_detected_this_frame = True
+
+                        # Draw a circle at the landmark and display the depth
+                        cv2.circle(color_image, (finger_pixel_x, finger_pixel_y), 5, (0, 255, 255), -1) # Yellow circle
+                        cv2.putText(color_image, f"Current Depth: {current_finger_depth:.3f}m",
+                                    (finger_pixel_x + 10, finger_pixel_y - 10),
+                                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 255), 2)
+
+                        # --- Depth Tracking Logic (only if active) ---
+                        if tracking_active:
+                            current_period_min_depth = min(current_period_min_depth, current_finger_depth)
+                            current_period_max_depth = max(current_period_max_depth, current_finger_depth)
+                            display_min_depth = current_period_min_depth # Update display values live
+                            display_max_depth = current_period_max_depth
+
+                    break # Only track one hand for simplicity
+
+            # --- Display Tracking Information ---
+            status_text = ""
+            if tracking_active:
+                elapsed_time = time.time() - tracking_start_time
+                status_text = f"Tracking... Elapsed: {elapsed_time:.1f}s"
+                status_color = (0, 255, 0) # Green for active
+            else:
+                status_text = "Tracking PAUSED. Press 'SPACE' to START."
+                status_color = (0, 165, 255) # Orange for paused
 
-        cv2.putText(color_image, status_text, (10, 30),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.8, status_color, 2, cv2.LINE_AA)
+            cv2.putText(color_image, status_text, (10, 30),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.8, status_color, 2, cv2.LINE_AA)
 
-        cv2.putText(color_image, f"Current: {current_finger_depth:.3f}m" if finger_detected_this_frame else "Current: N/A",
-                    (10, 70), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2, cv2.LINE_AA)
+            cv2.putText(color_image, f"Current: {current_finger_depth:.3f}m" if finger_detected_this_frame else "Current: N/A",
+                        (10, 70), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2, cv2.LINE_AA)
 
-        if display_min_depth is not None and display_min_depth != float('inf'):
-            cv2.putText(color_image, f"Min: {display_min_depth:.3f}m",
-                        (10, 110), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 0, 0), 2, cv2.LINE_AA)
-        else:
-            cv2.putText(color_image, "Min: --.--m",
-                        (10, 110), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (100, 100, 100), 2, cv2.LINE_AA)
+            if display_min_depth is not None and display_min_depth != float('inf'):
+                cv2.putText(color_image, f"Min: {display_min_depth:.3f}m",
+                            (10, 110), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 0, 0), 2, cv2.LINE_AA)
+            else:
+                cv2.putText(color_image, "Min: --.--m",
+                            (10, 110), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (100, 100, 100), 2, cv2.LINE_AA)
 
-        if display_max_depth is not None and display_max_depth != float('-inf'):
-            cv2.putText(color_image, f"Max: {display_max_depth:.3f}m",
-                        (10, 150), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 0, 0), 2, cv2.LINE_AA)
-        else:
-            cv2.putText(color_image, "Max: --.--m",
-                        (10, 150), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (100, 100, 100), 2, cv2.LINE_AA)
-
-        # Display instructions at the bottom
-        cv2.putText(color_image, "SPACE: Start/Stop Tracking | R: Reset | Q: Quit",
-                    (10, color_image.shape[0] - 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 0), 2, cv2.LINE_AA)
-
-        # Display the color frame
-        cv2.imshow('Finger Depth Tracking (Manual)', color_image)
-
-        # --- Key Press Handling ---
-        key = cv2.waitKey(1) & 0xFF
-        if key == ord('q'):
-            break
-        elif key == ord(' '): # Spacebar pressed
-            if not tracking_active:
-                # Start tracking
-                tracking_active = True
-                tracking_start_time = time.time()
-                current_period_min_depth = float('inf') # Reset for new period
-                current_period_max_depth = float('-inf')
-                print("Tracking STARTED.")
+            if display_max_depth is not None and display_max_depth != float('-inf'):
+                cv2.putText(color_image, f"Max: {display_max_depth:.3f}m",
+                            (10, 150), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 0, 0), 2, cv2.LINE_AA)
             else:
-                # Stop tracking
-                tracking_active = False
-                print("Tracking STOPPED.")
-                if display_min_depth != float('inf') and display_max_depth != float('-inf'):
-                    print(f"Results: Min Depth: {display_min_depth:.3f}m, Max Depth: {display_max_depth:.3f}m")
+                cv2.putText(color_image, "Max: --.--m",
+                            (10, 150), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (100, 100, 100), 2, cv2.LINE_AA)
+
+            # Display instructions at the bottom
+            cv2.putText(color_image, "SPACE: Start/Stop Tracking | R: Reset | Q: Quit",
+                        (10, color_image.shape[0] - 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 0), 2, cv2.LINE_AA)
+
+            # Display the color frame
+            cv2.imshow('Finger Depth Tracking (Manual)', color_image)
+
+            # --- Key Press Handling ---
+            key = cv2.waitKey(1) & 0xFF
+            if key == ord('q'):
+                break
+            elif key == ord(' '): # Spacebar pressed
+                if not tracking_active:
+                    # Start tracking
+                    tracking_active = True
+                    tracking_start_time = time.time()
+                    current_period_min_depth = float('inf') # Reset for new period
+                    current_period_max_depth = float('-inf')
+                    print("Tracking STARTED.")
                 else:
-                    print("No valid finger depths recorded during the period.")
-        elif key == ord('r'): # Reset all
-            tracking_active = False
-            current_period_min_depth = float('inf')
-            current_period_max_depth = float('-inf')
-            display_min_depth = None # Reset display values
-            display_max_depth = None
-            current_finger_depth = 0.0
-            tracking_start_time = 0.0
-            print("Tracking data RESET.")
-
-finally:
-    # Stop streaming and clean up resources using CameraManager
-    print("\nStopping stream and cleaning up...")
-    camera_manager.stop_stream()
-    cv2.destroyAllWindows()
-    hands.close()
\ No newline at end of file
+                    # Stop tracking
+                    tracking_active = False
+                    print("Tracking STOPPED.")
+                    if display_min_depth != float('inf') and display_max_depth != float('-inf'):
+                        print(f"Results: Min Depth: {display_min_depth:.3f}m, Max Depth: {display_max_depth:.3f}m")
+                    else:
+                        print("No valid finger depths recorded during the period.")
+            elif key == ord('r'): # Reset all
+                tracking_active = False
+                current_period_min_depth = float('inf')
+                current_period_max_depth = float('-inf')
+                display_min_depth = None # Reset display values
+                display_max_depth = None
+                current_finger_depth = 0.0
+                tracking_start_time = 0.0
+                print("Tracking data RESET.")
+
+    finally:
+        # Stop streaming and clean up resources using CameraManager
+        print("\nStopping stream and cleaning up...")
+        camera_manager.stop_stream()
+        cv2.destroyAllWindows()
+        hands.close()
+
+
+def run_auto_calibration(camera_manager, output_filename=THRESHOLDS_FILENAME):
+    """
+    Calibrates the whole keyboard from one typing session: every fingertip is hit-tested against the
+    annotated layout each frame and a KeyCalibrator keeps streaming statistics of the contact depths
+    per key. The thresholds are written to `output_filename` on 's' and when quitting.
+    """
+    from src.hand_tracker import FINGER_TIP_SLICE, HandTracker
+
+    keyboard_manager = KeyboardManager(annotation_filename=ANNOTATION_FILENAME, points_per_key=POINTS_PER_KEY,
+                                       thresholds_filename=THRESHOLDS_FILENAME, cache_dir=LAYOUT_CACHE_DIR)
+    annotated_keys = keyboard_manager.get_annotated_keys()
+    hand_tracker = HandTracker(min_detection_confidence=0.5, min_tracking_confidence=0.5)
+    calibrator = KeyCalibrator(keyboard_manager.key_names, num_fingers=NUM_FINGERTIPS)
+
+    # Fingertip slot arrays (LEFT_HAND fingers 0-4, RIGHT_HAND fingers 5-9), as in tapboard_main.py
+    slot_points = np.zeros((NUM_FINGERTIPS, 2), dtype=np.int32)
+    slot_depths = np.zeros(NUM_FINGERTIPS, dtype=np.float64)
+    slot_keys = np.full(NUM_FINGERTIPS, -1, dtype=np.intp)
+    slot_valid = np.zeros(NUM_FINGERTIPS, dtype=bool)
+
+    try:
+        if not camera_manager.start_stream():
+            print("Failed to start camera stream. Exiting.")
+            return
+
+        print("\n--- Automatic Keyboard Calibration ---")
+        print("Type naturally over the whole keyboard, e.g. a few pangrams plus the digits and special keys.")
+        print("Keys turn green once they are calibrated.")
+        print("Press 's' to SAVE the thresholds, 'r' to RESET, 'q' to SAVE and QUIT.")
+
+        while True:
+            color_image, depth_frame, _ = camera_manager.get_frames()
+            if color_image is None or depth_frame is None:
+                if getattr(camera_manager, 'finished', False):
+                    break
+                continue
+
+            # --- Hit-test and sample every fingertip ---
+            results = hand_tracker.process_frame(color_image)
+            landmarks, handedness = hand_tracker.extract_landmarks(results, color_image.shape)
+            slot_valid[:] = False
+            if len(landmarks):
+                tips = landmarks[:, FINGER_TIP_SLICE, :2].reshape(-1, 2).astype(np.int32)
+                slots, tip_indices = fingertip_slots(handedness)
+                slot_points[slots] = tips[tip_indices]
+                slot_depths[slots] = depth_frame.sample_distances(tips[tip_indices])
+                slot_keys[slots] = keyboard_manager.keys_at(tips[tip_indices])
+                slot_valid[slots] = True
+            calibrator.update(slot_keys, slot_depths, slot_valid)
+
+            # --- Display calibration progress ---
+            calibrated = calibrator.calibrated
+            calibrated_keys = {name for name, done in zip(keyboard_manager.key_names, calibrated.tolist()) if done}
+            viz_utils.draw_keycap_annotations(color_image, annotated_keys, calibrated_keys, POINTS_PER_KEY)
+            viz_utils.draw_hand_landmarks(color_image, landmarks)
+            for x, y in slot_points[slot_valid & calibrator.finger_down].tolist():
+                cv2.circle(color_image, (x, y), 8, (0, 255, 0), 2)  # Green ring: finger in a keystroke
+            cv2.putText(color_image, f"Calibrated: {len(calibrated_keys)}/{len(calibrated)} keys",
+                        (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2, cv2.LINE_AA)
+            cv2.putText(color_image, "S: Save | R: Reset | Q: Save and Quit",
+                        (10, color_image.shape[0] - 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 0), 2, cv2.LINE_AA)
+            cv2.imshow('Keyboard Calibration', color_image)
+
+            # --- Key Press Handling ---
+            key = cv2.waitKey(1) & 0xFF
+            if key == ord('q'):
+                break
+            elif key == ord('s'):
+                calibrator.save(output_filename)
+            elif key == ord('r'):
+                calibrator.reset()
+                print("Calibration data RESET.")
+
+        # --- Results ---
+        print(f"{'key':<12}{'strokes':>8}{'samples':>9}{'mean':>9}{'std':>9}")
+        for name, strokes, samples, mean, std in calibrator.summary():
+            print(f"{name:<12}{strokes:>8}{samples:>9}{mean:>9.4f}{std:>9.4f}")
+        missing = [name for name, done in zip(calibrator.key_names, calibrator.calibrated.tolist()) if not done]
+        if missing:
+            print(f"Not calibrated: {', '.join(missing)}")
+        if calibrator.calibrated.any():
+            calibrator.save(output_filename)
+        else:
+            print("No key was calibrated; nothing saved.")
+
+    finally:
+        print("\nStopping stream and cleaning up...")
+        camera_manager.stop_stream()
+        cv2.destroyAllWindows()
+        hand_tracker.close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Measure the fingertip depth thresholds of the keycaps")
+    parser.add_argument('--manual', action='store_true',
+                        help="Track one finger on one key between presses of SPACE instead of calibrating automatically")
+    parser.add_argument('--output', metavar='FILE', default=THRESHOLDS_FILENAME,
+                        help="Thresholds file the automatic calibration writes")
+    parser.add_argument('--replay', metavar='DIR', default=None,
+                        help="Calibrate from a recording made with --record instead of the camera")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.replay:
+        camera_manager = ReplayCameraManager(args.replay, realtime=False)
+    else:
+        camera_manager = CameraManager()
+    if args.manual:
+        run_manual_tracking(camera_manager)
+    else:
+        run_auto_calibration(camera_manager, args.output)
@@ -0,0 +1,112 @@
+import json
+import os
+import numpy as np
+
+# On-disk layout of a recording directory:
+#   meta.json                 - stream shapes, depth scale, fps and the list of chunks
+#   color_00000.npy ...       - (chunk_frames, h, w, 3) uint8 BGR frames
+#   depth_00000.npy ...       - (chunk_frames, h, w) uint16 raw z16 depth
+#   timestamps_00000.npy ...  - (chunk_frames,) float64 hardware timestamps in ms
+#   frame_numbers_00000.npy   - (chunk_frames,) int64 hardware frame counters
+# Depth recorded in sparse-alignment mode is unaligned; meta.json then carries the
+# SparseDepthRegistration needed to map color pixels into it.
+# Every chunk is a plain .npy file written through a memory map, so a recording can be
+# served back zero-copy with np.load(mmap_mode=...).
+META_FILENAME = 'meta.json'
+FORMAT_VERSION = 1
+
+
+def chunk_filename(kind, chunk_index):
+    return f"{kind}_{chunk_index:05d}.npy"
+
+
+def load_recording_meta(path):
+    with open(os.path.join(path, META_FILENAME), 'r') as f:
+        meta = json.load(f)
+    if meta.get('version') != FORMAT_VERSION:
+        raise ValueError(f"Unsupported recording format version {meta.get('version')} in '{path}'")
+    return meta
+
+
+class FrameRecorder:
+    """Writes color frames, raw z16 depth and hardware timestamps into a chunked, memory-mapped recording."""
+
+    def __init__(self, path, depth_scale, fps=30, chunk_frames=150, registration=None):
+        self.path = path
+        self.registration = registration
+        self.depth_scale = depth_scale
+        self.fps = fps
+        self.chunk_frames = chunk_frames
+        self.frame_count = 0
+        self._chunks = []
+        self._color_chunk = None
+        self._depth_chunk = None
+        self._timestamp_chunk = None
+        self._frame_number_chunk = None
+        self._chunk_fill = 0
+        self._color_shape = None
+        self._depth_shape = None
+        os.makedirs(path, exist_ok=True)
+
+    def _open_chunk(self):
+        chunk_index = len(self._chunks)
+        chunk_files = {kind: chunk_filename(kind, chunk_index)
+                       for kind in ('color', 'depth', 'timestamps', 'frame_numbers')}
+
+        def open_memmap(kind, dtype, shape):
+            return np.lib.format.open_memmap(os.path.join(self.path, chunk_files[kind]), mode='w+',
+                                             dtype=dtype, shape=(self.chunk_frames,) + shape)
+
+        self._color_chunk = open_memmap('color', np.uint8, self._color_shape)
+        self._depth_chunk = open_memmap('depth', np.uint16, self._depth_shape)
+        self._timestamp_chunk = open_memmap('timestamps', np.float64, ())
+        self._frame_number_chunk = open_memmap('frame_numbers', np.int64, ())
+        self._chunks.append(dict(chunk_files, frames=0))
+        self._chunk_fill = 0
+
+    def _flush_chunk(self):
+        if self._color_chunk is None:
+            return
+        for chunk in (self._color_chunk, self._depth_chunk, self._timestamp_chunk, self._frame_number_chunk):
+            chunk.flush()
+        self._chunks[-1]['frames'] = self._chunk_fill
+        self._write_meta()
+
+    def _write_meta(self):
+        meta = {
+            'version': FORMAT_VERSION,
+            'color_shape': list(self._color_shape),
+            'depth_shape': list(self._depth_shape),
+            'depth_scale': self.depth_scale,
+            'fps': self.fps,
+            'chunk_frames': self.chunk_frames,
+            'frame_count': self.frame_count,
+            'chunks': self._chunks,
+            'registration': self.registration.to_dict() if self.registration is not None else None,
+        }
+        with open(os.path.join(self.path, META_FILENAME), 'w') as f:
+            json.dump(meta, f, indent=4)
+
+    def write(self, color_image, depth_frame):
+        """Appends one frame. `depth_frame` may be an `rs.depth_frame` or a `DepthFrame`."""
+        depth_image = np.asanyarray(depth_frame.get_data())
+        if self._color_shape is None:
+            self._color_shape = color_image.shape
+            self._depth_shape = depth_image.shape
+
+        if self._color_chunk is None or self._chunk_fill == self.chunk_frames:
+            self._flush_chunk()
+            self._open_chunk()
+
+        i = self._chunk_fill
+        self._color_chunk[i] = color_image
+        self._depth_chunk[i] = depth_image
+        self._timestamp_chunk[i] = depth_frame.get_timestamp()
+        self._frame_number_chunk[i] = depth_frame.get_frame_number()
+        self._chunk_fill += 1
+        self.frame_count += 1
+
+    def close(self):
+        self._flush_chunk()
+        self._color_chunk = self._depth_chunk = self._timestamp_chunk = self._frame_number_chunk = None
+        print(f"Recorded {self.frame_count} frame(s) to '{self.path}'")
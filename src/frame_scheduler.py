@@ -0,0 +1,101 @@
+FULL_QUALITY = 'full'
+NO_OVERLAY = 'no_overlay'
+LIGHT_MODEL = 'light_model'
+LOW_RESOLUTION = 'low_resolution'
+SKIP_ALTERNATE = 'skip_alternate'
+
+# Cheapest quality loss first; each level keeps the savings of the levels before it
+DEGRADATION_LEVELS = (FULL_QUALITY, NO_OVERLAY, LIGHT_MODEL, LOW_RESOLUTION, SKIP_ALTERNATE)
+
+
+class FrameScheduler:
+    """
+    Sheds work when processing a frame takes longer than the latency budget.
+
+    `frame_done()` is given each processed frame's processing time; its exponential moving average is
+    compared with `latency_budget` seconds (the camera's frame period by default). After
+    `escalate_frames` frames over budget the scheduler moves one step down `levels` (by default
+    DEGRADATION_LEVELS: skip the overlay, use the lighter model, lower the inference resolution, skip
+    every other frame); after `recover_frames` frames under `recover_fraction` of the budget it moves
+    one step back up. The caller applies the current level, exposed as `level` / `level_name` and the
+    `degraded()` test; levels the caller cannot apply can be left out of `levels`.
+
+    `should_process()` decides whether a frame is processed at all. A frame with a fingertip within a
+    few millimetres of the surface (as seen in the last processed frame) is always processed, so
+    shedding load can delay a fingertip's approach but never miss or cut short a press.
+    """
+
+    def __init__(self, fps, latency_budget=None, levels=DEGRADATION_LEVELS, escalate_frames=5,
+                 recover_frames=60, recover_fraction=0.6, smoothing=0.2):
+        self.frame_period = 1.0 / fps
+        self.latency_budget = latency_budget if latency_budget is not None else self.frame_period
+        self.levels = tuple(levels)
+        self.escalate_frames = escalate_frames
+        self.recover_frames = recover_frames
+        self.recover_fraction = recover_fraction
+        self.smoothing = smoothing
+        self.level = 0
+        self.average_time = None
+        self.processed_frames = 0
+        self.skipped_frames = 0
+        self.level_changes = 0
+        self._over_budget = 0
+        self._under_budget = 0
+        self._skip_next = False
+
+    @property
+    def level_name(self):
+        return self.levels[self.level]
+
+    def degraded(self, level_name):
+        """True if `level_name` is one of the levels in effect (it or a later one is the current level)."""
+        return level_name in self.levels[1:self.level + 1]
+
+    def should_process(self, near_surface):
+        """Whether to process this frame; `near_surface` is whether a fingertip was near the surface last frame."""
+        if near_surface or not self.degraded(SKIP_ALTERNATE):
+            self._skip_next = self.degraded(SKIP_ALTERNATE)
+            return True
+        skip, self._skip_next = self._skip_next, not self._skip_next
+        if skip:
+            self.skipped_frames += 1
+        return not skip
+
+    def frame_done(self, processing_time):
+        """Records one processed frame's processing time in seconds and adjusts the level."""
+        self.processed_frames += 1
+        if self.average_time is None:
+            self.average_time = processing_time
+        else:
+            self.average_time += self.smoothing * (processing_time - self.average_time)
+
+        if self.average_time > self.latency_budget:
+            self._over_budget += 1
+            self._under_budget = 0
+            if self._over_budget >= self.escalate_frames and self.level < len(self.levels) - 1:
+                self._set_level(self.level + 1)
+        elif self.average_time < self.recover_fraction * self.latency_budget:
+            self._under_budget += 1
+            self._over_budget = 0
+            if self._under_budget >= self.recover_frames and self.level > 0:
+                self._set_level(self.level - 1)
+        else:
+            self._over_budget = self._under_budget = 0
+
+    def _set_level(self, level):
+        self.level = level
+        self.level_changes += 1
+        self._over_budget = self._under_budget = 0
+        print(f"Frame scheduler: {self.average_time * 1000.0:.1f} ms per frame against a "
+              f"{self.latency_budget * 1000.0:.1f} ms budget, now at level {level} ({self.level_name})")
+
+    def get_stats(self):
+        return {
+            'level': self.level,
+            'level_name': self.level_name,
+            'average_time_ms': (self.average_time or 0.0) * 1000.0,
+            'latency_budget_ms': self.latency_budget * 1000.0,
+            'processed_frames': self.processed_frames,
+            'skipped_frames': self.skipped_frames,
+            'level_changes': self.level_changes,
+        }
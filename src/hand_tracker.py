@@ -1,17 +1,117 @@
 import mediapipe as mp
 import cv2
+import numpy as np
+
+NUM_LANDMARKS = 21
+FINGER_NAMES = ('thumb', 'index', 'middle', 'ring', 'pinky')
+# THUMB_TIP, INDEX_FINGER_TIP, MIDDLE_FINGER_TIP, RING_FINGER_TIP and PINKY_TIP are landmarks 4, 8, 12, 16, 20,
+# so a basic slice selects all fingertips as a view rather than a copy
+FINGER_TIP_SLICE = slice(4, NUM_LANDMARKS, 4)
+LEFT_HAND = 0
+RIGHT_HAND = 1
+
+
+class LandmarkResults:
+    """
+    Hand detection results held as arrays instead of MediaPipe protobufs.
+
+    `landmarks` is (hands, 21, 3) float32 in MediaPipe's normalized image coordinates, `handedness`
+    is (hands,) int8 LEFT_HAND / RIGHT_HAND and `scores` the (hands,) handedness confidences.
+    `tracked` is True when the landmarks were carried forward with optical flow rather than inferred.
+    `multi_hand_landmarks` rebuilds the protobuf lists on first access so drawing code that expects
+    a MediaPipe result keeps working.
+    """
+
+    def __init__(self, landmarks, handedness, scores, frame_id=None, tracked=False):
+        self.landmarks = landmarks
+        self.handedness = handedness
+        self.scores = scores
+        self.frame_id = frame_id
+        self.tracked = tracked
+        self._multi_hand_landmarks = None
+
+    @classmethod
+    def empty(cls, frame_id=None):
+        return cls(np.zeros((0, NUM_LANDMARKS, 3), dtype=np.float32), np.zeros(0, dtype=np.int8),
+                   np.zeros(0, dtype=np.float32), frame_id)
+
+    @property
+    def multi_hand_landmarks(self):
+        if not len(self.landmarks):
+            return None
+        if self._multi_hand_landmarks is None:
+            from mediapipe.framework.formats import landmark_pb2
+
+            self._multi_hand_landmarks = []
+            for hand in self.landmarks.tolist():
+                landmark_list = landmark_pb2.NormalizedLandmarkList()
+                for x, y, z in hand:
+                    landmark_list.landmark.add(x=x, y=y, z=z)
+                self._multi_hand_landmarks.append(landmark_list)
+        return self._multi_hand_landmarks
+
 
 class HandTracker:
-    def __init__(self, min_detection_confidence=0.3, min_tracking_confidence=0.3):
+    def __init__(self, min_detection_confidence=0.3, min_tracking_confidence=0.3, max_num_hands=2,
+                 model_complexity=1, roi=None, roi_target_size=None, track_interval=1, track_margin=40):
         self.mp_hands = mp.solutions.hands
+        self.min_tracking_confidence = min_tracking_confidence
+        self.max_num_hands = max_num_hands
+        self.model_complexity = model_complexity
         self.hands = self.mp_hands.Hands(
             min_detection_confidence=min_detection_confidence,
             min_tracking_confidence=min_tracking_confidence,
-            model_complexity=1
+            max_num_hands=max_num_hands,
+            model_complexity=model_complexity
         )
         self.mp_drawing = mp.solutions.drawing_utils
 
+        # --- Region-of-interest inference ---
+        # When set, only the (x0, y0, x1, y1) region is converted and run through Hands, optionally
+        # downscaled so its longer side is at most `roi_target_size` pixels. Landmarks are mapped back
+        # to full-frame coordinates, so results look the same to callers.
+        self.roi = roi
+        self.roi_target_size = roi_target_size
+
+        # --- Optical-flow tracking between inferences ---
+        # With track_interval > 1, Hands runs only every `track_interval` frames; in between the 21
+        # landmarks of each hand are carried forward with pyramidal Lucas-Kanade on a grayscale crop
+        # around the hands (grown by `track_margin` pixels). Inference runs early whenever the last
+        # handedness score fell below min_tracking_confidence or the flow loses any fingertip.
+        self.track_interval = track_interval
+        self.track_margin = track_margin
+        self.lk_params = dict(winSize=(21, 21), maxLevel=3,
+                              criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 20, 0.03))
+        self._track_points = None       # (hands * 21, 2) float32 pixel positions from the previous frame
+        self._track_z = None            # (hands, 21) normalized z from the last inference
+        self._track_handedness = None
+        self._track_scores = None
+        self._track_gray = None         # grayscale crop of the previous frame around the hands
+        self._track_origin = (0, 0)     # top-left of that crop in the full frame
+        self._frames_since_inference = 0
+        self.last_frame_inferred = True
+        self.inferred_frames = 0
+        self.tracked_frames = 0
+
+        # Preallocated outputs of extract_landmarks(), reused every frame
+        self._landmark_buffer = np.zeros((max_num_hands, NUM_LANDMARKS, 3), dtype=np.float32)
+        self._handedness_buffer = np.zeros(max_num_hands, dtype=np.int8)
+
+    def set_roi(self, roi, roi_target_size=None):
+        """Restricts inference to `roi` (x0, y0, x1, y1), or the full frame when None."""
+        self.roi = roi
+        self.roi_target_size = roi_target_size
+
     def process_frame(self, image):
+        if self.track_interval > 1:
+            return self._process_tracked(image)
+        self.inferred_frames += 1
+        return self._infer(image)
+
+    def _infer(self, image):
+        if self.roi is not None or self.roi_target_size:
+            return self._process_roi(image)
+
         # Convert the BGR image to RGB for MediaPipe.
         RGB_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
         # To improve performance, optionally mark the image as not writeable to pass by reference.
@@ -21,6 +121,145 @@ class HandTracker:
         RGB_image.flags.writeable = True
         return results
 
+    def _process_roi(self, image):
+        h, w = image.shape[:2]
+        x0, y0, x1, y1 = self.roi if self.roi is not None else (0, 0, w, h)
+        crop = image[y0:y1, x0:x1]
+        crop_h, crop_w = crop.shape[:2]
+
+        scale = self.roi_target_size / max(crop_w, crop_h) if self.roi_target_size else 1.0
+        if scale < 1.0:
+            crop = cv2.resize(crop, (max(1, round(crop_w * scale)), max(1, round(crop_h * scale))),
+                              interpolation=cv2.INTER_AREA)
+
+        RGB_image = cv2.cvtColor(crop, cv2.COLOR_BGR2RGB)
+        RGB_image.flags.writeable = False
+        landmarks, handedness, scores = self.results_to_arrays(self.hands.process(RGB_image))
+
+        # Normalized ROI coordinates -> normalized full-frame coordinates (z scales with x).
+        # Downscaling does not matter here since MediaPipe's coordinates are already normalized.
+        landmarks[..., 0] = (x0 + landmarks[..., 0] * crop_w) / w
+        landmarks[..., 1] = (y0 + landmarks[..., 1] * crop_h) / h
+        landmarks[..., 2] *= crop_w / w
+        return LandmarkResults(landmarks, handedness, scores)
+
+    def _tracking_crop(self, image, points):
+        # Grayscale crop around `points` grown by track_margin, and its top-left corner
+        h, w = image.shape[:2]
+        x0, y0 = np.maximum(points.min(axis=0).astype(int) - self.track_margin, 0)
+        x1, y1 = np.minimum(points.max(axis=0).astype(int) + self.track_margin + 1, (w, h))
+        return cv2.cvtColor(image[y0:y1, x0:x1], cv2.COLOR_BGR2GRAY), (x0, y0)
+
+    def _process_tracked(self, image):
+        h, w = image.shape[:2]
+        due = (self._track_points is None or self._frames_since_inference + 1 >= self.track_interval
+               or np.any(self._track_scores < self.min_tracking_confidence))
+        if not due:
+            tracked = self._track(image)
+            if tracked is not None:
+                self._frames_since_inference += 1
+                self.last_frame_inferred = False
+                self.tracked_frames += 1
+                return tracked
+
+        results = self._infer(image)
+        landmarks, handedness, scores = self.results_to_arrays(results)
+        self._frames_since_inference = 0
+        self.last_frame_inferred = True
+        self.inferred_frames += 1
+        if len(landmarks):
+            self._track_points = (landmarks[..., :2] * np.array((w, h), dtype=np.float32)).reshape(-1, 2)
+            self._track_z = landmarks[..., 2].copy()
+            self._track_handedness = handedness.copy()
+            self._track_scores = scores.copy()
+            self._track_gray, self._track_origin = self._tracking_crop(image, self._track_points)
+        else:
+            self._track_points = None
+        return results
+
+    def _track(self, image):
+        """Propagates the previous landmarks into `image`; returns LandmarkResults, or None on track loss."""
+        h, w = image.shape[:2]
+        x0, y0 = self._track_origin
+        crop_h, crop_w = self._track_gray.shape
+        gray = cv2.cvtColor(image[y0:y0 + crop_h, x0:x0 + crop_w], cv2.COLOR_BGR2GRAY)
+        if gray.shape != self._track_gray.shape:
+            return None
+
+        origin = np.array((x0, y0), dtype=np.float32)
+        previous_points = (self._track_points - origin).reshape(-1, 1, 2)
+        next_points, status, _ = cv2.calcOpticalFlowPyrLK(self._track_gray, gray, previous_points, None,
+                                                          **self.lk_params)
+        if next_points is None:
+            return None
+        next_points = next_points.reshape(-1, 2) + origin
+        status = status.reshape(-1, NUM_LANDMARKS).astype(bool)
+        inside = ((next_points[:, 0] >= 0) & (next_points[:, 0] < w) &
+                  (next_points[:, 1] >= 0) & (next_points[:, 1] < h)).reshape(-1, NUM_LANDMARKS)
+        ok = status & inside
+        # Track loss: any fingertip lost, or more than a quarter of a hand's landmarks lost
+        if not ok[:, FINGER_TIP_SLICE].all() or (ok.mean(axis=1) < 0.75).any():
+            return None
+
+        self._track_points = next_points
+        self._track_gray, self._track_origin = self._tracking_crop(image, next_points)
+
+        landmarks = np.empty((len(self._track_z), NUM_LANDMARKS, 3), dtype=np.float32)
+        landmarks[..., :2] = next_points.reshape(-1, NUM_LANDMARKS, 2) / np.array((w, h), dtype=np.float32)
+        landmarks[..., 2] = self._track_z
+        return LandmarkResults(landmarks, self._track_handedness, self._track_scores, tracked=True)
+
+    def results_to_arrays(self, results):
+        """Normalized landmark, handedness and score arrays of a MediaPipe result, as in LandmarkResults."""
+        if isinstance(results, LandmarkResults):
+            return results.landmarks, results.handedness, results.scores
+        if not results.multi_hand_landmarks:
+            empty = LandmarkResults.empty()
+            return empty.landmarks, empty.handedness, empty.scores
+
+        num_hands = min(len(results.multi_hand_landmarks), self.max_num_hands)
+        landmarks = np.array([[(lm.x, lm.y, lm.z) for lm in results.multi_hand_landmarks[i].landmark]
+                              for i in range(num_hands)], dtype=np.float32)
+        handedness = np.full(num_hands, RIGHT_HAND, dtype=np.int8)
+        scores = np.ones(num_hands, dtype=np.float32)
+        if results.multi_handedness:
+            for i in range(num_hands):
+                classification = results.multi_handedness[i].classification[0]
+                handedness[i] = LEFT_HAND if classification.label == 'Left' else RIGHT_HAND
+                scores[i] = classification.score
+        return landmarks, handedness, scores
+
+    def extract_landmarks(self, results, image_shape):
+        """
+        Converts `results.multi_hand_landmarks` into a (hands, 21, 3) float32 array in pixel units
+        (x * width, y * height, z * width) plus a (hands,) int8 array of LEFT_HAND / RIGHT_HAND.
+        `results` may also be a LandmarkResults, whose arrays are copied without per-landmark access.
+
+        Both are views into buffers owned by the tracker and are overwritten by the next call;
+        copy them if they must outlive the frame.
+        """
+        h, w = image_shape[:2]
+        if isinstance(results, LandmarkResults):
+            num_hands = min(len(results.landmarks), self.max_num_hands)
+            self._landmark_buffer[:num_hands] = results.landmarks[:num_hands]
+            self._handedness_buffer[:num_hands] = results.handedness[:num_hands]
+        elif not results.multi_hand_landmarks:
+            num_hands = 0
+        else:
+            num_hands = min(len(results.multi_hand_landmarks), self.max_num_hands)
+            for i in range(num_hands):
+                self._landmark_buffer[i] = [(lm.x, lm.y, lm.z) for lm in results.multi_hand_landmarks[i].landmark]
+                label = results.multi_handedness[i].classification[0].label if results.multi_handedness else 'Right'
+                self._handedness_buffer[i] = LEFT_HAND if label == 'Left' else RIGHT_HAND
+
+        landmarks = self._landmark_buffer[:num_hands]
+        landmarks *= np.array((w, h, w), dtype=np.float32)
+        return landmarks, self._handedness_buffer[:num_hands]
+
+    def get_finger_tips(self, landmarks):
+        """(hands, 5, 3) view of the thumb..pinky tips of an extract_landmarks() array."""
+        return landmarks[:, FINGER_TIP_SLICE]
+
     def get_index_finger_tip(self, hand_landmarks, image_shape):
         h, w, _ = image_shape
         index_finger_tip = hand_landmarks.landmark[self.mp_hands.HandLandmark.INDEX_FINGER_TIP.value]
@@ -66,5 +305,9 @@ class HandTracker:
     def draw_landmarks(self, image, hand_landmarks):
         self.mp_drawing.draw_landmarks(image, hand_landmarks, self.mp_hands.HAND_CONNECTIONS)
 
+    def get_stats(self):
+        """Frames that ran Hands and frames whose landmarks were tracked with optical flow."""
+        return {'inferred_frames': self.inferred_frames, 'tracked_frames': self.tracked_frames}
+
     def close(self):
         self.hands.close()
\ No newline at end of file
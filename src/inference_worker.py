@@ -0,0 +1,157 @@
+import collections
+import multiprocessing
+import queue
+import time
+from multiprocessing import shared_memory
+import numpy as np
+
+from src.hand_tracker import LandmarkResults
+
+
+def _inference_worker_main(shm_name, frame_shape, num_slots, task_queue, result_queue, tracker_kwargs):
+    """Worker process: runs HandTracker on frames read straight out of the shared-memory slots."""
+    from src.hand_tracker import HandTracker
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    frames = np.ndarray((num_slots,) + tuple(frame_shape), dtype=np.uint8, buffer=shm.buf)
+    hand_tracker = HandTracker(**tracker_kwargs)
+    try:
+        while True:
+            task = task_queue.get()
+            if task is None:
+                break
+            frame_id, slot = task
+            try:
+                results = hand_tracker.process_frame(frames[slot])
+                landmarks, handedness, scores = hand_tracker.results_to_arrays(results)
+            except Exception as e:
+                # The slot must still come back, or the parent waits for this frame forever
+                result_queue.put((frame_id, slot, None, None, None, False, f"{type(e).__name__}: {e}"))
+                continue
+            tracked = not hand_tracker.last_frame_inferred
+            result_queue.put((frame_id, slot, landmarks, handedness, scores, tracked, None))
+    finally:
+        hand_tracker.close()
+        del frames
+        shm.close()
+
+
+class InferencePool:
+    """
+    Runs MediaPipe Hands in worker processes so inference overlaps with capture and drawing.
+
+    `submit()` copies a frame into a free `multiprocessing.shared_memory` slot and queues its frame ID;
+    the workers read the frame in place and send back only the landmark arrays. `get_result()` returns
+    LandmarkResults strictly in submission order, holding back results that finish early. A frame
+    whose inference raised in the worker comes back as empty results with a warning; a worker that
+    died makes `get_result()` raise RuntimeError instead of waiting forever. Results carry whether
+    the worker inferred or tracked them, and the pool counts both like HandTracker.get_stats().
+
+    Each worker keeps its own Hands graph, so with several workers every graph only sees every Nth
+    frame and relies more on palm detection than on frame-to-frame tracking. For the same reason
+    optical-flow tracking (`track_interval` > 1) is turned off with more than one worker: flow between
+    a worker's frames would span N-frame gaps, and Hands would only run every N * track_interval frames.
+    """
+
+    # Seconds between checks that the workers are alive while waiting for a result
+    POLL_INTERVAL = 0.5
+
+    def __init__(self, frame_shape, num_workers=2, num_slots=None, **tracker_kwargs):
+        self.frame_shape = tuple(frame_shape)
+        self.num_workers = num_workers
+        self.num_slots = num_slots or num_workers * 2
+        frame_bytes = int(np.prod(self.frame_shape))
+        if num_workers > 1 and tracker_kwargs.get('track_interval', 1) > 1:
+            print("Warning: Optical-flow tracking is not used with several inference workers; every frame runs Hands.")
+            tracker_kwargs = {**tracker_kwargs, 'track_interval': 1}
+
+        self._shm = shared_memory.SharedMemory(create=True, size=self.num_slots * frame_bytes)
+        self._frames = np.ndarray((self.num_slots,) + self.frame_shape, dtype=np.uint8, buffer=self._shm.buf)
+        self._free_slots = collections.deque(range(self.num_slots))
+
+        context = multiprocessing.get_context('spawn')
+        self._task_queue = context.Queue()
+        self._result_queue = context.Queue()
+        self._workers = [
+            context.Process(target=_inference_worker_main,
+                            args=(self._shm.name, self.frame_shape, self.num_slots,
+                                  self._task_queue, self._result_queue, tracker_kwargs),
+                            daemon=True)
+            for _ in range(num_workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+        self._next_frame_id = 0
+        self._next_result_id = 0
+        self._finished_results = {}  # frame_id -> LandmarkResults that arrived ahead of their turn
+        self.inferred_frames = 0
+        self.tracked_frames = 0
+
+    def in_flight(self):
+        """Number of submitted frames whose result has not been returned by get_result() yet."""
+        return self._next_frame_id - self._next_result_id
+
+    def submit(self, image):
+        """Queues a frame for inference and returns its frame ID, or None if every slot is busy."""
+        if not self._free_slots:
+            return None
+        slot = self._free_slots.popleft()
+        np.copyto(self._frames[slot], image)
+        frame_id = self._next_frame_id
+        self._next_frame_id += 1
+        self._task_queue.put((frame_id, slot))
+        return frame_id
+
+    def _collect(self, timeout):
+        frame_id, slot, landmarks, handedness, scores, tracked, error = self._result_queue.get(timeout=timeout)
+        self._free_slots.append(slot)
+        if error is not None:
+            print(f"Warning: Hand inference failed on frame {frame_id} in a worker: {error}")
+            self._finished_results[frame_id] = LandmarkResults.empty(frame_id)
+            return
+        if tracked:
+            self.tracked_frames += 1
+        else:
+            self.inferred_frames += 1
+        self._finished_results[frame_id] = LandmarkResults(landmarks, handedness, scores, frame_id, tracked)
+
+    def get_stats(self):
+        """Frames the workers ran Hands on and frames they tracked with optical flow."""
+        return {'inferred_frames': self.inferred_frames, 'tracked_frames': self.tracked_frames}
+
+    def _check_workers(self):
+        for worker in self._workers:
+            if not worker.is_alive():
+                raise RuntimeError(f"Inference worker {worker.pid} died (exit code {worker.exitcode})")
+
+    def get_result(self, timeout=None):
+        """
+        Returns the LandmarkResults of the oldest outstanding frame, or None on timeout or with nothing in
+        flight. Raises RuntimeError if a worker died while waiting.
+        """
+        if self.in_flight() == 0:
+            return None
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._next_result_id not in self._finished_results:
+            # Wait in short slices so a dead worker is noticed instead of blocking forever
+            wait = self.POLL_INTERVAL if deadline is None else min(self.POLL_INTERVAL, deadline - time.monotonic())
+            try:
+                self._collect(max(wait, 0.0))
+            except queue.Empty:
+                self._check_workers()
+                if deadline is not None and time.monotonic() >= deadline:
+                    return None
+        self._next_result_id += 1
+        return self._finished_results.pop(self._next_result_id - 1)
+
+    def close(self):
+        for _ in self._workers:
+            self._task_queue.put(None)
+        for worker in self._workers:
+            worker.join(timeout=5.0)
+            if worker.is_alive():
+                worker.terminate()
+        del self._frames
+        self._shm.close()
+        self._shm.unlink()
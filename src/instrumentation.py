@@ -0,0 +1,181 @@
+import bisect
+import collections
+import json
+import os
+import threading
+import time
+
+# Histogram bucket upper edges in seconds: 20 log-spaced buckets per decade from 10 us to 10 s
+_BUCKETS_PER_DECADE = 20
+BUCKET_EDGES = [10.0 ** (-5 + i / _BUCKETS_PER_DECADE) for i in range(6 * _BUCKETS_PER_DECADE + 1)]
+
+END_TO_END = 'end_to_end'
+
+
+class LatencyHistogram:
+    """
+    Fixed-bucket latency histogram: recording is one bisect and one increment, and quantiles are
+    read from the cumulative counts (as the upper edge of the bucket holding the quantile, so they
+    are accurate to one bucket, about 12%).
+    """
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_EDGES) + 1)  # the last bucket collects everything above 10 s
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        self.counts[bisect.bisect_left(BUCKET_EDGES, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q):
+        if self.count == 0:
+            return 0.0
+        target = q * self.count
+        cumulative = 0
+        for bucket, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= target and count:
+                return min(BUCKET_EDGES[bucket], self.max) if bucket < len(BUCKET_EDGES) else self.max
+        return self.max
+
+    def summary(self):
+        """Count plus mean, p50, p95, p99 and max in milliseconds."""
+        return {
+            'count': self.count,
+            'mean_ms': self.total / self.count * 1000.0 if self.count else 0.0,
+            'p50_ms': self.quantile(0.50) * 1000.0,
+            'p95_ms': self.quantile(0.95) * 1000.0,
+            'p99_ms': self.quantile(0.99) * 1000.0,
+            'max_ms': self.max * 1000.0,
+        }
+
+
+class _Span:
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profiler.record(self.name, self.start, time.perf_counter())
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Profiler:
+    """
+    Per-stage latency instrumentation.
+
+    `with profiler.span('stage'):` times a block with the monotonic `time.perf_counter` clock and
+    adds the duration to that stage's LatencyHistogram. While a trace window is open
+    (`start_trace()` .. `stop_trace()`) every span is also kept as a Chrome `trace_event` complete
+    event, written with `save_chrome_trace()` for chrome://tracing or Perfetto.
+
+    A disabled profiler hands out one shared no-op span, so instrumented code costs a method call
+    and an empty `with` block per stage. Spans may be recorded from several threads, as long as
+    each stage name is only recorded from one of them.
+    """
+
+    def __init__(self, enabled=False, trace_capacity=200000):
+        self.enabled = enabled
+        self.histograms = {}
+        self._trace_events = collections.deque(maxlen=trace_capacity)
+        self._tracing = False
+        self._trace_end = None
+        self._thread_names = {}
+
+    def span(self, name):
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name)
+
+    def _histogram(self, name):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms.setdefault(name, LatencyHistogram())
+        return histogram
+
+    def record(self, name, start, end):
+        """Adds a span measured with `time.perf_counter` to the stage's histogram (and the trace)."""
+        if not self.enabled:
+            return
+        self._histogram(name).record(end - start)
+        if self._tracing:
+            if self._trace_end is not None and start > self._trace_end:
+                self._tracing = False
+                return
+            thread = threading.current_thread()
+            self._thread_names.setdefault(thread.ident, thread.name)
+            self._trace_events.append((name, start, end - start, thread.ident))
+
+    def record_latency(self, name, seconds):
+        """Adds a latency measured by other means (no trace event)."""
+        if self.enabled:
+            self._histogram(name).record(seconds)
+
+    def record_end_to_end(self, frame_timestamp_ms):
+        """
+        Records the time from the capture of a frame with a system-clock timestamp (RealSense global
+        time, in ms since the epoch) until now.
+        """
+        if self.enabled:
+            self._histogram(END_TO_END).record(max(0.0, time.time() - frame_timestamp_ms / 1000.0))
+
+    # --- Chrome trace ---
+    def start_trace(self, duration=None):
+        """Starts keeping trace events, for `duration` seconds if given, otherwise until stop_trace()."""
+        self._trace_events.clear()
+        self._trace_end = time.perf_counter() + duration if duration is not None else None
+        self._tracing = self.enabled
+
+    def stop_trace(self):
+        self._tracing = False
+
+    def save_chrome_trace(self, filename):
+        pid = os.getpid()
+        events = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': thread_name}}
+                  for tid, thread_name in self._thread_names.items()]
+        events.extend({'name': name, 'cat': 'stage', 'ph': 'X', 'pid': pid, 'tid': tid,
+                       'ts': start * 1e6, 'dur': duration * 1e6}
+                      for name, start, duration, tid in list(self._trace_events))
+        directory = os.path.dirname(filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(filename, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+        print(f"Wrote {len(events)} trace event(s) to '{filename}'")
+
+    # --- Reporting ---
+    def summary(self):
+        # Copied in one step so stages added concurrently cannot break the iteration
+        return {name: histogram.summary() for name, histogram in self.histograms.copy().items()}
+
+    def print_summary(self):
+        if not self.histograms:
+            return
+        print(f"{'stage':<16}{'count':>8}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}  (ms)")
+        for name, stats in self.summary().items():
+            print(f"{name:<16}{stats['count']:>8}{stats['mean_ms']:>10.2f}{stats['p50_ms']:>10.2f}"
+                  f"{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}{stats['max_ms']:>10.2f}")
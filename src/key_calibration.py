@@ -0,0 +1,240 @@
+import json
+import math
+import os
+import numpy as np
+
+from src.keyboard_manager import save_thresholds
+
+
+class RunningStats:
+    """Welford's online mean and variance for a batch of independent streams (one per key)."""
+
+    def __init__(self, size):
+        self.count = np.zeros(size, dtype=np.int64)
+        self.mean = np.zeros(size, dtype=np.float64)
+        self._m2 = np.zeros(size, dtype=np.float64)
+
+    def update(self, index, value):
+        self.count[index] += 1
+        delta = value - self.mean[index]
+        self.mean[index] += delta / self.count[index]
+        self._m2[index] += delta * (value - self.mean[index])
+
+    @property
+    def std(self):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(self.count > 1, np.sqrt(self._m2 / np.maximum(self.count - 1, 1)), np.nan)
+
+
+class P2Quantile:
+    """
+    Streaming estimate of the `q` quantile with the P-square algorithm (Jain and Chlamtac, 1985): five
+    markers whose heights are adjusted with a piecewise-parabolic fit as samples arrive, so memory is
+    constant however long the stream. Exact until five samples have been seen.
+    """
+
+    def __init__(self, q):
+        self.q = q
+        self.count = 0
+        self._heights = []
+        self._positions = [1.0, 2.0, 3.0, 4.0, 5.0]
+        self._desired = [1.0, 1.0 + 2.0 * q, 1.0 + 4.0 * q, 3.0 + 2.0 * q, 5.0]
+        self._increments = [0.0, q / 2.0, q, (1.0 + q) / 2.0, 1.0]
+
+    def update(self, value):
+        self.count += 1
+        heights = self._heights
+        if self.count <= 5:
+            heights.append(value)
+            heights.sort()
+            return
+
+        # Cell of the new sample, stretching the extreme markers if it falls outside them
+        if value < heights[0]:
+            heights[0] = value
+            cell = 0
+        elif value >= heights[4]:
+            heights[4] = value
+            cell = 3
+        else:
+            cell = next(i for i in range(4) if heights[i] <= value < heights[i + 1])
+        positions = self._positions
+        for i in range(cell + 1, 5):
+            positions[i] += 1.0
+        for i in range(5):
+            self._desired[i] += self._increments[i]
+
+        # Move the three middle markers towards their desired positions
+        for i in range(1, 4):
+            offset = self._desired[i] - positions[i]
+            if ((offset >= 1.0 and positions[i + 1] - positions[i] > 1.0) or
+                    (offset <= -1.0 and positions[i - 1] - positions[i] < -1.0)):
+                step = 1.0 if offset > 0 else -1.0
+                height = self._parabolic(i, step)
+                if not heights[i - 1] < height < heights[i + 1]:
+                    height = heights[i] + step * (heights[i + int(step)] - heights[i]) / (positions[i + int(step)] - positions[i])
+                heights[i] = height
+                positions[i] += step
+
+    def _parabolic(self, i, step):
+        heights, positions = self._heights, self._positions
+        return heights[i] + step / (positions[i + 1] - positions[i - 1]) * (
+            (positions[i] - positions[i - 1] + step) * (heights[i + 1] - heights[i]) / (positions[i + 1] - positions[i]) +
+            (positions[i + 1] - positions[i] - step) * (heights[i] - heights[i - 1]) / (positions[i] - positions[i - 1]))
+
+    def value(self):
+        if not self.count:
+            return math.nan
+        if self.count <= 5:
+            # Linear interpolation between the sorted samples, like np.quantile
+            position = self.q * (self.count - 1)
+            lower = int(position)
+            upper = min(lower + 1, self.count - 1)
+            return self._heights[lower] + (self._heights[upper] - self._heights[lower]) * (position - lower)
+        return self._heights[2]
+
+
+class KeyCalibrator:
+    """
+    Streaming per-key depth thresholds from fingertips typing over the annotated layout.
+
+    Each fingertip slot (as in TapDetector) is followed through its keystrokes: it is "down" once it
+    has moved at least `min_stroke` metres deeper than where it hovered, and "up" again once it has
+    lifted `min_stroke` from the deepest point of the stroke. Where it hovered is the shallowest recent
+    depth: it follows the finger up at once and drifts back down by `hover_decay` of the gap every
+    frame, so a finger that rose high once (say, as the hands came in) does not turn every later rest
+    into a stroke. A finger still down after `max_stroke_frames` frames is resting, not typing; that
+    stroke is dropped. So fingers resting above the home row never make a stroke. The samples of a
+    stroke within `contact_window` of its deepest point are its contacts; they are held per finger
+    until the stroke ends (at most `max_stroke_samples`). Each sample is credited to the key that was
+    under the fingertip when it was taken, so a stroke that slides across a key edge feeds both keys.
+
+    Per key, contact depths go into a Welford mean/variance and two quantile sketches. A key's
+    [min, max) threshold is the `low_quantile` of its contact depths minus `margin` and the
+    `high_quantile` plus `margin`, once it has `min_samples` contact samples. Memory is constant per
+    key, however long the session.
+    """
+
+    def __init__(self, key_names, num_fingers=10, min_stroke=0.006, contact_window=0.004, low_quantile=0.05,
+                 high_quantile=0.95, margin=0.003, min_samples=3, max_stroke_samples=30, hover_decay=0.1,
+                 max_stroke_frames=20):
+        self.key_names = list(key_names)
+        self.num_fingers = num_fingers
+        self.min_stroke = min_stroke
+        self.contact_window = contact_window
+        self.low_quantile = low_quantile
+        self.high_quantile = high_quantile
+        self.margin = margin
+        self.min_samples = min_samples
+        self.max_stroke_samples = max_stroke_samples
+        self.hover_decay = hover_decay
+        self.max_stroke_frames = max_stroke_frames
+        self.reset()
+
+    def reset(self):
+        num_keys = len(self.key_names)
+        self.strokes = np.zeros(num_keys, dtype=np.int64)
+        self.contact_stats = RunningStats(num_keys)
+        self._contact_low = [P2Quantile(self.low_quantile) for _ in range(num_keys)]
+        self._contact_high = [P2Quantile(self.high_quantile) for _ in range(num_keys)]
+        # --- Per-finger stroke state ---
+        self.finger_down = np.zeros(self.num_fingers, dtype=bool)
+        self._hover_depth = np.full(self.num_fingers, np.inf)   # shallowest recent depth while up
+        self._stroke_depth = np.zeros(self.num_fingers)         # deepest depth while down
+        self._stroke_frames = np.zeros(self.num_fingers, dtype=np.int64)  # frames down in this stroke
+        self._stroke_samples = [[] for _ in range(self.num_fingers)]  # (key, depth) near the stroke bottom
+
+    def update(self, key_ids, depths, valid):
+        """
+        Adds one frame of the `num_fingers` fingertip slots: the key under each (-1 for none), their
+        depths in metres and which of them were detected with a depth.
+        """
+        key_ids = np.asarray(key_ids).reshape(-1)
+        depths = np.asarray(depths, dtype=np.float64).reshape(-1)
+        valid = np.asarray(valid, dtype=bool).reshape(-1) & (depths > 0)
+
+        up = valid & ~self.finger_down
+        decayed = (1.0 - self.hover_decay) * self._hover_depth[up] + self.hover_decay * depths[up]
+        self._hover_depth[up] = np.minimum(decayed, depths[up])
+        pressed = up & (depths - self._hover_depth >= self.min_stroke)
+        self.finger_down[pressed] = True
+        self._stroke_depth[pressed] = depths[pressed]
+        self._stroke_frames[pressed] = 0
+        down = valid & self.finger_down
+        self._stroke_depth[down] = np.maximum(self._stroke_depth[down], depths[down])
+        self._stroke_frames[down] += 1
+
+        # Down for too long: a resting finger, whose depths are no keystroke's; it hovers from here
+        resting = down & (self._stroke_frames > self.max_stroke_frames)
+        for finger in np.flatnonzero(resting).tolist():
+            self._stroke_samples[finger].clear()
+        self.finger_down[resting] = False
+        self._hover_depth[resting] = depths[resting]
+        down &= ~resting
+        # A stroke ends when the finger lifts or is lost; a lost finger starts over, hovering
+        lifted = down & (self._stroke_depth - depths >= self.min_stroke)
+        lost = ~valid
+        for finger in np.flatnonzero(lifted | (lost & self.finger_down)).tolist():
+            self._finish_stroke(finger)
+        self.finger_down[lifted | lost] = False
+        self._hover_depth[lifted] = depths[lifted]
+        self._hover_depth[lost] = np.inf
+
+        for finger in np.flatnonzero(down & ~lifted).tolist():
+            samples = self._stroke_samples[finger]
+            bottom = self._stroke_depth[finger] - self.contact_window
+            if samples and samples[0][1] < bottom:
+                # The stroke went deeper; samples no longer near its bottom can never count again
+                samples[:] = [sample for sample in samples if sample[1] >= bottom]
+            if len(samples) < self.max_stroke_samples:
+                samples.append((int(key_ids[finger]), float(depths[finger])))
+
+    def _finish_stroke(self, finger):
+        samples = self._stroke_samples[finger]
+        bottom = self._stroke_depth[finger] - self.contact_window
+        keys = set()
+        for key, depth in samples:
+            if key >= 0 and depth >= bottom:
+                self.contact_stats.update(key, depth)
+                self._contact_low[key].update(depth)
+                self._contact_high[key].update(depth)
+                keys.add(key)
+        for key in keys:
+            self.strokes[key] += 1
+        samples.clear()
+
+    @property
+    def calibrated(self):
+        """Mask of the keys with enough contact samples for a threshold."""
+        return self.contact_stats.count >= self.min_samples
+
+    def thresholds(self):
+        """{key_name: [min, max]} in metres for every calibrated key."""
+        thresholds = {}
+        for key in np.flatnonzero(self.calibrated).tolist():
+            low = self._contact_low[key].value() - self.margin
+            high = self._contact_high[key].value() + self.margin
+            thresholds[self.key_names[key]] = [round(low, 4), round(high, 4)]
+        return thresholds
+
+    def summary(self):
+        """(key_name, strokes, contact samples, contact mean, contact std) for every key that was pressed."""
+        std = self.contact_stats.std
+        return [(name, int(self.strokes[key]), int(self.contact_stats.count[key]), float(self.contact_stats.mean[key]),
+                 float(std[key])) for key, name in enumerate(self.key_names) if self.strokes[key]]
+
+    def save(self, filename):
+        """
+        Writes the thresholds in the assets/key_thresholds.json format. Keys that are not calibrated yet
+        keep the thresholds already in the file, if any.
+        """
+        thresholds = {}
+        if os.path.exists(filename):
+            with open(filename, 'r') as f:
+                thresholds = json.load(f)
+        calibrated = self.thresholds()
+        thresholds.update(calibrated)
+        save_thresholds(filename, thresholds)
+        print(f"Saved thresholds for {len(calibrated)} calibrated key(s) to '{filename}' "
+              f"({len(thresholds) - len(calibrated)} kept from the previous file)")
+        return calibrated
@@ -0,0 +1,165 @@
+import collections
+import threading
+import time
+from pynput.keyboard import Controller, Key
+
+from src.instrumentation import Profiler
+
+# --- pynput Key Mapping ---
+# Maps string representations from your JSON to pynput's Key objects
+KEY_MAP = {
+    "BACKSPACE": Key.backspace,
+    "ENTER": Key.enter,
+    "SPACE": Key.space,
+    "SHIFT": Key.shift,
+    "CTRL": Key.ctrl,
+    "ALT": Key.alt,
+    "WIN": Key.cmd,  # 'cmd' is used for the Windows key in pynput
+    "ESC": Key.esc,
+    "DEL": Key.delete,
+    "UP": Key.up,
+    "DOWN": Key.down,
+    "LEFT": Key.left,
+    "RIGHT": Key.right,
+    "TAB": Key.tab,
+    "CAPS": Key.caps_lock,
+}
+
+PRESS = True
+RELEASE = False
+
+
+def to_pynput_key(key_str):
+    """pynput key for an annotated key name, or None if the key cannot be typed."""
+    if key_str in KEY_MAP:
+        return KEY_MAP[key_str]
+    if len(key_str) == 1:  # Handle standard characters
+        return key_str.lower()
+    return None
+
+
+class KeyInjector:
+    """
+    Sends key presses and releases to the OS from a dedicated thread.
+
+    The detection loop only appends timestamped (is_press, key, timestamp) events to a deque, which
+    never blocks; the injector thread drains everything queued so far and calls pynput, so a slow
+    injection (an X11 round-trip, a focus change) delays typing but never the vision loop.
+    Transitions that would not change the key state (pressing a held key, releasing a key that is up)
+    are coalesced away, and every key still held is released by `close()`.
+
+    `get_stats()` reports the queue depth and the enqueue-to-injection latency; with a `profiler` the
+    pynput calls are also timed as the 'inject' stage and the queueing delay as 'inject_queue'.
+    """
+
+    def __init__(self, controller=None, profiler=None):
+        self.controller = controller if controller is not None else Controller()
+        self.profiler = profiler if profiler is not None else Profiler()
+        self._events = collections.deque()
+        self._wakeup = threading.Event()
+        self._running = True
+        self._pressed_keys = set()  # keys the detection loop last reported as pressed
+        self._held_keys = set()  # keys currently held down in the OS (injector thread only)
+
+        # --- Stats ---
+        self.events_queued = 0
+        self.events_injected = 0
+        self.events_coalesced = 0
+        self.max_queue_depth = 0
+        self.last_latency = 0.0
+        self.max_latency = 0.0
+        self._total_latency = 0.0
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def press(self, key_str, timestamp=None):
+        self._push(PRESS, key_str, timestamp)
+
+    def release(self, key_str, timestamp=None):
+        self._push(RELEASE, key_str, timestamp)
+
+    def _push(self, is_press, key_str, timestamp):
+        self._events.append((is_press, key_str, time.perf_counter() if timestamp is None else timestamp))
+        self.events_queued += 1
+        self.max_queue_depth = max(self.max_queue_depth, len(self._events))
+        self._wakeup.set()
+
+    def update(self, pressed_keys):
+        """
+        Queues the presses and releases that turn the last reported set of pressed keys into `pressed_keys`
+        and returns the number of new presses.
+        """
+        timestamp = time.perf_counter()
+        newly_pressed = pressed_keys - self._pressed_keys
+        for key_str in newly_pressed:
+            self.press(key_str, timestamp)
+        for key_str in self._pressed_keys - pressed_keys:
+            self.release(key_str, timestamp)
+        self._pressed_keys = set(pressed_keys)
+        return len(newly_pressed)
+
+    def _run(self):
+        while self._running or self._events:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            while self._events:
+                self._inject(*self._events.popleft())
+
+    def _inject(self, is_press, key_str, timestamp):
+        if is_press == (key_str in self._held_keys):
+            self.events_coalesced += 1
+            return
+        key = to_pynput_key(key_str)
+        self.profiler.record_latency('inject_queue', time.perf_counter() - timestamp)
+        try:
+            if key is not None:
+                with self.profiler.span('inject'):
+                    if is_press:
+                        self.controller.press(key)
+                    else:
+                        self.controller.release(key)
+        except Exception as e:
+            print(f"Could not {'press' if is_press else 'release'} key '{key_str}': {e}")
+        if is_press:
+            self._held_keys.add(key_str)
+        else:
+            self._held_keys.discard(key_str)
+
+        latency = time.perf_counter() - timestamp
+        self.events_injected += 1
+        self.last_latency = latency
+        self.max_latency = max(self.max_latency, latency)
+        self._total_latency += latency
+
+    def get_stats(self):
+        injected = self.events_injected
+        return {
+            'queue_depth': len(self._events),
+            'max_queue_depth': self.max_queue_depth,
+            'events_queued': self.events_queued,
+            'events_injected': injected,
+            'events_coalesced': self.events_coalesced,
+            'mean_latency_ms': self._total_latency / injected * 1000.0 if injected else 0.0,
+            'max_latency_ms': self.max_latency * 1000.0,
+        }
+
+    def close(self, timeout=2.0):
+        """Injects the queued events, stops the thread and releases every key still held."""
+        for key_str in self._pressed_keys:
+            self.release(key_str)
+        self._pressed_keys = set()
+        self._running = False
+        self._wakeup.set()
+        self._thread.join(timeout=timeout)
+        if self._thread.is_alive():
+            print("Warning: Key injector did not stop in time; releasing held keys from the caller.")
+        # Anything the thread did not get to, so no key can stay stuck down
+        for key_str in list(self._held_keys):
+            key = to_pynput_key(key_str)
+            try:
+                if key is not None:
+                    self.controller.release(key)
+            except Exception as e:
+                print(f"Could not release key '{key_str}' during cleanup: {e}")
+        self._held_keys.clear()
@@ -3,7 +3,10 @@ import numpy as np
 import cv2
 import json
 import os
-from camera_manager import CameraManager # Import CameraManager
+import sys
+# Make the `src` package importable when this tool is run from inside the src directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.camera_manager import CameraManager # Import CameraManager
 
 # --- Configuration for RealSense Camera ---
 # Initialize CameraManager
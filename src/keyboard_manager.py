@@ -3,11 +3,120 @@ import os
 import numpy as np
 import cv2
 
+from src.layout_cache import hash_layout_sources, load_compiled_layout, save_compiled_layout
+
+# --- Default layout files, shared by main.py and every tool that loads the same keyboard ---
+ANNOTATION_FILENAME = 'assets/keyboard_annotations.json'
+THRESHOLDS_FILENAME = 'assets/key_thresholds.json'
+LAYOUT_CACHE_DIR = 'assets/.layout_cache'
+POINTS_PER_KEY = 4
+
+
+def save_thresholds(filename, thresholds):
+    """
+    Writes a {key: [min, max]} dict as a thresholds JSON that `KeyboardManager` loads, one key per line.
+    The file is written next to `filename` and moved over it, so the thresholds already there are never
+    left half-overwritten.
+    """
+    directory = os.path.dirname(filename)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    lines = [f"    {json.dumps(name)}: [{low}, {high}]" for name, (low, high) in thresholds.items()]
+    temp_filename = f"{filename}.tmp{os.getpid()}"
+    try:
+        with open(temp_filename, 'w') as f:
+            f.write("{\n" + ",\n".join(lines) + "\n}\n")
+        os.replace(temp_filename, filename)
+    finally:
+        if os.path.exists(temp_filename):
+            os.remove(temp_filename)
+
 class KeyboardManager:
-    def __init__(self, annotation_filename='src/keyboard_annotations.json', points_per_key=4):
+    def __init__(self, annotation_filename='src/keyboard_annotations.json', points_per_key=4, frame_size=(1280, 720),
+                 thresholds_filename=None, cache_dir=None):
         self.annotation_filename = annotation_filename
         self.points_per_key = points_per_key
+        self.frame_size = frame_size
+        self.thresholds_filename = thresholds_filename
+        self.cache_dir = cache_dir
+        self.thresholds_loaded = False
+
+        # The compiled layout (polygons, centroids, per-key depth thresholds and the hit-test raster) is
+        # cached in `cache_dir` keyed by a hash of the source JSON files, and memory-mapped when it matches.
+        layout_hash = None
+        if cache_dir:
+            layout_hash = hash_layout_sources([annotation_filename, thresholds_filename],
+                                              points_per_key=points_per_key, frame_size=list(frame_size))
+            compiled = load_compiled_layout(cache_dir, layout_hash)
+            if compiled is not None:
+                self._use_compiled_layout(*compiled)
+                print(f"Loaded compiled layout with {len(self.key_names)} key(s) from {cache_dir}")
+                return
+
         self.annotated_keys = self._load_annotations()
+        self.key_names = [key_data['key'] for key_data in self.annotated_keys]
+        self.key_polygons = np.array([[[p['x'], p['y']] for p in key_data['points']] for key_data in self.annotated_keys],
+                                     dtype=np.int32).reshape(-1, points_per_key, 2)
+        self.key_centroids = self.key_polygons.mean(axis=1, dtype=np.float32)
+        self.key_min_depths, self.key_max_depths = self._load_thresholds()
+        self.label_map, self.edge_map = self._compile_label_map()
+
+        if cache_dir and self.annotated_keys:
+            save_compiled_layout(cache_dir, layout_hash, self.key_names, {
+                'key_polygons': self.key_polygons,
+                'key_centroids': self.key_centroids,
+                'key_min_depths': self.key_min_depths,
+                'key_max_depths': self.key_max_depths,
+                'label_map': self.label_map,
+                'edge_map': self.edge_map,
+            })
+
+    def _use_compiled_layout(self, key_names, arrays):
+        self.key_names = key_names
+        for name, array in arrays.items():
+            setattr(self, name, array)
+        self.annotated_keys = [{'key': name, 'points': [{'x': int(x), 'y': int(y)} for x, y in polygon]}
+                               for name, polygon in zip(key_names, self.key_polygons.tolist())]
+        self.thresholds_loaded = bool(np.isfinite(self.key_min_depths).any())
+
+    def _load_thresholds(self):
+        """Per-key [min, max) press depths in metres from the thresholds JSON, NaN for keys without one."""
+        min_depths = np.full(len(self.key_names), np.nan, dtype=np.float32)
+        max_depths = np.full(len(self.key_names), np.nan, dtype=np.float32)
+        if not self.thresholds_filename:
+            return min_depths, max_depths
+        try:
+            with open(self.thresholds_filename, 'r') as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"Error loading thresholds: {e}")
+            return min_depths, max_depths
+
+        for index, key_name in enumerate(self.key_names):
+            if key_name in data:
+                min_depths[index], max_depths[index] = data[key_name]
+        self.thresholds_loaded = True
+        print(f"Successfully loaded key thresholds from '{self.thresholds_filename}'.")
+        return min_depths, max_depths
+
+    def _compile_label_map(self):
+        """
+        Rasterizes the layout once: `label_map[y, x]` holds key index + 1 (0 = no key) and `edge_map`
+        marks pixels on any key outline, where the raster cannot tell neighbouring keys apart.
+        Keys are filled last-to-first so that, as in the per-key loop, the first annotated key wins.
+        """
+        width, height = self.frame_size
+        if len(self.key_polygons):
+            # Grow the raster if annotations reach past the frame size
+            width = max(width, int(self.key_polygons[..., 0].max()) + 1)
+            height = max(height, int(self.key_polygons[..., 1].max()) + 1)
+        dtype = np.uint8 if len(self.key_polygons) < np.iinfo(np.uint8).max else np.uint16
+        label_map = np.zeros((height, width), dtype=dtype)
+        edge_map = np.zeros((height, width), dtype=np.uint8)
+        for index in range(len(self.key_polygons) - 1, -1, -1):
+            cv2.fillPoly(label_map, [self.key_polygons[index]], index + 1)
+        cv2.polylines(edge_map, list(self.key_polygons), True, 1, 1)
+        return label_map, edge_map.astype(bool)
 
     def _load_annotations(self):
         if os.path.exists(self.annotation_filename):
@@ -29,6 +138,26 @@ class KeyboardManager:
     def get_annotated_keys(self):
         return self.annotated_keys
 
+    def get_key_thresholds(self):
+        """(min_depths, max_depths) arrays indexed like `key_names`; NaN where a key has no threshold."""
+        return self.key_min_depths, self.key_max_depths
+
+    def get_keyboard_bbox(self, margin=0, image_size=None):
+        """
+        Bounding box (x0, y0, x1, y1) of all annotated keys grown by `margin` pixels, with x1/y1 exclusive.
+        Clamped to `image_size` (width, height) when given. Returns None when there are no keys.
+        """
+        if not self.annotated_keys:
+            return None
+        points = np.array([[p['x'], p['y']] for key_data in self.annotated_keys for p in key_data['points']])
+        x0, y0 = points.min(axis=0) - margin
+        x1, y1 = points.max(axis=0) + margin + 1
+        if image_size is not None:
+            width, height = image_size
+            x0, y0 = max(0, x0), max(0, y0)
+            x1, y1 = min(width, x1), min(height, y1)
+        return int(x0), int(y0), int(x1), int(y1)
+
     def is_point_in_keycap(self, finger_point, key_data):
         key_points_list = key_data['points']
 
@@ -36,4 +165,26 @@ class KeyboardManager:
             key_polygon = np.array([[p['x'], p['y']] for p in key_points_list], np.int32)
             # Check if the finger tip is inside the current keycap's polygon
             return cv2.pointPolygonTest(key_polygon, finger_point, False) >= 0
-        return False
\ No newline at end of file
+        return False
+
+    def keys_at(self, points):
+        """
+        Key index (into `annotated_keys` / `key_names`) under each of the (N, 2) pixel `points`, -1 for none.
+        One lookup in the precompiled label map; points on a key outline fall back to exact polygon tests.
+        """
+        points = np.asarray(points).reshape(-1, 2).astype(np.intp)
+        height, width = self.label_map.shape
+        inside = (points[:, 0] >= 0) & (points[:, 0] < width) & (points[:, 1] >= 0) & (points[:, 1] < height)
+        xs = np.where(inside, points[:, 0], 0)
+        ys = np.where(inside, points[:, 1], 0)
+        key_ids = np.where(inside, self.label_map[ys, xs].astype(np.intp) - 1, -1)
+
+        for i in np.flatnonzero(inside & self.edge_map[ys, xs]):
+            point = (float(points[i, 0]), float(points[i, 1]))
+            key_ids[i] = next((index for index, polygon in enumerate(self.key_polygons)
+                               if cv2.pointPolygonTest(polygon, point, False) >= 0), -1)
+        return key_ids
+
+    def key_at(self, point):
+        """Index of the key under a single (x, y) point, or -1."""
+        return int(self.keys_at((point,))[0])
\ No newline at end of file
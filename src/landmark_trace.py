@@ -0,0 +1,248 @@
+import json
+import os
+import numpy as np
+
+
+# Same values as in src.hand_tracker and src.key_injector, repeated so that reading and replaying a
+# trace needs neither MediaPipe nor pynput
+NUM_LANDMARKS = 21
+FINGER_TIP_SLICE = slice(4, NUM_LANDMARKS, 4)
+PRESS = True
+RELEASE = False
+
+# On-disk layout of a landmark trace directory (one file per column, chunked like a FrameRecorder
+# recording; about 18 KB per second at 30 fps):
+#   meta.json                   - max hands, image size, key names and the list of chunks
+#   timestamps_00000.npy ...    - (chunk_frames,) float64 camera frame timestamps in ms
+#   num_hands_00000.npy         - (chunk_frames,) uint8 hands detected in the frame
+#   inferred_00000.npy          - (chunk_frames,) bool whether hand inference ran on the frame; on frames
+#                                 without it the live key events did not come from these landmarks
+#   tracked_00000.npy           - (chunk_frames,) bool whether the landmarks were tracked with optical
+#                                 flow instead of inferred (only on inferred frames)
+#   landmarks_00000.npy         - (chunk_frames, max_hands, 21, 3) float32 pixel landmarks (x, y, z * width)
+#   handedness_00000.npy        - (chunk_frames, max_hands) int8 LEFT_HAND / RIGHT_HAND
+#   tip_depths_00000.npy        - (chunk_frames, max_hands * 5) float32 sampled fingertip depths in metres
+#   tip_heights_00000.npy       - (chunk_frames, max_hands * 5) float32 fingertip heights above the
+#                                 surface model in metres, NaN without one
+#   event_frames_00000.npy      - (events,) int64 trace frame index of each emitted key event
+#   event_keys_00000.npy        - (events,) int16 index into meta['key_names']
+#   event_presses_00000.npy     - (events,) bool PRESS / RELEASE
+# Only the first num_hands hands of a frame, and their fingertips, hold data.
+META_FILENAME = 'meta.json'
+FORMAT_VERSION = 3
+FRAME_COLUMNS = ('timestamps', 'num_hands', 'inferred', 'tracked', 'landmarks', 'handedness', 'tip_depths',
+                 'tip_heights')
+EVENT_COLUMNS = ('event_frames', 'event_keys', 'event_presses')
+FINGERS_PER_HAND = 5
+
+
+def chunk_filename(kind, chunk_index):
+    return f"{kind}_{chunk_index:05d}.npy"
+
+
+def key_events_between(previous_keys, current_keys):
+    """(key_name, PRESS / RELEASE) events that turn the set of pressed keys `previous_keys` into `current_keys`."""
+    return ([(key_str, PRESS) for key_str in current_keys - previous_keys] +
+            [(key_str, RELEASE) for key_str in previous_keys - current_keys])
+
+
+class LandmarkTraceRecorder:
+    """
+    Writes what the detection logic consumes per frame (landmarks, handedness, sampled fingertip
+    depths and heights, the frame timestamp) plus the key events it emitted into a chunked, columnar
+    trace. Frame columns are written through memory maps; a chunk's key events are written when it
+    is full.
+    """
+
+    def __init__(self, path, image_size, key_names, max_hands=2, chunk_frames=1800):
+        self.path = path
+        self.image_size = tuple(image_size)
+        self.key_names = list(key_names)
+        self.max_hands = max_hands
+        self.chunk_frames = chunk_frames
+        self.frame_count = 0
+        self.event_count = 0
+        self._key_index = {name: index for index, name in enumerate(self.key_names)}
+        self._chunks = []
+        self._columns = None
+        self._events = []
+        self._chunk_fill = 0
+        os.makedirs(path, exist_ok=True)
+
+    def _open_chunk(self):
+        chunk_index = len(self._chunks)
+        num_tips = self.max_hands * FINGERS_PER_HAND
+        shapes = {
+            'timestamps': (np.float64, ()),
+            'num_hands': (np.uint8, ()),
+            'inferred': (bool, ()),
+            'tracked': (bool, ()),
+            'landmarks': (np.float32, (self.max_hands, NUM_LANDMARKS, 3)),
+            'handedness': (np.int8, (self.max_hands,)),
+            'tip_depths': (np.float32, (num_tips,)),
+            'tip_heights': (np.float32, (num_tips,)),
+        }
+        self._columns = {kind: np.lib.format.open_memmap(os.path.join(self.path, chunk_filename(kind, chunk_index)),
+                                                         mode='w+', dtype=dtype, shape=(self.chunk_frames,) + shape)
+                         for kind, (dtype, shape) in shapes.items()}
+        self._chunks.append({'index': chunk_index, 'frames': 0, 'events': 0})
+        self._events = []
+        self._chunk_fill = 0
+
+    def _flush_chunk(self):
+        if self._columns is None:
+            return
+        for column in self._columns.values():
+            column.flush()
+        chunk = self._chunks[-1]
+        events = np.array(self._events, dtype=np.int64).reshape(-1, 3)
+        for kind, values in zip(EVENT_COLUMNS, (events[:, 0], events[:, 1].astype(np.int16), events[:, 2].astype(bool))):
+            np.save(os.path.join(self.path, chunk_filename(kind, chunk['index'])), values)
+        chunk['frames'] = self._chunk_fill
+        chunk['events'] = len(events)
+        self._write_meta()
+
+    def _write_meta(self):
+        meta = {
+            'version': FORMAT_VERSION,
+            'max_hands': self.max_hands,
+            'image_size': list(self.image_size),
+            'chunk_frames': self.chunk_frames,
+            'frame_count': self.frame_count,
+            'event_count': self.event_count,
+            'key_names': self.key_names,
+            'chunks': self._chunks,
+        }
+        with open(os.path.join(self.path, META_FILENAME), 'w') as f:
+            json.dump(meta, f, indent=4)
+
+    def write(self, timestamp_ms, landmarks, handedness, tip_depths=None, tip_heights=None, key_events=(),
+              inferred=True, tracked=False):
+        """
+        Appends one frame: `landmarks` (hands, 21, 3) and `handedness` (hands,) as returned by
+        `HandTracker.extract_landmarks()`, `tip_depths` / `tip_heights` for their (hands * 5) fingertips
+        (None if not measured), the (key_name, PRESS / RELEASE) events emitted for this frame and
+        whether hand inference ran on it (False for frames the motion gate skipped)
+        and whether its landmarks were tracked with optical flow.
+        """
+        if self._columns is None or self._chunk_fill == self.chunk_frames:
+            self._flush_chunk()
+            self._open_chunk()
+
+        i = self._chunk_fill
+        num_hands = min(len(landmarks), self.max_hands)
+        num_tips = num_hands * FINGERS_PER_HAND
+        columns = self._columns
+        columns['timestamps'][i] = timestamp_ms
+        columns['num_hands'][i] = num_hands
+        columns['inferred'][i] = inferred
+        columns['tracked'][i] = tracked
+        columns['landmarks'][i, :num_hands] = landmarks[:num_hands]
+        columns['handedness'][i, :num_hands] = handedness[:num_hands]
+        columns['tip_depths'][i, :num_tips] = tip_depths[:num_tips] if tip_depths is not None else 0.0
+        columns['tip_heights'][i, :num_tips] = tip_heights[:num_tips] if tip_heights is not None else np.nan
+        for key_str, is_press in key_events:
+            key_index = self._key_index.get(key_str)
+            if key_index is not None:
+                self._events.append((self.frame_count, key_index, is_press))
+                self.event_count += 1
+        self._chunk_fill += 1
+        self.frame_count += 1
+
+    def close(self):
+        self._flush_chunk()
+        self._columns = None
+        print(f"Recorded {self.frame_count} frame(s) and {self.event_count} key event(s) to '{self.path}'")
+
+
+class LandmarkTrace:
+    """
+    A trace written by `LandmarkTraceRecorder`, with every column concatenated over its chunks.
+
+    Frame columns are (frame_count, ...) arrays under the names in FRAME_COLUMNS, so detection logic
+    can be re-run over a whole trace in a few array operations. Columns of a single-chunk trace are
+    memory-mapped read-only views.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, META_FILENAME), 'r') as f:
+            self.meta = json.load(f)
+        version = self.meta.get('version')
+        if version not in (1, 2, FORMAT_VERSION):
+            raise ValueError(f"Unsupported landmark trace format version {version} in '{path}'")
+        self.key_names = self.meta['key_names']
+        self.max_hands = self.meta['max_hands']
+        self.image_size = tuple(self.meta['image_size'])
+
+        chunks = [chunk for chunk in self.meta['chunks'] if chunk['frames']]
+        if not chunks:
+            raise ValueError(f"Landmark trace in '{path}' has no frames")
+        columns = {}
+        for kind in FRAME_COLUMNS:
+            if (kind == 'inferred' and version < 2) or (kind == 'tracked' and version < 3):
+                # Older traces predate the column: they count as inferred, and not tracked, on every frame
+                columns[kind] = np.full(sum(chunk['frames'] for chunk in chunks), kind == 'inferred')
+                continue
+            parts = [np.load(os.path.join(path, chunk_filename(kind, chunk['index'])), mmap_mode='r')[:chunk['frames']]
+                     for chunk in chunks]
+            columns[kind] = parts[0] if len(parts) == 1 else np.concatenate(parts)
+        for kind in EVENT_COLUMNS:
+            columns[kind] = np.concatenate([np.load(os.path.join(path, chunk_filename(kind, chunk['index'])))
+                                            for chunk in chunks])
+        self._set_columns(columns)
+
+    @classmethod
+    def from_columns(cls, columns, key_names, image_size, max_hands=2):
+        """
+        An in-memory trace from a dict of FRAME_COLUMNS and EVENT_COLUMNS arrays, e.g. a simulated one.
+        Without an 'inferred' or 'tracked' column every frame counts as inferred and not tracked.
+        """
+        trace = cls.__new__(cls)
+        trace.path = None
+        trace.key_names = list(key_names)
+        trace.max_hands = max_hands
+        trace.image_size = tuple(image_size)
+        trace.meta = {'version': FORMAT_VERSION, 'max_hands': max_hands, 'image_size': list(image_size),
+                      'key_names': trace.key_names}
+        num_frames = len(columns['timestamps'])
+        columns = {'inferred': np.ones(num_frames, dtype=bool), 'tracked': np.zeros(num_frames, dtype=bool),
+                   **columns}
+        trace._set_columns(columns)
+        return trace
+
+    def _set_columns(self, columns):
+        self.timestamps = columns['timestamps']
+        self.num_hands = columns['num_hands']
+        self.inferred = columns['inferred']
+        self.tracked = columns['tracked']
+        self.landmarks = columns['landmarks']
+        self.handedness = columns['handedness']
+        self.tip_depths = columns['tip_depths']
+        self.tip_heights = columns['tip_heights']
+        self.event_frames = columns['event_frames']
+        self.event_keys = columns['event_keys']
+        self.event_presses = columns['event_presses']
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    @property
+    def duration(self):
+        """Seconds between the first and the last frame."""
+        return float(self.timestamps[-1] - self.timestamps[0]) / 1000.0 if len(self) > 1 else 0.0
+
+    def tip_points(self):
+        """(frames, max_hands * 5, 2) int32 fingertip pixels, as main.py computes them from the landmarks."""
+        tips = self.landmarks[:, :, FINGER_TIP_SLICE, :2]
+        return tips.reshape(len(self), -1, 2).astype(np.int32)
+
+    def tip_valid(self):
+        """(frames, max_hands * 5) mask of the fingertips of detected hands."""
+        hand_index = np.arange(self.max_hands * FINGERS_PER_HAND) // FINGERS_PER_HAND
+        return hand_index[None, :] < self.num_hands[:, None]
+
+    def key_events(self):
+        """The recorded key events as a list of (frame, key_name, PRESS / RELEASE)."""
+        return [(frame, self.key_names[key], is_press) for frame, key, is_press
+                in zip(self.event_frames.tolist(), self.event_keys.tolist(), self.event_presses.tolist())]
@@ -0,0 +1,69 @@
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+
+# A compiled layout is a directory `layout_<hash>/` inside the cache directory holding one .npy file
+# per array (so each can be memory-mapped on load) and a manifest.json with the key names.
+# The hash covers the bytes of the source JSON files and the compile parameters, so editing either
+# file, or changing the frame size, selects a different directory and triggers a rebuild.
+CACHE_VERSION = 1
+MANIFEST_FILENAME = 'manifest.json'
+LAYOUT_ARRAYS = ('key_polygons', 'key_centroids', 'key_min_depths', 'key_max_depths', 'label_map', 'edge_map')
+
+
+def hash_layout_sources(source_filenames, **params):
+    digest = hashlib.sha256(f"v{CACHE_VERSION}".encode())
+    for filename in source_filenames:
+        digest.update(filename.encode())
+        if filename and os.path.exists(filename):
+            with open(filename, 'rb') as f:
+                digest.update(f.read())
+        else:
+            digest.update(b'<missing>')
+    digest.update(json.dumps(params, sort_keys=True).encode())
+    return digest.hexdigest()[:16]
+
+
+def _layout_dir(cache_dir, layout_hash):
+    return os.path.join(cache_dir, f"layout_{layout_hash}")
+
+
+def load_compiled_layout(cache_dir, layout_hash):
+    """Returns (key_names, {name: memory-mapped array}) for a matching compiled layout, or None."""
+    layout_dir = _layout_dir(cache_dir, layout_hash)
+    try:
+        with open(os.path.join(layout_dir, MANIFEST_FILENAME), 'r') as f:
+            manifest = json.load(f)
+        arrays = {name: np.load(os.path.join(layout_dir, f"{name}.npy"), mmap_mode='r') for name in LAYOUT_ARRAYS}
+    except (OSError, ValueError) as e:
+        if os.path.isdir(layout_dir):
+            print(f"Warning: Ignoring unreadable compiled layout '{layout_dir}': {e}")
+        return None
+    return manifest['key_names'], arrays
+
+
+def save_compiled_layout(cache_dir, layout_hash, key_names, arrays):
+    """Writes a compiled layout and removes layouts compiled from older sources."""
+    layout_dir = _layout_dir(cache_dir, layout_hash)
+    temp_dir = f"{layout_dir}.tmp{os.getpid()}"
+    try:
+        os.makedirs(temp_dir, exist_ok=True)
+        for name in LAYOUT_ARRAYS:
+            np.save(os.path.join(temp_dir, f"{name}.npy"), arrays[name])
+        with open(os.path.join(temp_dir, MANIFEST_FILENAME), 'w') as f:
+            json.dump({'version': CACHE_VERSION, 'key_names': key_names}, f, indent=4)
+        # Publish atomically so a concurrent reader never sees a half-written layout
+        if os.path.isdir(layout_dir):
+            shutil.rmtree(temp_dir)
+        else:
+            os.replace(temp_dir, layout_dir)
+    except OSError as e:
+        print(f"Warning: Could not write compiled layout to '{cache_dir}': {e}")
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        return
+
+    for entry in os.listdir(cache_dir):
+        if entry.startswith('layout_') and '.tmp' not in entry and entry != os.path.basename(layout_dir):
+            shutil.rmtree(os.path.join(cache_dir, entry), ignore_errors=True)
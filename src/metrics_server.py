@@ -0,0 +1,193 @@
+import math
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from src.instrumentation import END_TO_END
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class SecondBuckets:
+    """
+    Event counts over the last `num_buckets` seconds, one bucket per wall-clock second.
+
+    `add()` overwrites a bucket left over from an earlier lap of the ring, so a single writer needs
+    no lock; readers may see a bucket mid-update, which only matters for that one scrape.
+    """
+
+    def __init__(self, num_buckets=60):
+        self.num_buckets = num_buckets
+        self._counts = [0] * num_buckets
+        self._seconds = [-1] * num_buckets
+
+    def add(self, count=1, now=None):
+        second = int(time.time() if now is None else now)
+        bucket = second % self.num_buckets
+        if self._seconds[bucket] != second:
+            self._counts[bucket] = 0
+            self._seconds[bucket] = second
+        self._counts[bucket] += count
+
+    def total(self, window=None, now=None):
+        """Events in the last `window` complete seconds (all buckets by default), excluding the current one."""
+        current = int(time.time() if now is None else now)
+        window = min(window or self.num_buckets, self.num_buckets - 1)
+        return sum(count for count, second in zip(self._counts, self._seconds)
+                   if current - window <= second < current)
+
+
+class PipelineMetrics:
+    """
+    Counters and gauges of the detection loop, for the metrics endpoint.
+
+    Only the main loop writes them, once per frame through `record_frame()`, so updates are plain
+    attribute and list assignments with no locking; the metrics server only reads.
+    """
+
+    FPS_WINDOW = 5  # seconds averaged for the FPS gauges
+
+    def __init__(self):
+        self.frames_processed = 0
+        self.hands_detected = 0
+        self.keys_emitted = 0
+        self._last_frames_captured = 0
+        self._captured = SecondBuckets()
+        self._processed = SecondBuckets()
+        self._keys = SecondBuckets(61)  # a full minute of complete seconds plus the current one
+
+    def record_frame(self, num_hands, keys_pressed, frames_captured):
+        """Records one processed frame: hands at the last inference, new key presses and the capture counter."""
+        now = time.time()
+        self.frames_processed += 1
+        self.hands_detected = num_hands
+        self._processed.add(1, now)
+        self._captured.add(frames_captured - self._last_frames_captured, now)
+        self._last_frames_captured = frames_captured
+        if keys_pressed:
+            self.keys_emitted += keys_pressed
+            self._keys.add(keys_pressed, now)
+
+    def capture_fps(self):
+        return self._captured.total(self.FPS_WINDOW) / self.FPS_WINDOW
+
+    def processed_fps(self):
+        return self._processed.total(self.FPS_WINDOW) / self.FPS_WINDOW
+
+    def keys_per_minute(self):
+        return self._keys.total(60)
+
+
+def _format_value(value):
+    if isinstance(value, float) and not math.isfinite(value):
+        return 'NaN' if math.isnan(value) else ('+Inf' if value > 0 else '-Inf')
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def render_metrics(metrics, camera_manager=None, profiler=None, key_injector=None, scheduler=None, prefix='keyboard'):
+    """Prometheus text exposition of the pipeline's current metrics."""
+    lines = []
+
+    def add(name, metric_type, help_text, samples):
+        lines.append(f"# HELP {prefix}_{name} {help_text}")
+        lines.append(f"# TYPE {prefix}_{name} {metric_type}")
+        for labels, value in samples:
+            label_text = '{' + ','.join(f'{k}="{v}"' for k, v in labels) + '}' if labels else ''
+            lines.append(f"{prefix}_{name}{label_text} {_format_value(value)}")
+
+    add('capture_fps', 'gauge', "Camera frames captured per second", [((), metrics.capture_fps())])
+    add('processed_fps', 'gauge', "Frames processed per second", [((), metrics.processed_fps())])
+    add('frames_processed_total', 'counter', "Frames processed", [((), metrics.frames_processed)])
+    if camera_manager is not None:
+        stats = camera_manager.get_capture_stats()
+        add('frames_captured_total', 'counter', "Camera frames captured", [((), stats['frames_captured'])])
+        add('frames_dropped_total', 'counter', "Captured frames replaced before being processed",
+            [((), stats['frames_dropped'])])
+    add('hands_detected', 'gauge', "Hands detected by the last hand inference", [((), metrics.hands_detected)])
+    add('keys_emitted_total', 'counter', "Key presses emitted", [((), metrics.keys_emitted)])
+    add('keys_per_minute', 'gauge', "Key presses emitted in the last minute", [((), metrics.keys_per_minute())])
+
+    if key_injector is not None:
+        stats = key_injector.get_stats()
+        add('injection_queue_depth', 'gauge', "Key events waiting to be injected", [((), stats['queue_depth'])])
+        add('injection_latency_max_seconds', 'gauge', "Longest enqueue-to-injection latency",
+            [((), stats['max_latency_ms'] / 1000.0)])
+
+    if scheduler is not None:
+        add('degradation_level', 'gauge', "Frame scheduler degradation level (0 = full quality)",
+            [((), scheduler.level)])
+        add('frames_shed_total', 'counter', "Frames skipped by the frame scheduler", [((), scheduler.skipped_frames)])
+
+    if profiler is not None and profiler.enabled:
+        # The main loop may add a stage while we read; copy the mapping in one step
+        histograms = profiler.histograms.copy()
+        samples, counts, sums = [], [], []
+        for stage, histogram in histograms.items():
+            if stage == END_TO_END:
+                continue
+            for q in (0.5, 0.95, 0.99):
+                samples.append(((('stage', stage), ('quantile', q)), histogram.quantile(q)))
+            counts.append(((('stage', stage),), histogram.count))
+            sums.append(((('stage', stage),), histogram.total))
+        add('stage_latency_seconds', 'summary', "Per-stage latency", samples)
+        lines.extend(f"{prefix}_stage_latency_seconds_count{{stage=\"{labels[0][1]}\"}} {value}"
+                     for labels, value in counts)
+        lines.extend(f"{prefix}_stage_latency_seconds_sum{{stage=\"{labels[0][1]}\"}} {_format_value(value)}"
+                     for labels, value in sums)
+        end_to_end = histograms.get(END_TO_END)
+        if end_to_end is not None:
+            add('end_to_end_latency_seconds', 'summary', "Latency from frame capture to the queued key events",
+                [((('quantile', q),), end_to_end.quantile(q)) for q in (0.5, 0.95, 0.99)])
+            lines.append(f"{prefix}_end_to_end_latency_seconds_count {end_to_end.count}")
+            lines.append(f"{prefix}_end_to_end_latency_seconds_sum {_format_value(end_to_end.total)}")
+
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsServer:
+    """
+    Serves `render_metrics()` at http://host:port/metrics from a background thread, so a scrape
+    never runs on (or waits for) the detection loop. Binds to localhost by default.
+    """
+
+    def __init__(self, metrics, port=9100, host='127.0.0.1', camera_manager=None, profiler=None, key_injector=None,
+                 scheduler=None):
+        self.metrics = metrics
+        self.camera_manager = camera_manager
+        self.profiler = profiler
+        self.key_injector = key_injector
+        self.scheduler = scheduler
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = render_metrics(server.metrics, server.camera_manager, server.profiler,
+                                      server.key_injector, server.scheduler).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # keep scrapes out of the console
+
+        self._httpd = HTTPServer((host, port), Handler)
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def address(self):
+        return self._httpd.server_address
+
+    def start(self):
+        self._thread.start()
+        host, port = self.address[:2]
+        print(f"Serving metrics at http://{host}:{port}/metrics")
+
+    def close(self):
+        if self._thread.is_alive():
+            self._httpd.shutdown()
+        self._httpd.server_close()
@@ -0,0 +1,65 @@
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    """
+    Decides per frame whether hand inference is needed at all.
+
+    The keyboard region (`roi` (x0, y0, x1, y1), or the whole frame) is downscaled by `downscale`,
+    converted to grayscale and compared with the previous frame's copy. While fewer than
+    `min_changed_fraction` of its pixels change by more than `diff_threshold` grey levels and the last
+    inference found no hands, the scene is static and empty and inference can be skipped. Any motion,
+    or hands in the last result, lets the frame through, so inference resumes on the very frame where
+    motion appears. Every `max_skipped_frames`-th frame is inferred anyway, in case a hand arrived
+    too slowly to be seen as motion.
+
+    `gated_frames` and `inferred_frames` count the decisions.
+    """
+
+    def __init__(self, roi=None, downscale=8, diff_threshold=12, min_changed_fraction=0.002, max_skipped_frames=30):
+        self.roi = roi
+        self.downscale = downscale
+        self.diff_threshold = diff_threshold
+        self.min_changed_fraction = min_changed_fraction
+        self.max_skipped_frames = max_skipped_frames
+        self.gated_frames = 0
+        self.inferred_frames = 0
+        self.last_changed_fraction = 0.0
+        self._previous = None
+        self._skipped = 0
+
+    def _thumbnail(self, image):
+        if self.roi is not None:
+            x0, y0, x1, y1 = self.roi
+            crop = image[max(0, y0):y1, max(0, x0):x1]
+            # An ROI outside this frame (e.g. a recording at another resolution) watches the whole frame
+            if crop.size:
+                image = crop
+        h, w = image.shape[:2]
+        small = cv2.resize(image, (max(1, w // self.downscale), max(1, h // self.downscale)),
+                           interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+
+    def should_infer(self, image, hands_present):
+        """True if hand inference must run on `image`; `hands_present` is whether the last result had hands."""
+        thumbnail = self._thumbnail(image)
+        previous, self._previous = self._previous, thumbnail
+
+        if previous is None or previous.shape != thumbnail.shape:
+            moving = True
+        else:
+            changed = cv2.absdiff(thumbnail, previous) > self.diff_threshold
+            self.last_changed_fraction = float(np.count_nonzero(changed)) / changed.size
+            moving = self.last_changed_fraction >= self.min_changed_fraction
+
+        if moving or hands_present or self._skipped >= self.max_skipped_frames:
+            self._skipped = 0
+            self.inferred_frames += 1
+            return True
+        self._skipped += 1
+        self.gated_frames += 1
+        return False
+
+    def get_stats(self):
+        return {'gated_frames': self.gated_frames, 'inferred_frames': self.inferred_frames}
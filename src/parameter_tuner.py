@@ -0,0 +1,307 @@
+import collections
+import itertools
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from src.keyboard_manager import KeyboardManager
+from src.landmark_trace import LandmarkTrace
+from src.tap_detector import TapDetector
+from src.trace_replay import (_trace_key_ids, edit_distance, press_events, replay_taps, replay_taps_batched, tap_events,
+                              trace_slots)
+
+# Replayed presses up to this many frames outside a labelled press still count as detecting it
+MATCH_SLACK_FRAMES = 3
+
+
+class TuningSession:
+    """
+    One labelled landmark trace, reduced to the arrays the press and tap logic consume.
+
+    The trace's key events are the labels: ground truth for a trace from typist_simulator.py, or the
+    keys the live logic emitted for a recorded one. Every evaluation runs over a prefix of the session
+    (`frames`), so successive halving can score many configurations cheaply on short prefixes first.
+    """
+
+    def __init__(self, trace, keyboard_manager, logic='press', use_surface_model=False):
+        self.key_names = keyboard_manager.key_names
+        self.key_index = {name: index for index, name in enumerate(self.key_names)}
+        self.logic = logic
+        self.use_surface_model = use_surface_model
+        self.timestamps = np.asarray(trace.timestamps, dtype=np.float64)
+        if logic == 'press':
+            self.key_ids, self.valid = _trace_key_ids(trace, keyboard_manager)
+            self.depths = np.asarray(trace.tip_depths, dtype=np.float32)
+            self.band_values = np.asarray(trace.tip_heights if use_surface_model else trace.tip_depths,
+                                          dtype=np.float32)
+        else:
+            self.depths, self.key_ids, self.valid, self.band_values = trace_slots(trace, keyboard_manager,
+                                                                                   use_surface_model)
+
+        # Labelled presses as (press frame, release frame, key index), in press order
+        self.labels = []
+        open_presses = {}
+        for frame, key_name, is_press in sorted(trace.key_events(), key=lambda event: (event[0], not event[2])):
+            key = self.key_index[key_name]
+            if is_press:
+                open_presses[key] = frame
+            elif key in open_presses:
+                self.labels.append((open_presses.pop(key), frame, key))
+        self.labels.extend((frame, len(trace), key) for key, frame in open_presses.items())
+        self.labels.sort()
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def contact_values(self):
+        """Band values (depths or heights) of the deepest fingertip on each labelled key while it is held down."""
+        values = []
+        for press, release, key in self.labels:
+            on_key = (self.key_ids[press:release] == key) & self.valid[press:release]
+            frame_values = np.where(on_key, self.band_values[press:release], -np.inf).max(axis=1)
+            values.append(frame_values[np.isfinite(frame_values)])
+        return np.concatenate(values) if values else np.zeros(0, dtype=np.float32)
+
+    def events(self, config, frames):
+        """Key events of the press or tap logic under `config` over the first `frames` frames."""
+        key_min, key_max = config['key_min'], config['key_max']
+        if self.logic == 'press':
+            band_values = self.band_values[:frames]
+            key_ids = self.key_ids[:frames]
+            if self.use_surface_model:
+                pressing = (key_ids >= 0) & (self.depths[:frames] > 0) & (band_values < config['press_height'])
+            else:
+                over_key = key_ids >= 0
+                safe_ids = np.where(over_key, key_ids, 0)
+                pressing = over_key & (key_min[safe_ids] <= band_values) & (band_values < key_max[safe_ids])
+            return press_events(pressing & self.valid[:frames], key_ids, self.key_names)
+        return tap_events(self.timestamps[:frames], self.depths[:frames], self.key_ids[:frames], self.valid[:frames],
+                          self.band_values[:frames], self.key_names, key_min, key_max, config['tap_velocity'],
+                          config['min_interaction'], config['max_interaction'])
+
+    def score(self, events, frames):
+        """
+        Counts for one evaluation: edit distance between the pressed and labelled key sequences, labelled
+        and replayed presses, false presses (replayed presses matching no labelled one) and the summed
+        detection latency in ms of the matched ones. A press matched up to MATCH_SLACK_FRAMES before its
+        label counts with zero latency, so firing before contact is never rewarded.
+        """
+        labels = [label for label in self.labels if label[0] < frames]
+        presses = [(frame, self.key_index[key_name]) for frame, key_name, is_press in events if is_press]
+        counts = {
+            'edits': edit_distance([key for _, key in presses], [key for _, _, key in labels]),
+            'labelled': len(labels),
+            'replayed': len(presses),
+            'false_presses': 0,
+            'matched': 0,
+            'latency_ms': 0.0,
+        }
+
+        # Greedy in time order, per key: a labelled press takes the first unused replayed press of its key
+        # between its own press and release (with some slack)
+        replayed_by_key = collections.defaultdict(list)
+        for frame, key in presses:
+            replayed_by_key[key].append(frame)
+        labels_by_key = collections.defaultdict(list)
+        for press, release, key in labels:
+            labels_by_key[key].append((press, release))
+        timestamps = self.timestamps
+        for key, replayed_frames in replayed_by_key.items():
+            next_replayed = 0
+            for press, release in labels_by_key.get(key, ()):
+                while next_replayed < len(replayed_frames) and replayed_frames[next_replayed] < press - MATCH_SLACK_FRAMES:
+                    next_replayed += 1
+                    counts['false_presses'] += 1
+                if next_replayed < len(replayed_frames) and replayed_frames[next_replayed] <= release + MATCH_SLACK_FRAMES:
+                    frame = replayed_frames[next_replayed]
+                    counts['matched'] += 1
+                    counts['latency_ms'] += max(0.0, timestamps[min(frame, len(timestamps) - 1)] - timestamps[press])
+                    next_replayed += 1
+            counts['false_presses'] += len(replayed_frames) - next_replayed
+        return counts
+
+
+def combine_scores(counts, false_press_weight=1.0, latency_weight=1.0):
+    """
+    Summed counts of several sessions turned into rates, plus the cost the search minimizes: the key
+    error rate, plus `false_press_weight` times the false presses per labelled press, plus
+    `latency_weight` times the mean detection latency in seconds.
+    """
+    labelled = max(1, counts['labelled'])
+    stats = {
+        'key_error_rate': counts['edits'] / labelled,
+        'false_press_rate': counts['false_presses'] / labelled,
+        'detection_rate': counts['matched'] / labelled,
+        'latency_ms': counts['latency_ms'] / counts['matched'] if counts['matched'] else float('nan'),
+    }
+    # Detecting nothing must not look fast: unmatched presses cost a second of latency each
+    latency_s = (counts['latency_ms'] / 1000.0 + (labelled - counts['matched'])) / labelled
+    stats['cost'] = (stats['key_error_rate'] + false_press_weight * stats['false_press_rate'] +
+                     latency_weight * max(0.0, latency_s))
+    return stats
+
+
+def config_grid(space):
+    """Every combination of a {parameter: candidate values} space, as a list of dicts."""
+    names = list(space)
+    return [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+
+
+def search_space(logic, use_surface_model, contact_values, key_min=None, key_max=None):
+    """
+    The default grid. Depth bands are searched around where the labelled contacts actually are, so the
+    same grid works whatever the camera height: for the press logic as one offset plus lower and upper
+    margins applied to every key of the thresholds file, for the tap logic as one [min, max) band shared
+    by all rows, from quantiles of the contact values.
+    """
+    if logic == 'press' and use_surface_model:
+        return {'press_height': np.round(np.arange(0.002, 0.0305, 0.001), 4).tolist()}
+    if logic == 'press':
+        # Shift that moves the typical key band centre onto the typical contact depth
+        centre_shift = float(np.median(contact_values) - np.nanmedian((key_min + key_max) / 2.0))
+        return {
+            'offset': np.round(centre_shift + np.arange(-0.008, 0.0081, 0.0005), 4).tolist(),
+            'lower_margin': [0.0, 0.002, 0.004, 0.006, 0.008, 0.01],
+            'upper_margin': [0.0, 0.002, 0.004, 0.006, 0.008, 0.01],
+        }
+    low_quantiles = np.quantile(contact_values, [0.0, 0.05, 0.1, 0.2, 0.3])
+    high_quantiles = np.quantile(contact_values, [0.7, 0.8, 0.9, 0.95, 1.0])
+    return {
+        'band_min': np.round(low_quantiles - 0.001, 4).tolist(),
+        'band_max': np.round(high_quantiles + 0.001, 4).tolist(),
+        'range_margin': [0.005, 0.01, 0.02],
+        'hover_margin': [0.01, 0.02, 0.03, 0.05],
+        'tap_velocity': [-0.02, -0.05, -0.1, -0.15, -0.2, -0.3, -0.4],
+    }
+
+
+def resolve_config(params, num_keys, key_min=None, key_max=None):
+    """The detector settings a point of the search space stands for (per-key bands and scalars)."""
+    config = dict(params)
+    if 'offset' in params:
+        config['key_min'] = (key_min + params['offset'] - params['lower_margin']).astype(np.float32)
+        config['key_max'] = (key_max + params['offset'] + params['upper_margin']).astype(np.float32)
+    elif 'band_min' in params:
+        config['key_min'] = np.full(num_keys, params['band_min'], dtype=np.float32)
+        config['key_max'] = np.full(num_keys, params['band_max'], dtype=np.float32)
+        config['min_interaction'] = params['band_min'] - params['range_margin']
+        config['max_interaction'] = params['band_max'] + params['hover_margin']
+    else:
+        config['key_min'] = config['key_max'] = None
+    return config
+
+
+# --- Worker processes ---
+_worker = {}
+
+
+def _init_worker(trace_paths, logic, use_surface_model, keyboard_kwargs, weights):
+    keyboard_manager = KeyboardManager(**keyboard_kwargs)
+    _worker['sessions'] = [TuningSession(LandmarkTrace(path), keyboard_manager, logic, use_surface_model)
+                           for path in trace_paths]
+    _worker['key_bands'] = keyboard_manager.get_key_thresholds()
+    _worker['key_names'] = keyboard_manager.key_names
+    _worker['num_keys'] = len(keyboard_manager.key_names)
+    _worker['weights'] = weights
+
+
+def _evaluate(params_list, fraction):
+    results = []
+    for params in params_list:
+        config = resolve_config(params, _worker['num_keys'], *_worker['key_bands'])
+        totals = collections.Counter()
+        for session in _worker['sessions']:
+            frames = max(1, int(round(len(session) * fraction)))
+            totals.update(session.score(session.events(config, frames), frames))
+        results.append(combine_scores(totals, *_worker['weights']))
+    return results
+
+
+class ParameterTuner:
+    """
+    Grid search with successive halving over labelled sessions, spread over a ProcessPoolExecutor.
+
+    Every worker loads all sessions once. All grid points are first scored on the first 1/eta^k of
+    every session; the best 1/eta of them move on to a prefix eta times longer, until the survivors are
+    scored on the whole sessions. A single evaluation replays a whole session in a few array operations.
+    """
+
+    def __init__(self, trace_paths, keyboard_kwargs, logic='press', use_surface_model=False, workers=None,
+                 eta=3, rungs=3, false_press_weight=1.0, latency_weight=1.0):
+        self.trace_paths = list(trace_paths)
+        self.keyboard_kwargs = keyboard_kwargs
+        self.logic = logic
+        self.use_surface_model = use_surface_model
+        self.workers = workers or os.cpu_count() or 1
+        self.eta = eta
+        self.rungs = rungs
+        self.weights = (false_press_weight, latency_weight)
+
+        # The parent keeps its own copy of the sessions, for the search space and the final report
+        _init_worker(self.trace_paths, logic, use_surface_model, keyboard_kwargs, self.weights)
+        self.key_names = _worker['key_names']
+        self.key_min, self.key_max = _worker['key_bands']
+        self.contact_values = np.concatenate([session.contact_values() for session in _worker['sessions']])
+
+    def default_space(self):
+        if not len(self.contact_values):
+            raise ValueError("The sessions hold no labelled key presses to tune on")
+        return search_space(self.logic, self.use_surface_model, self.contact_values, self.key_min, self.key_max)
+
+    def _evaluate_all(self, executor, candidates, fraction):
+        chunk_size = max(1, math.ceil(len(candidates) / (self.workers * 4)))
+        chunks = [candidates[i:i + chunk_size] for i in range(0, len(candidates), chunk_size)]
+        return [stats for chunk_stats in executor.map(_evaluate, chunks, itertools.repeat(fraction))
+                for stats in chunk_stats]
+
+    def search(self, space=None):
+        """Returns [(params, stats)] of the configurations scored on the full sessions, best first."""
+        candidates = config_grid(space or self.default_space())
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(self.workers, mp_context=context, initializer=_init_worker,
+                                 initargs=(self.trace_paths, self.logic, self.use_surface_model,
+                                           self.keyboard_kwargs, self.weights)) as executor:
+            for rung in range(self.rungs):
+                fraction = self.eta ** (rung - self.rungs + 1)
+                stats = self._evaluate_all(executor, candidates, fraction)
+                ranked = sorted(zip(candidates, stats), key=lambda item: item[1]['cost'])
+                print(f"Rung {rung + 1}/{self.rungs}: {len(candidates)} configuration(s) on {fraction:.0%} of the "
+                      f"sessions, best cost {ranked[0][1]['cost']:.4f}")
+                if rung < self.rungs - 1:
+                    candidates = [params for params, _ in ranked[:max(1, math.ceil(len(ranked) / self.eta))]]
+        if self.logic == 'tap':
+            self.check_tap_replay(ranked[0][0])
+        return ranked
+
+    def evaluate(self, params):
+        """Stats of one configuration on the full sessions, in this process."""
+        return _evaluate([params], 1.0)[0]
+
+    def tap_detector(self, params):
+        """The TapDetector a tap-logic configuration stands for."""
+        config = resolve_config(params, len(self.key_names))
+        return TapDetector(config['key_min'], config['key_max'], config['tap_velocity'], config['min_interaction'],
+                           config['max_interaction'])
+
+    def check_tap_replay(self, params):
+        """
+        Replays every session frame by frame through the TapDetector of `params` and raises if the batched
+        replay the search scores with disagrees with it anywhere.
+        """
+        keyboard_manager = KeyboardManager(**self.keyboard_kwargs)
+        tap_detector = self.tap_detector(params)
+        for path in self.trace_paths:
+            trace = LandmarkTrace(path)
+            if (replay_taps_batched(trace, keyboard_manager, tap_detector, self.use_surface_model) !=
+                    replay_taps(trace, keyboard_manager, tap_detector, self.use_surface_model)):
+                raise RuntimeError(f"The batched tap replay disagrees with TapDetector on '{path}'")
+        print(f"Checked the best configuration against TapDetector on {len(self.trace_paths)} session(s).")
+
+    def thresholds(self, params):
+        """The per-key [min, max) depth bands of a configuration, as a key_thresholds.json dict."""
+        config = resolve_config(params, len(self.key_names), self.key_min, self.key_max)
+        return {name: [round(float(low), 4), round(float(high), 4)]
+                for name, low, high in zip(self.key_names, config['key_min'], config['key_max'])
+                if np.isfinite(low) and np.isfinite(high)}
@@ -0,0 +1,46 @@
+import numpy as np
+
+
+class PressDetector:
+    """
+    The per-frame press decision of main.py, shared by the live loop and trace replay.
+
+    A fingertip presses the key it is over when its depth lies inside that key's [min, max) threshold
+    band, or, when fingertip heights above the measured surface are given, when it is less than
+    `press_height` metres above the surface. Keys without a threshold have NaN bounds and heights are
+    NaN while there is no surface, and NaN never compares true, so neither can be pressed.
+
+    All methods take (..., N) arrays, so one call can decide a single frame or a whole trace. Depths and
+    heights are compared as float32, the precision of the thresholds and of landmark traces, so a live
+    frame and its replay decide a fingertip exactly on a band edge the same way.
+    """
+
+    def __init__(self, key_min_depths, key_max_depths, press_height=0.012, near_margin=0.005):
+        self.key_min_depths = np.asarray(key_min_depths, dtype=np.float32)
+        self.key_max_depths = np.asarray(key_max_depths, dtype=np.float32)
+        self.press_height = press_height
+        # Fingertips up to this much above the press band count as "near the surface"
+        self.near_margin = near_margin
+
+    def _bands(self, key_ids):
+        over_key = key_ids >= 0
+        safe_ids = np.where(over_key, key_ids, 0)
+        return over_key, self.key_min_depths[safe_ids], self.key_max_depths[safe_ids]
+
+    def pressing(self, key_ids, depths, heights=None):
+        """Boolean mask of the fingertips pressing the key under them (`key_ids` -1 = no key)."""
+        depths = np.asarray(depths, dtype=np.float32)
+        if heights is not None:
+            heights = np.asarray(heights, dtype=np.float32)
+            return (key_ids >= 0) & (depths > 0) & (heights < self.press_height)
+        over_key, key_min, key_max = self._bands(key_ids)
+        return over_key & (key_min <= depths) & (depths < key_max)
+
+    def near_surface(self, key_ids, depths, heights=None):
+        """Boolean mask of the fingertips within `near_margin` of pressing."""
+        depths = np.asarray(depths, dtype=np.float32)
+        if heights is not None:
+            heights = np.asarray(heights, dtype=np.float32)
+            return (depths > 0) & (heights < self.press_height + self.near_margin)
+        over_key, key_min, _ = self._bands(key_ids)
+        return over_key & (depths > 0) & (key_min - self.near_margin <= depths)
@@ -0,0 +1,78 @@
+import threading
+import time
+import cv2
+import numpy as np
+
+import src.visualization_utils as viz_utils
+
+
+class PreviewRenderer:
+    """
+    Draws the debug preview on its own thread at a reduced frame rate.
+
+    The detection loop calls `submit()` every frame; at most `fps` times a second it copies the frame,
+    the landmarks and the pressed-key set and hands them to the render thread, otherwise it returns
+    straight away. All drawing, `cv2.imshow` and `cv2.waitKey` happen on the render thread, which sets
+    `quit_requested` when 'q' is pressed in the preview window.
+    """
+
+    def __init__(self, annotated_keys, points_per_key, fps=10, window_name='Virtual Keyboard Interface'):
+        self.keycap_overlay = viz_utils.KeycapOverlay(annotated_keys, points_per_key)
+        self.interval = 1.0 / fps
+        self.window_name = window_name
+        self.quit_requested = False
+        self.frames_rendered = 0
+
+        self._snapshot = None
+        self._next_submit_time = 0.0
+        self._running = True
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, color_image, landmarks, tip_points, tip_depths, pressed_keys):
+        """Hands a copy of this frame's state to the render thread if a preview frame is due."""
+        now = time.perf_counter()
+        if now < self._next_submit_time:
+            return False
+        self._next_submit_time = now + self.interval
+        snapshot = (color_image.copy(), np.array(landmarks, copy=True),
+                    None if tip_points is None else np.array(tip_points, copy=True),
+                    None if tip_depths is None else np.array(tip_depths, copy=True),
+                    frozenset(pressed_keys))
+        with self._condition:
+            # An unrendered older snapshot is simply replaced
+            self._snapshot = snapshot
+            self._condition.notify()
+        return True
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._running and self._snapshot is None:
+                    self._condition.wait()
+                if not self._running:
+                    break
+                snapshot, self._snapshot = self._snapshot, None
+            self._render(*snapshot)
+        # Windows belong to the thread that created them
+        if self.frames_rendered:
+            cv2.destroyWindow(self.window_name)
+
+    def _render(self, image, landmarks, tip_points, tip_depths, pressed_keys):
+        if len(landmarks):
+            viz_utils.draw_hand_landmarks(image, landmarks)
+        if tip_points is not None:
+            for (px, py), depth_m in zip(tip_points.tolist(), tip_depths.tolist()):
+                viz_utils.draw_finger_tip_info(image, px, py, depth_m)
+        self.keycap_overlay.draw(image, pressed_keys)
+        cv2.imshow(self.window_name, image)
+        self.frames_rendered += 1
+        if cv2.waitKey(1) & 0xFF == ord('q'):
+            self.quit_requested = True
+
+    def close(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        self._thread.join(timeout=2.0)
@@ -0,0 +1,114 @@
+import os
+import time
+import numpy as np
+
+from src.depth_frame import DepthFrame
+from src.depth_registration import SparseDepthRegistration
+from src.frame_recorder import load_recording_meta
+
+
+class ReplayCameraManager:
+    """
+    Serves a recording made by `FrameRecorder` through the `CameraManager` interface.
+
+    Frames are views into the memory-mapped chunks, so nothing is copied on read. Color chunks are
+    mapped copy-on-write so callers can still draw on the returned image without touching the file.
+    With `realtime=True` frames are paced by their recorded timestamps; otherwise they are returned
+    as fast as the consumer asks for them.
+    """
+
+    def __init__(self, path, realtime=True, loop=False):
+        self.path = path
+        self.realtime = realtime
+        self.loop = loop
+        self.meta = load_recording_meta(path)
+        self.depth_scale = self.meta['depth_scale']
+        self.fps = self.meta['fps']
+        registration = self.meta.get('registration')
+        self.registration = SparseDepthRegistration.from_dict(registration) if registration else None
+        self.finished = False
+        self._chunks = []
+        self._chunk_index = 0
+        self._frame_index = 0
+        self._replay_start_time = None
+        self._first_timestamp = None
+
+        # --- Capture statistics (same names as CameraManager) ---
+        self.frames_captured = 0
+        self.frames_dropped = 0
+        self.frames_delivered = 0
+        self.last_frame_timestamp = 0.0
+        # Recorded timestamps are from the original session, not the current system clock
+        self.system_clock_timestamps = False
+
+    def get_resolution(self):
+        color_height, color_width = self.meta['color_shape'][:2]
+        depth_height, depth_width = self.meta['depth_shape'][:2]
+        return color_width, color_height, depth_width, depth_height, self.fps
+
+    def get_capture_stats(self):
+        return {
+            'frames_captured': self.frames_captured,
+            'frames_dropped': self.frames_dropped,
+            'frames_delivered': self.frames_delivered,
+        }
+
+    def start_stream(self):
+        print(f"Replaying {self.meta['frame_count']} frame(s) from '{self.path}'...")
+        self._chunks = []
+        for chunk in self.meta['chunks']:
+            if chunk['frames'] == 0:
+                continue
+            n = chunk['frames']
+            self._chunks.append((
+                np.load(os.path.join(self.path, chunk['color']), mmap_mode='c')[:n],
+                np.load(os.path.join(self.path, chunk['depth']), mmap_mode='r')[:n],
+                np.load(os.path.join(self.path, chunk['timestamps']), mmap_mode='r')[:n],
+                np.load(os.path.join(self.path, chunk['frame_numbers']), mmap_mode='r')[:n],
+            ))
+        self._chunk_index = 0
+        self._frame_index = 0
+        self._replay_start_time = None
+        self.finished = not self._chunks
+        return bool(self._chunks)
+
+    def _advance(self):
+        self._frame_index += 1
+        if self._frame_index == len(self._chunks[self._chunk_index][0]):
+            self._frame_index = 0
+            self._chunk_index += 1
+            if self._chunk_index == len(self._chunks):
+                if self.loop:
+                    self._chunk_index = 0
+                    self._replay_start_time = None
+                else:
+                    self.finished = True
+
+    def get_frames(self):
+        if self.finished:
+            return None, None, None
+
+        colors, depths, timestamps, frame_numbers = self._chunks[self._chunk_index]
+        i = self._frame_index
+        timestamp = float(timestamps[i])
+
+        if self.realtime:
+            if self._replay_start_time is None:
+                self._replay_start_time = time.monotonic()
+                self._first_timestamp = timestamp
+            delay = (timestamp - self._first_timestamp) / 1000.0 - (time.monotonic() - self._replay_start_time)
+            if delay > 0:
+                time.sleep(delay)
+
+        color_image = colors[i]
+        depth_frame = DepthFrame(depths[i], self.depth_scale, timestamp, int(frame_numbers[i]), self.registration)
+        self._advance()
+
+        self.frames_captured += 1
+        self.frames_delivered += 1
+        self.last_frame_timestamp = timestamp
+        return color_image, depth_frame, (depth_frame.get_width(), depth_frame.get_height())
+
+    def stop_stream(self):
+        print("Stopping replay.")
+        self._chunks = []
@@ -0,0 +1,131 @@
+import time
+import cv2
+import numpy as np
+
+from src.depth_frame import DepthFrame
+from src.landmark_trace import NUM_LANDMARKS
+
+# Bone pairs drawn as finger segments, and the palm outline (wrist and the finger bases)
+_FINGER_BONES = [(base + joint, base + joint + 1) for base in range(1, NUM_LANDMARKS, 4) for joint in range(3)]
+_PALM = [0, 1, 5, 9, 13, 17]
+_SKIN_COLOR = (120, 160, 210)
+
+
+class SimulatedCameraManager:
+    """
+    Serves rendered color and depth frames of a TypistSimulator session through the `CameraManager`
+    interface, so the whole pipeline can be loaded on any machine.
+
+    The depth image is aligned to the color image (no registration) with `depth_scale` metres per
+    unit; the keyboard is a flat surface at each key's surface depth, with `depth_noise` metres of
+    noise, and the hands are drawn over it as a palm and thick finger segments at the simulated
+    fingertip depths.
+    The color image shows the key outlines and skin-coloured hands. Rendered hands are only a
+    stand-in for MediaPipe, which may not detect them; the depth image is what the depth-based stages
+    (surface model, depth contacts) see. With `realtime=True` frames are paced at the simulated fps.
+    """
+
+    def __init__(self, session, simulator, depth_scale=0.0001, depth_noise=0.0005, realtime=True, finger_width=16,
+                 seed=0):
+        self.session = session
+        self.simulator = simulator
+        self.depth_scale = depth_scale
+        self.fps = simulator.fps
+        self.realtime = realtime
+        self.finger_width = finger_width
+        self.registration = None
+        self.finished = False
+        self.color_width, self.color_height = simulator.keyboard_manager.frame_size
+        self._frame_index = 0
+        self._start_time = None
+
+        # --- Capture statistics (same names as CameraManager) ---
+        self.frames_captured = 0
+        self.frames_dropped = 0
+        self.frames_delivered = 0
+        self.last_frame_timestamp = 0.0
+        # Simulated timestamps start at 0, not at the system clock
+        self.system_clock_timestamps = False
+
+        # A few noisy keyboard depth images reused in turn, so a frame costs one copy plus the hands
+        self._background_color, background_depth = self._render_keyboard()
+        rng = np.random.default_rng(seed)
+        self._background_depths = [
+            np.clip(np.round(background_depth + rng.normal(0.0, depth_noise / depth_scale, background_depth.shape)),
+                    1, 65535).astype(np.uint16)
+            for _ in range(4)]
+
+    def _render_keyboard(self):
+        color = np.full((self.color_height, self.color_width, 3), 60, dtype=np.uint8)
+        # Off the keys the keyboard lies at the mean key surface depth
+        depth = np.full((self.color_height, self.color_width), self.simulator.surface_depths.mean() / self.depth_scale,
+                        dtype=np.float32)
+        for polygon, surface_depth in zip(self.simulator.keyboard_manager.key_polygons, self.simulator.surface_depths):
+            polygon = np.round(polygon).astype(np.int32)
+            cv2.fillPoly(depth, [polygon], float(surface_depth / self.depth_scale))
+            cv2.fillPoly(color, [polygon], (35, 35, 35))
+            cv2.polylines(color, [polygon], True, (200, 200, 200), 1)
+        return color, depth
+
+    def get_resolution(self):
+        return self.color_width, self.color_height, self.color_width, self.color_height, self.fps
+
+    def get_capture_stats(self):
+        return {
+            'frames_captured': self.frames_captured,
+            'frames_dropped': self.frames_dropped,
+            'frames_delivered': self.frames_delivered,
+        }
+
+    def start_stream(self):
+        print(f"Simulating {len(self.session)} frame(s) ({self.session.duration:.1f} s) of typing...")
+        self._frame_index = 0
+        self._start_time = None
+        self.finished = not len(self.session)
+        return bool(len(self.session))
+
+    def _render_hands(self, i, color_image, depth_image):
+        session = self.session
+        for hand in range(session.landmarks.shape[1]):
+            points = np.round(session.landmarks[i, hand]).astype(np.int32)
+            tip_depths = session.tip_depths[i, hand]
+            # The palm hovers just above the highest fingertip; each finger slopes down to its tip
+            palm_depth = float(tip_depths.min()) - 0.01
+            cv2.fillPoly(depth_image, [points[_PALM]], round(palm_depth / self.depth_scale))
+            cv2.fillPoly(color_image, [points[_PALM]], _SKIN_COLOR)
+            for start, end in _FINGER_BONES:
+                finger = (start - 1) // 4
+                fraction = ((start - 1) % 4 + 1) / 3.0
+                segment_depth = palm_depth + (float(tip_depths[finger]) - palm_depth) * min(1.0, fraction)
+                cv2.line(depth_image, tuple(points[start]), tuple(points[end]), round(segment_depth / self.depth_scale),
+                         self.finger_width)
+                cv2.line(color_image, tuple(points[start]), tuple(points[end]), _SKIN_COLOR, self.finger_width)
+
+    def get_frames(self):
+        if self.finished:
+            return None, None, None
+
+        i = self._frame_index
+        timestamp = float(self.session.times[i]) * 1000.0
+        if self.realtime:
+            if self._start_time is None:
+                self._start_time = time.monotonic()
+            delay = self.session.times[i] - (time.monotonic() - self._start_time)
+            if delay > 0:
+                time.sleep(delay)
+
+        color_image = self._background_color.copy()
+        depth_image = self._background_depths[i % len(self._background_depths)].copy()
+        if self.session.hands_visible[i]:
+            self._render_hands(i, color_image, depth_image)
+        depth_frame = DepthFrame(depth_image, self.depth_scale, timestamp, i)
+
+        self._frame_index += 1
+        self.finished = self._frame_index == len(self.session)
+        self.frames_captured += 1
+        self.frames_delivered += 1
+        self.last_frame_timestamp = timestamp
+        return color_image, depth_frame, (depth_frame.get_width(), depth_frame.get_height())
+
+    def stop_stream(self):
+        print("Stopping simulation.")
@@ -0,0 +1,171 @@
+import os
+import threading
+import warnings
+import numpy as np
+
+
+class SurfaceModel:
+    """
+    Per-pixel depth, in metres, of the empty keyboard surface.
+
+    The map is built from a stack of empty-scene depth frames: a per-pixel median over the valid
+    (non-zero) samples, a robust plane fit through those medians, and a per-patch median offset on
+    top of the plane so gentle bends in the paper are kept while single-pixel noise and holes are not.
+    Press detection is then "fingertip height above the surface < epsilon", one lookup and one
+    subtraction per fingertip, and keeps working when the keyboard or camera shifts a few millimetres
+    as soon as the model is re-estimated.
+
+    The map lives in the coordinates of the depth image it was built from, so lookups take depth
+    pixels (see `DepthFrame.to_depth_pixels`).
+    """
+
+    def __init__(self, surface=None):
+        self.surface = surface
+
+    @property
+    def ready(self):
+        return self.surface is not None
+
+    @classmethod
+    def estimate(cls, depth_images, depth_scale, roi=None, patch_size=32, max_residual=0.004,
+                 max_patch_offset=0.01):
+        """
+        Builds a model from empty-scene uint16 depth images. The plane is fitted inside `roi`
+        (x0, y0, x1, y1) when given, otherwise over the whole frame.
+        """
+        stack = np.stack(depth_images).astype(np.float32) * depth_scale
+        stack[stack == 0] = np.nan
+        with warnings.catch_warnings():
+            # All-hole pixels give an all-NaN slice; they simply stay NaN
+            warnings.simplefilter('ignore', RuntimeWarning)
+            median = np.nanmedian(stack, axis=0)
+
+        height, width = median.shape
+        x0, y0, x1, y1 = roi if roi is not None else (0, 0, width, height)
+        ys, xs = np.nonzero(np.isfinite(median[y0:y1, x0:x1]))
+        if len(xs) < 3:
+            raise ValueError("Not enough valid depth pixels to estimate the keyboard surface")
+
+        # Robust plane z = a*x + b*y + c: least squares with iterative rejection of outliers
+        step = max(1, len(xs) // 20000)
+        xs, ys = xs[::step] + x0, ys[::step] + y0
+        z = median[ys, xs]
+        design = np.column_stack([xs, ys, np.ones_like(xs)]).astype(np.float64)
+        inliers = np.ones(len(z), dtype=bool)
+        for _ in range(3):
+            coefficients, *_ = np.linalg.lstsq(design[inliers], z[inliers], rcond=None)
+            residuals = z - design @ coefficients
+            spread = 1.4826 * np.median(np.abs(residuals[inliers]))
+            inliers = np.abs(residuals) < max(max_residual, 2.5 * spread)
+
+        grid_y, grid_x = np.mgrid[0:height, 0:width].astype(np.float32)
+        plane = (coefficients[0] * grid_x + coefficients[1] * grid_y + coefficients[2]).astype(np.float32)
+
+        # Per-patch median offset from the plane, padded so the frame splits into whole patches
+        residual = median - plane
+        padded_h = -(-height // patch_size) * patch_size
+        padded_w = -(-width // patch_size) * patch_size
+        padded = np.full((padded_h, padded_w), np.nan, dtype=np.float32)
+        padded[:height, :width] = residual
+        blocks = padded.reshape(padded_h // patch_size, patch_size, padded_w // patch_size, patch_size)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            offsets = np.nanmedian(blocks.transpose(0, 2, 1, 3).reshape(blocks.shape[0], blocks.shape[2], -1), axis=2)
+        offsets = np.clip(np.nan_to_num(offsets, nan=0.0), -max_patch_offset, max_patch_offset)
+        offsets = np.repeat(np.repeat(offsets, patch_size, axis=0), patch_size, axis=1)[:height, :width]
+
+        return cls((plane + offsets).astype(np.float32))
+
+    def height_above(self, depth_pixels, depths):
+        """Height in metres of points at (N, 2) integer depth pixels with the given depths above the surface."""
+        depth_pixels = np.asarray(depth_pixels).reshape(-1, 2)
+        return self.surface[depth_pixels[:, 1], depth_pixels[:, 0]] - depths
+
+    def save(self, filename):
+        directory = os.path.dirname(filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        np.save(filename, self.surface)
+
+    @classmethod
+    def load(cls, filename, shape=None):
+        """Loads a saved model, or returns an empty one if the file is missing or its shape differs."""
+        if not os.path.exists(filename):
+            return cls()
+        surface = np.load(filename)
+        if shape is not None and surface.shape != tuple(shape):
+            print(f"Warning: Ignoring surface model '{filename}' with shape {surface.shape}, expected {tuple(shape)}")
+            return cls()
+        print(f"Loaded keyboard surface model from '{filename}'")
+        return cls(surface)
+
+
+class SurfaceEstimator:
+    """
+    Keeps a SurfaceModel up to date from empty-scene frames offered by the main loop.
+
+    Every `frame_stride`-th offered frame is copied until `num_frames` are collected; the model is then
+    re-estimated on a background thread and swapped in with a single attribute assignment, so the main
+    loop never waits on it. While the model is still empty every offered frame is used, so the first
+    estimate is ready after `num_frames` empty frames. New models are saved to `cache_filename`.
+    """
+
+    def __init__(self, model, depth_scale, num_frames=30, frame_stride=10, cache_filename=None, roi=None):
+        self.model = model
+        self.depth_scale = depth_scale
+        self.num_frames = num_frames
+        self.frame_stride = frame_stride
+        self.cache_filename = cache_filename
+        self.roi = roi
+        self.estimates = 0
+        self._frames = []
+        self._offered = 0
+        self._thread = None
+
+    def offer(self, depth_image):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._offered += 1
+        if self.model.ready and self._offered % self.frame_stride:
+            return
+        self._frames.append(np.array(depth_image, dtype=np.uint16, copy=True))
+        if len(self._frames) >= self.num_frames:
+            frames, self._frames = self._frames, []
+            self._thread = threading.Thread(target=self._estimate, args=(frames,), daemon=True)
+            self._thread.start()
+
+    def _estimate(self, frames):
+        try:
+            new_model = SurfaceModel.estimate(frames, self.depth_scale, roi=self.roi)
+        except ValueError as e:
+            print(f"Warning: Surface estimation failed: {e}")
+            return
+        first_estimate = not self.model.ready
+        self.model.surface = new_model.surface
+        self.estimates += 1
+        if first_estimate:
+            print("Keyboard surface model ready.")
+        if self.cache_filename:
+            self.model.save(self.cache_filename)
+
+
+def create_keyboard_surface_estimator(depth_frame, keyboard_manager, image_size, depth_scale, cache_filename=None):
+    """
+    Loads the cached surface model matching `depth_frame`'s depth stream (or starts an empty one) and
+    returns it with a SurfaceEstimator that fits the plane over the keyboard's bounding box.
+    """
+    depth_image = depth_frame.get_data()
+    model = SurfaceModel.load(cache_filename, depth_image.shape) if cache_filename else SurfaceModel()
+
+    roi = None
+    bbox = keyboard_manager.get_keyboard_bbox(image_size=image_size)
+    if bbox is not None:
+        # The bounding box is in color pixels; map its corners into depth-image coordinates
+        x0, y0, x1, y1 = bbox
+        (dx0, dy0), (dx1, dy1) = np.sort(depth_frame.to_depth_pixels([(x0, y0), (x1 - 1, y1 - 1)]), axis=0)
+        roi = (int(dx0), int(dy0), int(dx1) + 1, int(dy1) + 1)
+
+    estimator = SurfaceEstimator(model, depth_scale, cache_filename=cache_filename, roi=roi)
+    if not model.ready:
+        print("Calibrating the keyboard surface: keep your hands away from the keyboard...")
+    return model, estimator
@@ -0,0 +1,164 @@
+import numpy as np
+
+NUM_FINGERTIPS = 10  # 2 hands x (thumb, index, middle, ring, pinky)
+FINGERS_PER_HAND = 5
+
+
+def fingertip_slots(handedness):
+    """
+    Maps detected hands onto TapDetector finger slots: LEFT_HAND fingers 0-4, RIGHT_HAND fingers 5-9.
+    Returns (slots, tips), indices into the NUM_FINGERTIPS slot arrays and into the (hands * 5) fingertip
+    arrays of the detected hands; only the first hand of each handedness is used.
+    """
+    hands_by_slot = {}
+    for hand_index, slot in enumerate(np.asarray(handedness).tolist()):
+        hands_by_slot.setdefault(slot, hand_index)
+    fingers = np.arange(FINGERS_PER_HAND)
+    slots = np.array([slot * FINGERS_PER_HAND + fingers for slot in hands_by_slot], dtype=np.intp).reshape(-1)
+    tips = np.array([hand * FINGERS_PER_HAND + fingers for hand in hands_by_slot.values()], dtype=np.intp).reshape(-1)
+    return slots, tips
+
+
+class TapDetector:
+    """
+    Velocity-based Released -> Touched -> Tapped state machine for all fingertips at once.
+
+    Every frame takes arrays for all `num_fingers` fingertips (pixel positions, depths, the key under each
+    finger and a validity mask) and keeps the last `history` frames of them in fixed-size NumPy ring
+    buffers, together with the camera timestamps. Per finger:
+
+    - Touched: the finger is over a key and its band value lies inside that key's [min, max) band.
+    - Released: a touched finger leaves the band or moves to another key.
+    - Tapped: a release while the depth velocity is below `tap_velocity_threshold` (m/s, negative when
+      the finger lifts towards the camera) and the finger is within the interaction range.
+
+    A finger outside the interaction range, or not detected, silently drops its touch. Band values are the
+    fingertip depths, or heights above the keyboard surface when `heights` are passed to `update()`;
+    velocities always come from the depths.
+    """
+
+    def __init__(self, key_min, key_max, tap_velocity_threshold=-0.1, min_interaction=0.20, max_interaction=0.25,
+                 num_fingers=NUM_FINGERTIPS, history=8, velocity_window=1):
+        self.key_min = np.asarray(key_min, dtype=np.float32)
+        self.key_max = np.asarray(key_max, dtype=np.float32)
+        self.tap_velocity_threshold = tap_velocity_threshold
+        self.min_interaction = min_interaction
+        self.max_interaction = max_interaction
+        self.num_fingers = num_fingers
+        self.history = history
+        # Velocity is measured over this many frames (1 = against the previous frame)
+        self.velocity_window = min(velocity_window, history - 1)
+
+        # --- Ring buffers (frame-major) ---
+        self._timestamps = np.zeros(history, dtype=np.float64)  # seconds
+        self._depths = np.zeros((history, num_fingers), dtype=np.float32)
+        self._positions = np.zeros((history, num_fingers, 2), dtype=np.float32)
+        self._valid = np.zeros((history, num_fingers), dtype=bool)
+        self._head = -1
+        self._frames = 0
+
+        # --- Per-finger state ---
+        self.touched_key = np.full(num_fingers, -1, dtype=np.intp)  # key index each finger is touching, -1 none
+        self.velocity = np.full(num_fingers, np.nan, dtype=np.float32)
+
+    def reset(self):
+        self._valid[:] = False
+        self.touched_key[:] = -1
+        self.velocity[:] = np.nan
+
+    def get_history(self):
+        """(timestamps, positions, depths, valid) of the buffered frames, oldest first."""
+        count = min(self._frames, self.history)
+        order = (self._head - np.arange(count)[::-1]) % self.history
+        return self._timestamps[order], self._positions[order], self._depths[order], self._valid[order]
+
+    def update(self, timestamp_ms, positions, depths, key_ids, valid, heights=None):
+        """
+        Advances all fingers by one frame and returns the taps as a list of (finger_index, key_index).
+        `timestamp_ms` is the camera frame timestamp; `key_ids` uses -1 for fingers over no key.
+        """
+        depths = np.asarray(depths, dtype=np.float32)
+        key_ids = np.asarray(key_ids, dtype=np.intp)
+        valid = np.asarray(valid, dtype=bool)
+
+        self._head = (self._head + 1) % self.history
+        self._frames += 1
+        self._timestamps[self._head] = timestamp_ms / 1000.0
+        self._depths[self._head] = depths
+        self._positions[self._head] = positions
+        self._valid[self._head] = valid
+
+        # Velocity against the frame `velocity_window` back, where both frames saw the finger
+        if self._frames > self.velocity_window:
+            previous = (self._head - self.velocity_window) % self.history
+            dt = self._timestamps[self._head] - self._timestamps[previous]
+            has_velocity = valid & self._valid[previous] & (dt > 0)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                self.velocity = np.where(has_velocity, (depths - self._depths[previous]) / dt, np.nan)
+        else:
+            self.velocity[:] = np.nan
+            has_velocity = np.zeros(self.num_fingers, dtype=bool)
+
+        band_values = depths if heights is None else np.asarray(heights, dtype=np.float32)
+        in_range = valid & (self.min_interaction <= band_values) & (band_values <= self.max_interaction)
+        over_key = key_ids >= 0
+        safe_ids = np.where(over_key, key_ids, 0)
+        in_band = over_key & (self.key_min[safe_ids] <= band_values) & (band_values < self.key_max[safe_ids])
+        new_touched = np.where(in_band, key_ids, -1)
+
+        # Transitions only run for fingers in range with a velocity; others (lost, out of range or
+        # seen for the first time) drop their touch without emitting a tap
+        active = in_range & has_velocity
+        released = active & (self.touched_key >= 0) & (new_touched != self.touched_key)
+        tapped = released & (self.velocity < self.tap_velocity_threshold)
+        taps = list(zip(np.flatnonzero(tapped).tolist(), self.touched_key[tapped].tolist()))
+
+        self.touched_key = np.where(active, new_touched, -1)
+        return taps
+
+
+def create_tap_detector(key_names, use_surface_model=False):
+    """The TapDetector of tapboard_main.py, with per-key bands from the row depths or the surface model."""
+    KEYBOARD_ROW_1 = ['0', '1', '2', '3', '4', '5', '6', '7', '8', '9']
+    KEYBOARD_ROW_2 = ['q', 'w', 'e', 'r', 't', 'y', 'u', 'i', 'o', 'p']
+    KEYBOARD_ROW_3 = ['a', 's', 'd', 'f', 'g', 'h', 'j', 'k', 'l']
+    KEYBOARD_ROW_4 = ['SHIFT', 'z', 'x', 'c', 'v', 'b', 'n', 'm', 'BACKSPACE']
+    KEYBOARD_ROW_5 = ["CTRL", "ALT", "WIN", "ESC", "DEL", "SPACE", "ENTER"]
+    DEPTH_THRESHOLD_ROW_1 = (0.211, 0.230)
+    DEPTH_THRESHOLD_ROW_2 = (0.211, 0.229)
+    DEPTH_THRESHOLD_ROW_3 = (0.211, 0.230)
+    DEPTH_THRESHOLD_ROW_4 = (0.211, 0.230)
+    DEPTH_THRESHOLD_ROW_5 = (0.211, 0.230)
+
+    # --- Velocity-based Detection Parameters ---
+    # (The original TOUCH_VELOCITY_THRESHOLD is gone: the Released -> Touched transition never used it.)
+    # Upward velocity threshold to consider a 'Tap' (release that triggers event)
+    TAP_VELOCITY_THRESHOLD = -0.1    # m/s. Significantly positive for a quick lift. Tune this!
+    # Minimum depth to consider interaction
+    MIN_INTERACTION_DEPTH = 0.20
+    # Maximum depth to consider interaction (prevents ghost touches when hand is too far)
+    MAX_INTERACTION_DEPTH = 0.25
+
+    # --- Surface-model Detection Parameters (used instead of the depth thresholds above with use_surface_model) ---
+    # Fingertip height above the keyboard surface below which the finger is on a key
+    PRESS_HEIGHT = 0.012
+    # Heights considered for interaction; below MIN is sensor noise, above MAX the hand is hovering away
+    MIN_INTERACTION_HEIGHT = -0.01
+    MAX_INTERACTION_HEIGHT = 0.05
+
+    # Per-key [min, max) bands: heights above the surface with the surface model, row depths otherwise
+    if use_surface_model:
+        key_min = np.full(len(key_names), MIN_INTERACTION_HEIGHT, dtype=np.float32)
+        key_max = np.full(len(key_names), PRESS_HEIGHT, dtype=np.float32)
+        interaction_range = (MIN_INTERACTION_HEIGHT, MAX_INTERACTION_HEIGHT)
+    else:
+        row_thresholds = {}
+        for row, threshold in ((KEYBOARD_ROW_1, DEPTH_THRESHOLD_ROW_1), (KEYBOARD_ROW_2, DEPTH_THRESHOLD_ROW_2),
+                               (KEYBOARD_ROW_3, DEPTH_THRESHOLD_ROW_3), (KEYBOARD_ROW_4, DEPTH_THRESHOLD_ROW_4),
+                               (KEYBOARD_ROW_5, DEPTH_THRESHOLD_ROW_5)):
+            row_thresholds.update(dict.fromkeys(row, threshold))
+        # Keys in no row can never be touched
+        bands = np.array([row_thresholds.get(name, (np.nan, np.nan)) for name in key_names], dtype=np.float32)
+        key_min, key_max = bands[:, 0], bands[:, 1]
+        interaction_range = (MIN_INTERACTION_DEPTH, MAX_INTERACTION_DEPTH)
+    return TapDetector(key_min, key_max, TAP_VELOCITY_THRESHOLD, *interaction_range)
@@ -0,0 +1,211 @@
+import collections
+import numpy as np
+
+from src.landmark_trace import PRESS, RELEASE
+from src.tap_detector import FINGERS_PER_HAND, NUM_FINGERTIPS, fingertip_slots
+
+
+def _trace_key_ids(trace, keyboard_manager):
+    # Key under every recorded fingertip in one lookup, -1 for no key or no hand
+    valid = trace.tip_valid()
+    key_ids = keyboard_manager.keys_at(trace.tip_points().reshape(-1, 2)).reshape(valid.shape)
+    key_ids[~valid] = -1
+    return key_ids, valid
+
+
+def replay_presses(trace, keyboard_manager, press_detector, use_surface_model=False):
+    """
+    Re-runs main.py's press logic over a whole LandmarkTrace and returns its key events as
+    (frame, key_name, PRESS / RELEASE), in frame order.
+
+    The press decision has no state between frames, so every frame is decided in one batch: the set
+    of keys pressed in each frame becomes a (frames, keys) matrix whose changes from one frame to the
+    next are the events the key injector would have been sent.
+    """
+    key_ids, valid = _trace_key_ids(trace, keyboard_manager)
+    heights = trace.tip_heights if use_surface_model else None
+    pressing = press_detector.pressing(key_ids, trace.tip_depths, heights) & valid
+    return press_events(pressing, key_ids, keyboard_manager.key_names)
+
+
+def press_events(pressing, key_ids, key_names):
+    """Key events, in frame order, of a (frames, fingertips) mask of fingertips pressing the key in `key_ids`."""
+    frames, fingers = np.nonzero(pressing)
+    pressed = np.zeros((len(pressing) + 1, len(key_names)), dtype=bool)  # row 0: nothing pressed
+    pressed[frames + 1, key_ids[frames, fingers]] = True
+    events = []
+    for is_press, changes in ((PRESS, pressed[1:] & ~pressed[:-1]), (RELEASE, ~pressed[1:] & pressed[:-1])):
+        event_frames, event_keys = np.nonzero(changes)
+        events.extend((frame, key_names[key], is_press)
+                      for frame, key in zip(event_frames.tolist(), event_keys.tolist()))
+    events.sort(key=lambda event: (event[0], not event[2]))
+    return events
+
+
+def replay_taps(trace, keyboard_manager, tap_detector, use_surface_model=False):
+    """
+    Re-runs tapboard_main.py's TapDetector over a LandmarkTrace, frame by frame, and returns its taps as
+    (frame, key_name, PRESS / RELEASE) pairs, the way tapboard_main.py records them.
+    """
+    key_ids, _ = _trace_key_ids(trace, keyboard_manager)
+    points = trace.tip_points()
+    depths = np.asarray(trace.tip_depths)
+    heights = np.asarray(trace.tip_heights)
+    timestamps = trace.timestamps.tolist()
+    num_hands = trace.num_hands.tolist()
+
+    # The same fingertip slot arrays tapboard_main.py keeps
+    tip_positions = np.zeros((NUM_FINGERTIPS, 2), dtype=np.int32)
+    tip_depths = np.zeros(NUM_FINGERTIPS, dtype=np.float32)
+    tip_keys = np.full(NUM_FINGERTIPS, -1, dtype=np.intp)
+    tip_valid = np.zeros(NUM_FINGERTIPS, dtype=bool)
+    tip_heights = np.full(NUM_FINGERTIPS, np.nan, dtype=np.float32)
+
+    tap_detector.reset()
+    events = []
+    for frame in range(len(trace)):
+        tip_valid[:] = False
+        hands = num_hands[frame]
+        if hands:
+            slots, tips = fingertip_slots(trace.handedness[frame, :hands])
+            tip_positions[slots] = points[frame, tips]
+            tip_depths[slots] = depths[frame, tips]
+            tip_keys[slots] = key_ids[frame, tips]
+            tip_valid[slots] = depths[frame, tips] > 0
+            if use_surface_model:
+                # Heights are NaN while there was no surface to measure them from
+                tip_heights[slots] = heights[frame, tips]
+                tip_valid[slots] &= ~np.isnan(heights[frame, tips])
+
+        taps = tap_detector.update(timestamps[frame], tip_positions, tip_depths, tip_keys, tip_valid,
+                                   tip_heights if use_surface_model else None)
+        for _, key_index in taps:
+            key_name = keyboard_manager.key_names[key_index]
+            events.append((frame, key_name, PRESS))
+            events.append((frame, key_name, RELEASE))
+    return events
+
+
+def trace_slots(trace, keyboard_manager, use_surface_model=False):
+    """
+    The fingertip slot arrays replay_taps() fills frame by frame, for the whole trace at once: (frames,
+    NUM_FINGERTIPS) depths, key ids, validity and band values (depths, or heights with the surface model).
+    """
+    key_ids, _ = _trace_key_ids(trace, keyboard_manager)
+    num_frames = len(trace)
+    rows = np.arange(num_frames)
+    depths = np.zeros((num_frames, NUM_FINGERTIPS), dtype=np.float32)
+    heights = np.full((num_frames, NUM_FINGERTIPS), np.nan, dtype=np.float32)
+    slot_keys = np.full((num_frames, NUM_FINGERTIPS), -1, dtype=np.intp)
+    slot_used = np.zeros((num_frames, NUM_FINGERTIPS // FINGERS_PER_HAND), dtype=bool)
+    for hand in range(trace.max_hands):
+        # As in fingertip_slots(): only the first hand of each handedness gets its slots
+        slot = trace.handedness[:, hand].astype(np.intp)
+        use = (hand < trace.num_hands) & ~slot_used[rows, slot]
+        slot_used[rows[use], slot[use]] = True
+        for finger in range(FINGERS_PER_HAND):
+            frames, slots, tip = rows[use], slot[use] * FINGERS_PER_HAND + finger, hand * FINGERS_PER_HAND + finger
+            depths[frames, slots] = trace.tip_depths[frames, tip]
+            heights[frames, slots] = trace.tip_heights[frames, tip]
+            slot_keys[frames, slots] = key_ids[frames, tip]
+    valid = np.repeat(slot_used, FINGERS_PER_HAND, axis=1) & (depths > 0)
+    if use_surface_model:
+        valid &= ~np.isnan(heights)
+    return depths, slot_keys, valid, heights if use_surface_model else depths
+
+
+def tap_events(timestamps, depths, key_ids, valid, band_values, key_names, key_min, key_max,
+               tap_velocity_threshold, min_interaction, max_interaction, velocity_window=1):
+    """
+    TapDetector's taps over a whole session in one pass, as (frame, key_name, PRESS / RELEASE) pairs like
+    replay_taps(). Takes the (frames, fingertips) slot arrays of trace_slots().
+
+    The detector's only state between frames is the key each finger touched in the previous frame, which
+    is itself a function of that frame alone, so every transition can be found with shifted arrays.
+    """
+    seconds = np.asarray(timestamps, dtype=np.float64) / 1000.0
+    has_velocity = np.zeros(valid.shape, dtype=bool)
+    velocity = np.full(valid.shape, np.nan)
+    if len(seconds) > velocity_window:
+        dt = (seconds[velocity_window:] - seconds[:-velocity_window])[:, None]
+        has_velocity[velocity_window:] = valid[velocity_window:] & valid[:-velocity_window] & (dt > 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            velocity[velocity_window:] = (depths[velocity_window:] - depths[:-velocity_window]) / dt
+
+    in_range = valid & (min_interaction <= band_values) & (band_values <= max_interaction)
+    over_key = key_ids >= 0
+    safe_ids = np.where(over_key, key_ids, 0)
+    in_band = over_key & (key_min[safe_ids] <= band_values) & (band_values < key_max[safe_ids])
+    new_touched = np.where(in_band, key_ids, -1)
+    active = in_range & has_velocity
+    touched = np.where(active, new_touched, -1)
+
+    previous = np.full_like(touched, -1)
+    previous[1:] = touched[:-1]
+    tapped = active & (previous >= 0) & (new_touched != previous) & (velocity < tap_velocity_threshold)
+    events = []
+    for frame, key in zip(*np.nonzero(tapped)):
+        key_name = key_names[previous[frame, key]]
+        events.append((int(frame), key_name, PRESS))
+        events.append((int(frame), key_name, RELEASE))
+    return events
+
+
+def replay_taps_batched(trace, keyboard_manager, tap_detector, use_surface_model=False):
+    """The same events as replay_taps(), computed for all frames at once."""
+    depths, key_ids, valid, band_values = trace_slots(trace, keyboard_manager, use_surface_model)
+    return tap_events(trace.timestamps, depths, key_ids, valid, band_values, keyboard_manager.key_names,
+                      tap_detector.key_min, tap_detector.key_max, tap_detector.tap_velocity_threshold,
+                      tap_detector.min_interaction, tap_detector.max_interaction, tap_detector.velocity_window)
+
+
+def compare_events(replayed, recorded, inferred=None):
+    """
+    Counts of replayed events that match a recorded one exactly (same frame, key and kind), and the rest.
+    Events on frames where the `inferred` mask is False are left out of both sides: hand inference did
+    not run on those frames live, so their recorded events cannot be reproduced from the landmarks.
+    """
+    skipped = 0
+    if inferred is not None:
+        inferred = np.asarray(inferred, dtype=bool)
+        kept = [event for event in recorded if inferred[event[0]]]
+        skipped = len(recorded) - len(kept)
+        recorded = kept
+        replayed = [event for event in replayed if inferred[event[0]]]
+    replayed_counts = collections.Counter(replayed)
+    recorded_counts = collections.Counter(recorded)
+    matched = sum((replayed_counts & recorded_counts).values())
+    return {
+        'replayed': len(replayed),
+        'recorded': len(recorded),
+        'matched': matched,
+        'missed': len(recorded) - matched,
+        'extra': len(replayed) - matched,
+        'skipped': skipped,
+    }
+
+
+def edit_distance(a, b):
+    """Levenshtein distance between two sequences of hashable items, one NumPy row per item of `a`."""
+    codes = {}
+    a = np.array([codes.setdefault(item, len(codes)) for item in a], dtype=np.intp)
+    b = np.array([codes.setdefault(item, len(codes)) for item in b], dtype=np.intp)
+    offsets = np.arange(len(b) + 1)
+    row = offsets.copy()
+    for i, item in enumerate(a.tolist(), start=1):
+        # Substitution and deletion from the previous row, then insertion as a running minimum along the row
+        candidates = np.empty_like(row)
+        candidates[0] = i
+        candidates[1:] = np.minimum(row[:-1] + (b != item), row[1:] + 1)
+        row = np.minimum.accumulate(candidates - offsets) + offsets
+    return int(row[-1])
+
+
+def key_error_rate(replayed, recorded):
+    """
+    Edit distance between the sequences of pressed keys, per recorded press: 0.0 when every key was
+    typed once and in order, whatever frame each press landed on.
+    """
+    replayed_keys = [key_name for _, key_name, is_press in sorted(replayed, key=lambda event: event[0]) if is_press]
+    recorded_keys = [key_name for _, key_name, is_press in sorted(recorded, key=lambda event: event[0]) if is_press]
+    return edit_distance(replayed_keys, recorded_keys) / max(1, len(recorded_keys))
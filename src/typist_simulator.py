@@ -0,0 +1,253 @@
+import collections
+import numpy as np
+
+from src.landmark_trace import FINGERS_PER_HAND, NUM_LANDMARKS, PRESS, RELEASE, LandmarkTrace
+
+# Same values as LEFT_HAND / RIGHT_HAND in src.hand_tracker
+LEFT_HAND = 0
+RIGHT_HAND = 1
+THUMB, INDEX, MIDDLE, RING, PINKY = range(FINGERS_PER_HAND)
+
+# Touch-typing assignment of every annotated key to a (hand, finger)
+FINGER_ASSIGNMENT = {
+    **dict.fromkeys(('1', 'q', 'a', 'z', 'SHIFT', 'CTRL', 'ESC'), (LEFT_HAND, PINKY)),
+    **dict.fromkeys(('2', 'w', 's', 'x'), (LEFT_HAND, RING)),
+    **dict.fromkeys(('3', 'e', 'd', 'c'), (LEFT_HAND, MIDDLE)),
+    **dict.fromkeys(('4', '5', 'r', 't', 'f', 'g', 'v', 'b'), (LEFT_HAND, INDEX)),
+    **dict.fromkeys(('ALT', 'WIN'), (LEFT_HAND, THUMB)),
+    **dict.fromkeys(('6', '7', 'y', 'u', 'h', 'j', 'n', 'm'), (RIGHT_HAND, INDEX)),
+    **dict.fromkeys(('8', 'i', 'k'), (RIGHT_HAND, MIDDLE)),
+    **dict.fromkeys(('9', 'o', 'l'), (RIGHT_HAND, RING)),
+    **dict.fromkeys(('0', 'p', 'BACKSPACE', 'ENTER', 'DEL'), (RIGHT_HAND, PINKY)),
+    'SPACE': (RIGHT_HAND, THUMB),
+}
+# Home keys the fingers rest over (thumbs beside each other on the space bar, right pinky one key past 'l')
+HOME_KEYS = (('SPACE', 'f', 'd', 's', 'a'), ('SPACE', 'j', 'k', 'l', 'l'))
+CHARACTER_KEYS = {' ': 'SPACE', '\n': 'ENTER', '\b': 'BACKSPACE'}
+
+# Where the joints of each finger sit between the wrist (0) and the fingertip (1), MediaPipe order
+_JOINT_FRACTIONS = np.array([0.0] + [0.3, 0.55, 0.8, 1.0] + [0.5, 0.7, 0.85, 1.0] * 4, dtype=np.float32)
+_JOINT_FINGERS = np.array([-1] + [finger for finger in range(FINGERS_PER_HAND) for _ in range(4)])
+
+Keystroke = collections.namedtuple('Keystroke', ['key', 'hand', 'finger', 'press_time', 'release_time'])
+
+
+class SimulatedSession:
+    """
+    Noise-free geometry of a simulated typing session, sampled at the camera frame rate.
+
+    `times` is (frames,) seconds; `tip_points` (frames, 2, 5, 2) float pixels and `tip_depths`
+    (frames, 2, 5) metres hold both hands' fingertips (LEFT_HAND first), `landmarks` (frames, 2, 21, 2)
+    the whole hands. `hands_visible` is False during the lead-in and tail, when the hands are away.
+    `keystrokes` lists the intended Keystrokes in order.
+    """
+
+    def __init__(self, times, tip_points, tip_depths, landmarks, hands_visible, keystrokes, skipped_characters):
+        self.times = times
+        self.tip_points = tip_points
+        self.tip_depths = tip_depths
+        self.landmarks = landmarks
+        self.hands_visible = hands_visible
+        self.keystrokes = keystrokes
+        self.skipped_characters = skipped_characters
+
+    def __len__(self):
+        return len(self.times)
+
+    @property
+    def duration(self):
+        return float(self.times[-1]) if len(self.times) else 0.0
+
+
+class TypistSimulator:
+    """
+    Generates multi-finger typing from text, for load and accuracy tests without a camera.
+
+    Each character becomes a keystroke of its touch-typing finger (FINGER_ASSIGNMENT) at an average
+    `wpm` words (5 characters) per minute, with `timing_jitter` relative variation between keystrokes.
+    A keystroke moves the fingertip from where it hovers over its home key, `hover_height` metres
+    above the keys, to the key (aimed with `aim_error` pixels of spread) in `approach_time` seconds,
+    descending to a contact depth drawn from inside the key's [min, max) band from key_thresholds.json
+    (or from `key_bands`, a (key_min, key_max) pair of per-key depth arrays such as a TapDetector's).
+    It holds for `dwell_time` seconds, lifts at `release_velocity` m/s and glides home in `return_time`
+    seconds. A finger starts its next keystroke only once it has lifted from the previous one.
+
+    `simulate()` returns the noise-free SimulatedSession; `to_trace()` turns it into a LandmarkTrace
+    with `jitter` pixels of landmark noise, `depth_noise` metres of depth noise, a `hole_rate` fraction
+    of fingertip depths lost to 0-depth holes and hands dropping out for `dropout_frames` frames at a
+    rate of `dropout_rate` per frame, with the intended presses and releases as its key events.
+    Everything is drawn from one `seed`, so a run is reproducible.
+    """
+
+    def __init__(self, keyboard_manager, fps=30, wpm=40, timing_jitter=0.25, approach_time=0.12, dwell_time=0.09,
+                 release_velocity=0.25, return_time=0.15, hover_height=0.025, aim_error=4.0, jitter=1.0,
+                 depth_noise=0.0008, hole_rate=0.01, dropout_rate=0.005, dropout_frames=3, surface_offset=0.0,
+                 lead_in=1.5, tail=0.5, key_bands=None, seed=0):
+        self.keyboard_manager = keyboard_manager
+        self.fps = fps
+        self.wpm = wpm
+        self.timing_jitter = timing_jitter
+        self.approach_time = approach_time
+        self.dwell_time = dwell_time
+        self.release_velocity = release_velocity
+        self.return_time = return_time
+        self.hover_height = hover_height
+        self.aim_error = aim_error
+        self.jitter = jitter
+        self.depth_noise = depth_noise
+        self.hole_rate = hole_rate
+        self.dropout_rate = dropout_rate
+        self.dropout_frames = dropout_frames
+        # The keyboard surface lies this far below the bottom of each key's press band
+        self.surface_offset = surface_offset
+        self.lead_in = lead_in
+        self.tail = tail
+        self.seed = seed
+
+        self.key_names = list(keyboard_manager.key_names)
+        self._key_index = {name: index for index, name in enumerate(self.key_names)}
+        self.key_centroids = np.asarray(keyboard_manager.key_centroids, dtype=np.float32)
+        if key_bands is None:
+            key_bands = keyboard_manager.get_key_thresholds()
+        key_min, key_max = (np.asarray(depths, dtype=np.float32) for depths in key_bands)
+        # Keys without a threshold get the typical band
+        self.key_min_depths = np.where(np.isfinite(key_min), key_min, np.nanmedian(key_min))
+        self.key_max_depths = np.where(np.isfinite(key_max), key_max, np.nanmedian(key_max))
+        self.surface_depths = self.key_max_depths + surface_offset
+        self.home_points, self.home_depths = self._home_positions()
+
+    def _home_positions(self):
+        points = np.zeros((2, FINGERS_PER_HAND, 2), dtype=np.float32)
+        depths = np.zeros((2, FINGERS_PER_HAND), dtype=np.float32)
+        pitch = np.median(np.diff(self.key_centroids[[self._key_index[k] for k in ('a', 's', 'd', 'f')], 0]))
+        for hand, home_keys in enumerate(HOME_KEYS):
+            for finger, key in enumerate(home_keys):
+                index = self._key_index[key]
+                points[hand, finger] = self.key_centroids[index]
+                depths[hand, finger] = self.key_min_depths[index] - self.hover_height
+            # Thumbs side by side on the space bar, right pinky one key past the ring finger
+            points[hand, THUMB, 0] += pitch if hand == RIGHT_HAND else -pitch
+        points[RIGHT_HAND, PINKY, 0] += pitch
+        return points, depths
+
+    def text_to_keys(self, text):
+        """Annotated key names for `text` (lower-cased) and the number of characters with no key."""
+        keys, skipped = [], 0
+        for character in text:
+            key = CHARACTER_KEYS.get(character, character.lower())
+            if key in self._key_index and key in FINGER_ASSIGNMENT:
+                keys.append(key)
+            else:
+                skipped += 1
+        return keys, skipped
+
+    def simulate(self, text):
+        """Schedules the keystrokes of `text` and samples every fingertip trajectory at `fps`."""
+        rng = np.random.default_rng(self.seed)
+        keys, skipped = self.text_to_keys(text)
+        interval = 60.0 / (self.wpm * 5)
+
+        # Keyframes (time, x, y, depth) per finger, starting at rest over the home keys
+        keyframes = [[[(0.0, *self.home_points[hand, finger], self.home_depths[hand, finger])]
+                      for finger in range(FINGERS_PER_HAND)] for hand in range(2)]
+        free_at = np.zeros((2, FINGERS_PER_HAND))  # when each finger has lifted from its last keystroke
+        keystrokes = []
+        t = self.lead_in
+        for key in keys:
+            hand, finger = FINGER_ASSIGNMENT[key]
+            index = self._key_index[key]
+            t = max(t + interval * max(0.3, 1.0 + self.timing_jitter * rng.standard_normal()),
+                    free_at[hand, finger] + self.approach_time)
+            press_time = t
+            release_time = press_time + self.dwell_time * rng.uniform(0.8, 1.2)
+            band = self.key_max_depths[index] - self.key_min_depths[index]
+            contact_depth = self.key_min_depths[index] + band * rng.uniform(0.3, 0.7)
+            hover_depth = self.key_min_depths[index] - self.hover_height
+            lift_time = (contact_depth - hover_depth) / (self.release_velocity * rng.uniform(0.8, 1.2))
+            target = self.key_centroids[index] + rng.normal(0.0, self.aim_error, 2)
+
+            finger_keyframes = keyframes[hand][finger]
+            # Drop the glide home if this keystroke starts before it would have ended
+            approach_start = press_time - self.approach_time
+            if finger_keyframes[-1][0] > approach_start:
+                finger_keyframes.pop()
+            finger_keyframes.append((approach_start, *finger_keyframes[-1][1:]))
+            finger_keyframes.append((press_time, *target, contact_depth))
+            finger_keyframes.append((release_time, *target, contact_depth))
+            finger_keyframes.append((release_time + lift_time, *target, hover_depth))
+            finger_keyframes.append((release_time + lift_time + self.return_time, *self.home_points[hand, finger],
+                                     self.home_depths[hand, finger]))
+            free_at[hand, finger] = release_time + lift_time
+            keystrokes.append(Keystroke(key, hand, finger, press_time, release_time))
+
+        end_time = max(t + self.dwell_time + self.return_time, self.lead_in) + self.tail
+        times = np.arange(int(np.ceil(end_time * self.fps)), dtype=np.float64) / self.fps
+        tip_points = np.zeros((len(times), 2, FINGERS_PER_HAND, 2), dtype=np.float32)
+        tip_depths = np.zeros((len(times), 2, FINGERS_PER_HAND), dtype=np.float32)
+        for hand in range(2):
+            for finger in range(FINGERS_PER_HAND):
+                frames = np.array(keyframes[hand][finger], dtype=np.float64)
+                tip_points[:, hand, finger, 0] = np.interp(times, frames[:, 0], frames[:, 1])
+                tip_points[:, hand, finger, 1] = np.interp(times, frames[:, 0], frames[:, 2])
+                tip_depths[:, hand, finger] = np.interp(times, frames[:, 0], frames[:, 3])
+
+        landmarks = self._hand_landmarks(tip_points)
+        first_press = keystrokes[0].press_time if keystrokes else self.lead_in
+        hands_visible = (times >= min(self.lead_in, first_press - 2 * self.approach_time)) & (times <= end_time - self.tail)
+        return SimulatedSession(times, tip_points, tip_depths, landmarks, hands_visible, keystrokes, skipped)
+
+    def _hand_landmarks(self, tip_points):
+        # The wrist sits below the middle of the four fingers and follows them at a third of their motion
+        wrist_home = self.home_points[:, INDEX:].mean(axis=1) + (0.0, 170.0)
+        wrist = wrist_home + (tip_points[:, :, INDEX:].mean(axis=2) - self.home_points[:, INDEX:].mean(axis=1)) / 3.0
+        tips = tip_points[:, :, np.maximum(_JOINT_FINGERS, 0)]  # (frames, 2, 21, 2)
+        fractions = _JOINT_FRACTIONS[:, None]
+        return wrist[:, :, None, :] + (tips - wrist[:, :, None, :]) * fractions
+
+    def _surface_depths_at(self, points):
+        # Surface depth under each point: the surface of the key it is over, or the mean surface off the keys
+        key_ids = self.keyboard_manager.keys_at(points.reshape(-1, 2)).reshape(points.shape[:-1])
+        return np.where(key_ids >= 0, self.surface_depths[np.maximum(key_ids, 0)], self.surface_depths.mean())
+
+    def to_trace(self, session):
+        """A LandmarkTrace of what hand tracking and depth sampling would report for `session`."""
+        rng = np.random.default_rng(self.seed + 1)
+        num_frames = len(session)
+
+        landmarks = session.landmarks + rng.normal(0.0, self.jitter, session.landmarks.shape).astype(np.float32)
+        tip_points = landmarks[:, :, 4::4]
+        tip_depths = session.tip_depths + rng.normal(0.0, self.depth_noise, session.tip_depths.shape).astype(np.float32)
+        tip_heights = (self._surface_depths_at(tip_points.astype(np.int32)) - tip_depths).astype(np.float32)
+        holes = rng.random(tip_depths.shape) < self.hole_rate
+        tip_depths[holes] = 0.0
+        tip_heights[holes] = np.nan
+
+        # Dropouts: a hand disappears for dropout_frames frames at a time
+        starts = (rng.random((num_frames, 2)) < self.dropout_rate).astype(np.int32)
+        missing = np.cumsum(starts, axis=0)
+        missing[self.dropout_frames:] -= np.cumsum(starts, axis=0)[:-self.dropout_frames]
+        present = (missing == 0) & session.hands_visible[:, None]
+
+        # Detected hands first, LEFT_HAND before RIGHT_HAND, as the trace format expects
+        order = np.argsort(~present, axis=1, kind='stable')
+        frames = np.arange(num_frames)[:, None]
+        full_landmarks = np.zeros((num_frames, 2, NUM_LANDMARKS, 3), dtype=np.float32)
+        full_landmarks[..., :2] = landmarks[frames, order]
+        columns = {
+            'timestamps': session.times * 1000.0,
+            'num_hands': present.sum(axis=1).astype(np.uint8),
+            'landmarks': full_landmarks,
+            'handedness': order.astype(np.int8),
+            'tip_depths': tip_depths[frames, order].reshape(num_frames, -1),
+            'tip_heights': tip_heights[frames, order].reshape(num_frames, -1),
+        }
+
+        # Ground truth: each keystroke pressed on the first frame at or after its contact, released likewise
+        events = sorted((int(np.ceil(time * self.fps - 1e-9)), self._key_index[stroke.key], is_press)
+                        for stroke in session.keystrokes
+                        for time, is_press in ((stroke.press_time, PRESS), (stroke.release_time, RELEASE)))
+        events = np.array(events, dtype=np.int64).reshape(-1, 3)
+        columns['event_frames'] = events[:, 0]
+        columns['event_keys'] = events[:, 1].astype(np.int16)
+        columns['event_presses'] = events[:, 2].astype(bool)
+        return LandmarkTrace.from_columns(columns, self.key_names, self.keyboard_manager.frame_size)
@@ -1,6 +1,17 @@
 import cv2
 import numpy as np
 
+# Bone pairs of the 21 MediaPipe hand landmarks (same topology as mp.solutions.hands.HAND_CONNECTIONS)
+HAND_CONNECTIONS = ((0, 1), (1, 2), (2, 3), (3, 4), (0, 5), (5, 6), (6, 7), (7, 8), (5, 9), (9, 10), (10, 11),
+                    (11, 12), (9, 13), (13, 14), (14, 15), (15, 16), (13, 17), (0, 17), (17, 18), (18, 19), (19, 20))
+
+def draw_hand_landmarks(image, landmarks):
+    """Draws the skeletons of a (hands, 21, 2+) pixel landmark array, as returned by extract_landmarks()."""
+    for hand in np.asarray(landmarks)[..., :2].astype(np.int32):
+        cv2.polylines(image, [hand[[a, b]] for a, b in HAND_CONNECTIONS], False, (255, 255, 255), 2)
+        for x, y in hand.tolist():
+            cv2.circle(image, (x, y), 3, (0, 0, 255), -1)
+
 def draw_finger_tip_info(image, finger_pixel_x, finger_pixel_y, depth_at_finger_m):
     """Draws a circle and depth information for a detected finger tip."""
     cv2.circle(image, (finger_pixel_x, finger_pixel_y), 5, (0, 255, 255), -1)  # Yellow circle
@@ -8,6 +19,13 @@ def draw_finger_tip_info(image, finger_pixel_x, finger_pixel_y, depth_at_finger_
                 (finger_pixel_x + 10, finger_pixel_y - 10),
                 cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 255), 2)
 
+def draw_contact_points(image, contact_points, finger_ids):
+    """Draws the fingertips found touching the surface in the depth image, labelled with their finger ID."""
+    for (px, py), finger_id in zip(np.asarray(contact_points).tolist(), np.asarray(finger_ids).tolist()):
+        cv2.circle(image, (px, py), 8, (255, 0, 255), 2)  # Magenta ring
+        if finger_id >= 0:
+            cv2.putText(image, str(finger_id), (px + 10, py + 5), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 255), 2)
+
 def draw_keycap_annotations(image, annotated_keys, pressed_keys_set, points_per_key):
     """Draws the keyboard layout and highlights pressed keys."""
     for key_data in annotated_keys:
@@ -37,3 +55,54 @@ def draw_keycap_annotations(image, annotated_keys, pressed_keys_set, points_per_
                 cv2.circle(image, (p['x'], p['y']), 1, polygon_color, -1)
 
 # The display_text_overlays function has been removed as the tkinter UI now handles text display.
+
+class KeycapOverlay:
+    """
+    The keycap layout pre-rasterized once, for drawing the same annotations as draw_keycap_annotations
+    with a single masked copy per frame.
+
+    The unpressed layout (red outlines and corner points) is drawn once into a BGR layer with a matching
+    mask when the first frame arrives, or whenever the frame size changes. Only the few pixels the mask
+    covers are kept, so each frame writes them with one fancy-indexed copy and then draws just the
+    pressed keys on top.
+    """
+
+    def __init__(self, annotated_keys, points_per_key):
+        self.points_per_key = points_per_key
+        # Polygon points per key name, built once instead of on every frame
+        self.key_points = {}
+        for key_data in annotated_keys:
+            if len(key_data['points']) == points_per_key:
+                self.key_points[key_data['key']] = np.array([[p['x'], p['y']] for p in key_data['points']], np.int32)
+        self.shape = None
+        self._pixels = None  # (ys, xs) of the layout pixels
+        self._colors = None  # (N, 3) BGR color of each of them
+
+    def _rasterize(self, shape):
+        self.shape = shape
+        layer = np.zeros(shape, dtype=np.uint8)
+        mask = np.zeros(shape[:2], dtype=np.uint8)
+        for pts in self.key_points.values():
+            for target, color in ((layer, (0, 0, 255)), (mask, 255)):
+                cv2.polylines(target, [pts.reshape((-1, 1, 2))], True, color, 1)
+                for x, y in pts.tolist():
+                    cv2.circle(target, (x, y), 1, color, -1)
+        self._pixels = np.nonzero(mask)
+        self._colors = layer[self._pixels]
+
+    def draw(self, image, pressed_keys_set):
+        """Draws the layout onto `image` and highlights the keys in `pressed_keys_set`."""
+        if image.shape != self.shape:
+            self._rasterize(image.shape)
+        image[self._pixels] = self._colors
+
+        for key_value in pressed_keys_set:
+            pts = self.key_points.get(key_value)
+            if pts is None:
+                continue
+            polygon_color = (0, 255, 0)  # Green for pressed key
+            cv2.putText(image, key_value, (pts[0][0] + 5, pts[0][1] + 20), cv2.FONT_HERSHEY_SIMPLEX, 0.6,
+                        polygon_color, 2)
+            cv2.polylines(image, [pts.reshape((-1, 1, 2))], True, polygon_color, 2)
+            for x, y in pts.tolist():
+                cv2.circle(image, (x, y), 1, polygon_color, -1)
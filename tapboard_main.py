@@ -1,181 +1,129 @@
+import argparse
 import cv2
 from src.camera_manager import CameraManager
-from src.hand_tracker import HandTracker
-from src.keyboard_manager import KeyboardManager
+from src.frame_recorder import FrameRecorder
+from src.replay_camera_manager import ReplayCameraManager
+from src.hand_tracker import HandTracker, LandmarkResults, LEFT_HAND, RIGHT_HAND
+from src.keyboard_manager import ANNOTATION_FILENAME, POINTS_PER_KEY, KeyboardManager
+from src.landmark_trace import LandmarkTraceRecorder, PRESS, RELEASE
+from src.motion_gate import MotionGate
+from src.surface_model import create_keyboard_surface_estimator
+from src.tap_detector import NUM_FINGERTIPS, create_tap_detector, fingertip_slots
 import src.visualization_utils as viz_utils
-import time
+import numpy as np
 
-def run_keyboard_interface():
+def run_keyboard_interface(replay_path=None, record_path=None, realtime_replay=True, use_surface_model=False,
+                           motion_gate=False, trace_path=None):
     # --- Configuration ---
-    ANNOTATION_FILENAME = 'assets/keyboard_annotations.json'
-    POINTS_PER_KEY = 4
-    KEYBOARD_ROW_1 = ['0', '1', '2', '3', '4', '5', '6', '7', '8', '9']
-    KEYBOARD_ROW_2 = ['q', 'w', 'e', 'r', 't', 'y', 'u', 'i', 'o', 'p']
-    KEYBOARD_ROW_3 = ['a', 's', 'd', 'f', 'g', 'h', 'j', 'k', 'l']
-    KEYBOARD_ROW_4 = ['SHIFT', 'z', 'x', 'c', 'v', 'b', 'n', 'm', 'BACKSPACE']
-    KEYBOARD_ROW_5 = ["CTRL", "ALT", "WIN", "ESC", "DEL", "SPACE", "ENTER"]
-    DEPTH_THRESHOLD_ROW_1 = (0.211, 0.230)
-    DEPTH_THRESHOLD_ROW_2 = (0.211, 0.229)
-    DEPTH_THRESHOLD_ROW_3 = (0.211, 0.230)
-    DEPTH_THRESHOLD_ROW_4 = (0.211, 0.230)
-    DEPTH_THRESHOLD_ROW_5 = (0.211, 0.230)
-
-    # --- Velocity-based Detection Parameters ---
-    # Downward velocity threshold to consider a finger 'Touching' (entering the plane)
-    TOUCH_VELOCITY_THRESHOLD = -0.01 # m/s. Small negative to detect entering. Can be 0 or slightly negative.
-    # Upward velocity threshold to consider a 'Tap' (release that triggers event)
-    TAP_VELOCITY_THRESHOLD = -0.1    # m/s. Significantly positive for a quick lift. Tune this!
-    # Minimum depth to consider interaction
-    MIN_INTERACTION_DEPTH = 0.20
-    # Maximum depth to consider interaction (prevents ghost touches when hand is too far)
-    MAX_INTERACTION_DEPTH = 0.25
-
-    # --- Finger Tracking State Variables ---
-    previous_depth_at_index_finger_m = None
-    last_frame_time = time.time()
-
-    # --- Key State Management ---
-    # `key_touched_states`: True if finger is currently "on" the key (similar to your old key_press_states)
-    key_touched_states = {key: False for row in [KEYBOARD_ROW_1, KEYBOARD_ROW_2, KEYBOARD_ROW_3, KEYBOARD_ROW_4, KEYBOARD_ROW_5] for key in row}
-    # `key_was_touched_this_frame`: A temporary flag for each key to manage transitions
-    # This will hold the key that was just "tapped" in the current frame.
-    detected_key_event = None
-    # This will track the *currently touched* key for display.
-    current_displayed_key = None
+    SURFACE_MODEL_FILENAME = 'assets/surface_model.npy'
+    MOTION_GATE_MARGIN = 80  # pixels around the keyboard watched for motion by the motion gate
+    surface_model = None
+    surface_estimator = None
+
+    # --- Finger Tracking State ---
+    # One TapDetector slot per fingertip: LEFT_HAND fingers 0-4, RIGHT_HAND fingers 5-9 (thumb..pinky)
+    tip_positions = np.zeros((NUM_FINGERTIPS, 2), dtype=np.int32)
+    tip_depths = np.zeros(NUM_FINGERTIPS, dtype=np.float32)
+    tip_keys = np.full(NUM_FINGERTIPS, -1, dtype=np.intp)
+    tip_valid = np.zeros(NUM_FINGERTIPS, dtype=bool)
+    tip_heights = np.full(NUM_FINGERTIPS, np.nan, dtype=np.float32)
 
     # --- Initialize Managers ---
-    camera_manager = CameraManager()
+    if replay_path:
+        camera_manager = ReplayCameraManager(replay_path, realtime=realtime_replay)
+    else:
+        camera_manager = CameraManager()
+    frame_recorder = None
+    trace_recorder = None
     hand_tracker = HandTracker()
     keyboard_manager = KeyboardManager(annotation_filename=ANNOTATION_FILENAME, points_per_key=POINTS_PER_KEY)
+    key_names = keyboard_manager.key_names
+    keycap_overlay = viz_utils.KeycapOverlay(keyboard_manager.get_annotated_keys(), POINTS_PER_KEY)
+    gate = None
+    if motion_gate:
+        gate = MotionGate(keyboard_manager.get_keyboard_bbox(MOTION_GATE_MARGIN, camera_manager.get_resolution()[:2]))
+    tap_detector = create_tap_detector(key_names, use_surface_model)
 
     # --- Global variables for application state ---
     typed_text = ""
+    hands_present = False
 
     try:
         if not camera_manager.start_stream():
             print("Failed to start camera stream. Exiting.")
             return
 
-        while True:
-            current_frame_time = time.time()
-            delta_time = current_frame_time - last_frame_time
-            last_frame_time = current_frame_time
+        if record_path:
+            frame_recorder = FrameRecorder(record_path, camera_manager.depth_scale, camera_manager.fps,
+                                           registration=camera_manager.registration)
+        if trace_path:
+            trace_recorder = LandmarkTraceRecorder(trace_path, camera_manager.get_resolution()[:2], key_names,
+                                                   hand_tracker.max_num_hands)
 
+        while True:
             color_image, aligned_depth_frame, depth_frame_dims = camera_manager.get_frames()
 
             if color_image is None:
+                if camera_manager.finished:
+                    break
                 continue
 
-            detected_key_event = None
-            current_displayed_key = None # Reset for each frame
-            is_touching_keyboard = False # Flag for overall keyboard touch state
-            previous_key_touch_state = key_touched_states.copy()
-
-            results = hand_tracker.process_frame(color_image)
-
-            index_finger_pixel_x, index_finger_pixel_y = None, None
-
-            if results.multi_hand_landmarks:
+            if frame_recorder:
+                frame_recorder.write(color_image, aligned_depth_frame)
+
+            if use_surface_model and surface_estimator is None:
+                surface_model, surface_estimator = create_keyboard_surface_estimator(
+                    aligned_depth_frame, keyboard_manager, depth_frame_dims, camera_manager.depth_scale,
+                    SURFACE_MODEL_FILENAME)
+
+            # Skip inference while the keyboard area is static and the last frame had no hands
+            inferred = gate is None or gate.should_infer(color_image, hands_present)
+            if inferred:
+                results = hand_tracker.process_frame(color_image)
+            else:
+                results = LandmarkResults.empty()
+            landmarks, handedness = hand_tracker.extract_landmarks(results, color_image.shape)
+            hands_present = len(landmarks) > 0
+
+            tip_valid[:] = False
+            hand_tip_depths = hand_tip_heights = None
+            if len(landmarks):
                 for hand_landmarks in results.multi_hand_landmarks:
                     hand_tracker.draw_landmarks(color_image, hand_landmarks)
 
-                    (index_finger_pixel_x, index_finger_pixel_y), _ = hand_tracker.get_index_finger_tip(hand_landmarks, color_image.shape)
-
-                    clamped_index_finger_pixel_x = max(0, min(index_finger_pixel_x, depth_frame_dims[0] - 1))
-                    clamped_index_finger_pixel_y = max(0, min(index_finger_pixel_y, depth_frame_dims[1] - 1))
-
-                    depth_at_index_finger_m = aligned_depth_frame.get_distance(clamped_index_finger_pixel_x, clamped_index_finger_pixel_y)
-
-                    viz_utils.draw_finger_tip_info(color_image, index_finger_pixel_x, index_finger_pixel_y, depth_at_index_finger_m)
-
-                    if previous_depth_at_index_finger_m is not None and delta_time > 0:
-                        depth_change = depth_at_index_finger_m - previous_depth_at_index_finger_m
-                        depth_velocity = depth_change / delta_time # m/s
-
-                        # Check if finger is within interaction range
-                        if MIN_INTERACTION_DEPTH <= depth_at_index_finger_m <= MAX_INTERACTION_DEPTH:
-                            finger_point = (index_finger_pixel_x, index_finger_pixel_y)
-
-                            for key_data in keyboard_manager.get_annotated_keys():
-                                key_name = key_data['key']
-
-                                # Check if finger is over the keycap AND within the specific row depth
-                                is_over_key_and_in_depth = False
-                                if keyboard_manager.is_point_in_keycap(finger_point, key_data):
-                                    if key_name in KEYBOARD_ROW_1 and DEPTH_THRESHOLD_ROW_1[0] <= depth_at_index_finger_m < DEPTH_THRESHOLD_ROW_1[1]:
-                                        is_over_key_and_in_depth = True
-                                    elif key_name in KEYBOARD_ROW_2 and DEPTH_THRESHOLD_ROW_2[0] <= depth_at_index_finger_m < DEPTH_THRESHOLD_ROW_2[1]:
-                                        is_over_key_and_in_depth = True
-                                    elif key_name in KEYBOARD_ROW_3 and DEPTH_THRESHOLD_ROW_3[0] <= depth_at_index_finger_m < DEPTH_THRESHOLD_ROW_3[1]:
-                                        is_over_key_and_in_depth = True
-                                    elif key_name in KEYBOARD_ROW_4 and DEPTH_THRESHOLD_ROW_4[0] <= depth_at_index_finger_m < DEPTH_THRESHOLD_ROW_4[1]:
-                                        is_over_key_and_in_depth = True
-                                    elif key_name in KEYBOARD_ROW_5 and DEPTH_THRESHOLD_ROW_5[0] <= depth_at_index_finger_m < DEPTH_THRESHOLD_ROW_5[1]:
-                                        is_over_key_and_in_depth = True
-
-                                # --- State Machine Logic (Released -> Touched -> Tapped/Released) ---
-
-                                # 1. Transition to 'Touched' State
-                                # Finger is over key, within depth, and moving slightly downward/stable, AND was not touched.
-                                if is_over_key_and_in_depth and not key_touched_states[key_name]:
-                                    key_touched_states[key_name] = True # Mark as touched
-                                    print(f"Key {key_name} - Touched (Velocity: {depth_velocity:.3f})")
-                                else:
-                                    if not is_over_key_and_in_depth:
-                                    # print(previous_key_touch_state[key_name])
-                                        key_touched_states[key_name] = False
-                                    #     key_touched_states = dict.fromkeys(key_touched_states, False)
-
-                                # 2. Transition from "Touched" to "Released" (and trigger 'Tap' if conditions met)
-                                if previous_key_touch_state[key_name] and not key_touched_states[key_name]:
-                                    print(f"Key {key_name} - Released (Velocity: {depth_velocity:.3f})")
-                                    if depth_velocity < TAP_VELOCITY_THRESHOLD:
-                                        print(f"Key {key_name} - Tapped/Released (Velocity: {depth_velocity:.3f})")
-                                        detected_key_event = key_name
-
-
-                                # 2. Transition from 'Touched' to 'Released' (and trigger 'Tap' if conditions met)
-                                # Key was touched AND (finger moved off OR finger moved upward rapidly)
-                                # elif key_touched_states[key_name]:
-                                #     # If finger lifts off the key with sufficient upward velocity (a 'Tap')
-                                #     if depth_velocity > TAP_VELOCITY_THRESHOLD:
-                                #         print(f"Key {key_name} - Tapped/Released (Velocity: {depth_velocity:.3f})")
-                                #         detected_key_event = key_name # This is the key event!
-                                #         key_touched_states[key_name] = False # Mark as released
-                                #         break # A key was tapped, no need to check others
-                                #     # If finger moves off the key without a clear tap (drag-off)
-                                #     elif not keyboard_manager.is_point_in_keycap(finger_point, key_data):
-                                #         key_touched_states[key_name] = False # Mark as released
-                                #         print(f"Key {key_name} - Drag-off Released")
-
-
-                            # Determine current_displayed_key and is_touching_keyboard based on ANY touched key
-                            # This loop is separated to ensure current_displayed_key reflects currently active key
-                            any_key_is_touched = False
-                            for key_data in keyboard_manager.get_annotated_keys():
-                                key_name = key_data['key']
-                                if key_touched_states[key_name]:
-                                    current_displayed_key = key_name # Highlight the key that is logically "down"
-                                    any_key_is_touched = True
-                                    break # Only highlight one key if multiple fingers (though current only uses index)
-                            is_touching_keyboard = any_key_is_touched
-
-                        else: # Finger is outside the interaction depth range
-                            # Reset all key states if finger is too far or too close
-                            for key in key_touched_states:
-                                key_touched_states[key] = False
-                            is_touching_keyboard = False # No finger in interaction range, so not touching
-
-                    previous_depth_at_index_finger_m = depth_at_index_finger_m
-
-            else: # No hand detected, reset all key states
-                for key in key_touched_states:
-                    key_touched_states[key] = False
-                previous_depth_at_index_finger_m = None # Reset previous depth too
-                is_touching_keyboard = False
-
-            # Update typed text based on the detected_key_event (which now comes from release/tap)
-            if detected_key_event: # A new key tap event occurred
+                # Patch-median depths of every detected fingertip, clamped to the frame and robust to 0-depth holes
+                hand_tip_points = hand_tracker.get_finger_tips(landmarks)[..., :2].reshape(-1, 2).astype(np.int32)
+                hand_tip_depths = aligned_depth_frame.sample_distances(hand_tip_points)
+                if surface_model is not None and surface_model.ready:
+                    hand_tip_heights = surface_model.height_above(
+                        aligned_depth_frame.to_depth_pixels(hand_tip_points), hand_tip_depths)
+
+                # First detected hand of each handedness fills that hand's five fingertip slots
+                slots, tips = fingertip_slots(handedness)
+                tip_positions[slots] = hand_tip_points[tips]
+                tip_depths[slots] = hand_tip_depths[tips]
+                tip_valid[slots] = hand_tip_depths[tips] > 0
+                tip_keys[:] = keyboard_manager.keys_at(tip_positions)
+                for finger in np.flatnonzero(tip_valid).tolist():
+                    px, py = tip_positions[finger].tolist()
+                    viz_utils.draw_finger_tip_info(color_image, px, py, float(tip_depths[finger]))
+
+                if surface_model is not None:
+                    # Fingers are only valid while there is a surface to measure their height from
+                    if hand_tip_heights is not None:
+                        tip_heights[slots] = hand_tip_heights[tips]
+                    else:
+                        tip_valid[:] = False
+            elif surface_estimator is not None:
+                # Empty scene: feed the background surface re-estimation
+                surface_estimator.offer(aligned_depth_frame.get_data())
+
+            taps = tap_detector.update(aligned_depth_frame.get_timestamp(), tip_positions, tip_depths, tip_keys,
+                                       tip_valid, tip_heights if use_surface_model else None)
+            for finger, key_index in taps:
+                detected_key_event = key_names[key_index]
+                print(f"Key {detected_key_event} - Tapped/Released by finger {finger} "
+                      f"(Velocity: {tap_detector.velocity[finger]:.3f})")
                 if detected_key_event == "ENTER":
                     typed_text += "\n"
                 elif detected_key_event == "BACKSPACE":
@@ -188,11 +136,22 @@ def run_keyboard_interface():
                 else: # Regular character keys
                     typed_text += detected_key_event
 
-            # Draw keycap annotations and highlight the currently held/touched key for visualization
-            viz_utils.draw_keycap_annotations(color_image, keyboard_manager.get_annotated_keys(), current_displayed_key, POINTS_PER_KEY)
+            if trace_recorder:
+                # A tap is recorded as a press and a release of its key in the same frame
+                trace_recorder.write(aligned_depth_frame.get_timestamp(), landmarks, handedness, hand_tip_depths,
+                                     hand_tip_heights, [(key_names[key_index], is_press) for _, key_index in taps
+                                                        for is_press in (PRESS, RELEASE)], inferred)
 
-            # Display typed text and current key
-            viz_utils.display_text_overlays(color_image, current_displayed_key, typed_text)
+            touched_keys = {key_names[key_index] for key_index in tap_detector.touched_key.tolist() if key_index >= 0}
+            is_touching_keyboard = bool(touched_keys)
+
+            # Draw keycap annotations and highlight the currently touched keys for visualization
+            keycap_overlay.draw(color_image, touched_keys)
+
+            # --- Display typed text (last line) ---
+            last_typed_line = typed_text.split("\n")[-1]
+            cv2.putText(color_image, f"Typed: {last_typed_line}", (10, 30),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2, cv2.LINE_AA)
 
             # --- Display "Fingertip Touching Keyboard" Status ---
             status_text = "Fingertip Touching Keyboard: YES" if is_touching_keyboard else "Fingertip Touching Keyboard: NO"
@@ -203,8 +162,10 @@ def run_keyboard_interface():
                         cv2.FONT_HERSHEY_SIMPLEX, 0.7, status_color, 2, cv2.LINE_AA)
 
             # --- Display "Fingertip Location" ---
-            fingertip_location_text = f"Fingertip Location: ({index_finger_pixel_x}, {index_finger_pixel_y})"
-            fingertip_location_color = (0, 255, 0)
+            # Index finger of the first tracked hand, or (None, None)
+            index_fingers = [finger for finger in (RIGHT_HAND * 5 + 1, LEFT_HAND * 5 + 1) if tip_valid[finger]]
+            index_finger_location = tuple(tip_positions[index_fingers[0]].tolist()) if index_fingers else (None, None)
+            fingertip_location_text = f"Fingertip Location: {index_finger_location}"
             text_x = 10
             text_y = color_image.shape[0] - 40
             cv2.putText(color_image, fingertip_location_text, (text_x, text_y), cv2.FONT_HERSHEY_SIMPLEX, 0.7, status_color, 2, cv2.LINE_AA)
@@ -215,10 +176,37 @@ def run_keyboard_interface():
                 break
 
     finally:
+        if frame_recorder:
+            frame_recorder.close()
+        if trace_recorder:
+            trace_recorder.close()
         camera_manager.stop_stream()
         hand_tracker.close()
+        stats = hand_tracker.get_stats()
+        print(f"Hand tracker: {stats['inferred_frames']} frame(s) inferred, {stats['tracked_frames']} tracked "
+              f"with optical flow")
+        if gate is not None:
+            print(f"Motion gate: {gate.gated_frames} frame(s) skipped, {gate.inferred_frames} inferred")
         cv2.destroyAllWindows()
         print("Application stopped.")
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Camera-based tap keyboard")
+    parser.add_argument('--record', metavar='DIR', help="Record the camera frames to DIR while running")
+    parser.add_argument('--replay', metavar='DIR', help="Replay a recording from DIR instead of using the camera")
+    parser.add_argument('--fast-replay', action='store_true',
+                        help="Replay frames as fast as they can be processed instead of in real time")
+    parser.add_argument('--surface-model', action='store_true',
+                        help="Detect touches by fingertip height above a measured keyboard surface")
+    parser.add_argument('--motion-gate', action='store_true',
+                        help="Skip hand inference while the keyboard area is static and no hands are present")
+    parser.add_argument('--record-trace', metavar='DIR', default=None,
+                        help="Record the landmarks, fingertip depths and taps to DIR for trace_replay.py")
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
-    run_keyboard_interface()
\ No newline at end of file
+    args = parse_args()
+    run_keyboard_interface(replay_path=args.replay, record_path=args.record, realtime_replay=not args.fast_replay,
+                           use_surface_model=args.surface_model, motion_gate=args.motion_gate,
+                           trace_path=args.record_trace)
\ No newline at end of file
@@ -0,0 +1,64 @@
+import argparse
+import time
+
+from src.keyboard_manager import ANNOTATION_FILENAME, LAYOUT_CACHE_DIR, POINTS_PER_KEY, THRESHOLDS_FILENAME, KeyboardManager
+from src.landmark_trace import LandmarkTrace
+from src.press_detector import PressDetector
+from src.tap_detector import create_tap_detector
+from src.trace_replay import compare_events, replay_presses, replay_taps
+
+
+def run_trace_replay(trace_path, logic='press', use_surface_model=False, press_height=0.012, show_events=False):
+    """
+    Feeds a landmark trace recorded with --record-trace through the press logic of main.py
+    (`logic='press'`) or the tap logic of tapboard_main.py (`logic='tap'`), without a camera or
+    MediaPipe, and compares the key events with the ones recorded live.
+    """
+    trace = LandmarkTrace(trace_path)
+    keyboard_manager = KeyboardManager(annotation_filename=ANNOTATION_FILENAME, points_per_key=POINTS_PER_KEY,
+                                       thresholds_filename=THRESHOLDS_FILENAME, cache_dir=LAYOUT_CACHE_DIR)
+    if keyboard_manager.key_names != trace.key_names:
+        print("Warning: The keyboard layout differs from the one the trace was recorded with.")
+    print(f"Replaying {len(trace)} frame(s) ({trace.duration:.1f} s) from '{trace_path}' through the {logic} logic...")
+
+    start = time.perf_counter()
+    if logic == 'press':
+        press_detector = PressDetector(*keyboard_manager.get_key_thresholds(), press_height)
+        events = replay_presses(trace, keyboard_manager, press_detector, use_surface_model)
+    else:
+        tap_detector = create_tap_detector(keyboard_manager.key_names, use_surface_model)
+        events = replay_taps(trace, keyboard_manager, tap_detector, use_surface_model)
+    elapsed = time.perf_counter() - start
+
+    speedup = trace.duration / elapsed if elapsed > 0 else float('inf')
+    print(f"Replayed in {elapsed * 1000.0:.1f} ms ({len(trace) / max(elapsed, 1e-9):.0f} frames/s, "
+          f"{speedup:.0f}x real time)")
+    if show_events:
+        for frame, key_name, is_press in events:
+            print(f"{frame:>8}  {trace.timestamps[frame]:>14.1f} ms  {'press  ' if is_press else 'release'}  {key_name}")
+    stats = compare_events(events, trace.key_events(), trace.inferred)
+    print(f"Key events: {stats['replayed']} replayed, {stats['recorded']} recorded, {stats['matched']} matched, "
+          f"{stats['missed']} missed, {stats['extra']} extra")
+    if stats['skipped']:
+        print(f"Left out {stats['skipped']} recorded event(s) on {int((~trace.inferred).sum())} frame(s) "
+              f"that skipped hand inference.")
+    return events
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Replay a landmark trace through the detection logic")
+    parser.add_argument('trace', metavar='DIR', help="Landmark trace recorded with --record-trace")
+    parser.add_argument('--logic', choices=('press', 'tap'), default='press',
+                        help="Press logic of main.py or tap logic of tapboard_main.py")
+    parser.add_argument('--surface-model', action='store_true',
+                        help="Use the recorded heights above the keyboard surface instead of the depth thresholds")
+    parser.add_argument('--press-height', type=float, default=0.012, metavar='M',
+                        help="Fingertip height above the surface, in metres, below which a key is pressed")
+    parser.add_argument('--show-events', action='store_true', help="Print every replayed key event")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    run_trace_replay(args.trace, logic=args.logic, use_surface_model=args.surface_model,
+                     press_height=args.press_height, show_events=args.show_events)
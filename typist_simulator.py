@@ -0,0 +1,105 @@
+import argparse
+import collections
+import time
+
+from src.keyboard_manager import ANNOTATION_FILENAME, LAYOUT_CACHE_DIR, POINTS_PER_KEY, THRESHOLDS_FILENAME, KeyboardManager
+from src.landmark_trace import LandmarkTraceRecorder
+from src.press_detector import PressDetector
+from src.tap_detector import create_tap_detector
+from src.trace_replay import key_error_rate, replay_presses, replay_taps
+from src.typist_simulator import TypistSimulator
+
+
+def save_trace(trace, path):
+    """Writes an in-memory LandmarkTrace to `path` in the --record-trace format, ground-truth events included."""
+    events = collections.defaultdict(list)
+    for frame, key_name, is_press in trace.key_events():
+        events[frame].append((key_name, is_press))
+    recorder = LandmarkTraceRecorder(path, trace.image_size, trace.key_names, trace.max_hands)
+    for frame in range(len(trace)):
+        hands = int(trace.num_hands[frame])
+        recorder.write(trace.timestamps[frame], trace.landmarks[frame, :hands], trace.handedness[frame, :hands],
+                       trace.tip_depths[frame], trace.tip_heights[frame], events.get(frame, ()),
+                       bool(trace.inferred[frame]))
+    recorder.close()
+
+
+def evaluate(simulator, text, logic='press', use_surface_model=False, press_height=0.012):
+    """Simulates typing `text` and replays it through the detection logic; returns (trace, key error rate, frames/s)."""
+    session = simulator.simulate(text)
+    trace = simulator.to_trace(session)
+    keyboard_manager = simulator.keyboard_manager
+
+    start = time.perf_counter()
+    if logic == 'press':
+        press_detector = PressDetector(*keyboard_manager.get_key_thresholds(), press_height)
+        events = replay_presses(trace, keyboard_manager, press_detector, use_surface_model)
+    else:
+        tap_detector = create_tap_detector(keyboard_manager.key_names, use_surface_model)
+        events = replay_taps(trace, keyboard_manager, tap_detector, use_surface_model)
+    elapsed = time.perf_counter() - start
+    return trace, key_error_rate(events, trace.key_events()), len(trace) / max(elapsed, 1e-9)
+
+
+def run_typist_simulator(corpus_path, wpm_list=(40,), logic='press', use_surface_model=False, press_height=0.012,
+                         max_error=0.05, trace_path=None, seed=0):
+    """
+    Types the text in `corpus_path` with a TypistSimulator at every speed in `wpm_list`, replays each
+    session through the press logic of main.py or the tap logic of tapboard_main.py and reports the
+    key error rate and replay throughput, plus the fastest speed that stays within `max_error`.
+    """
+    with open(corpus_path) as f:
+        text = f.read()
+    keyboard_manager = KeyboardManager(annotation_filename=ANNOTATION_FILENAME, points_per_key=POINTS_PER_KEY,
+                                       thresholds_filename=THRESHOLDS_FILENAME, cache_dir=LAYOUT_CACHE_DIR)
+
+    key_bands = None
+    if logic == 'tap' and not use_surface_model:
+        # The tap logic has its own row depth bands rather than key_thresholds.json; type into those
+        tap_detector = create_tap_detector(keyboard_manager.key_names)
+        key_bands = (tap_detector.key_min, tap_detector.key_max)
+
+    ceiling = None
+    for wpm in wpm_list:
+        simulator = TypistSimulator(keyboard_manager, wpm=wpm, key_bands=key_bands, seed=seed)
+        trace, error_rate, frames_per_second = evaluate(simulator, text, logic, use_surface_model, press_height)
+        print(f"{wpm:>6.0f} wpm: {len(trace)} frame(s) ({trace.duration:.1f} s), key error rate {error_rate:.3f}, "
+              f"replayed at {frames_per_second:.0f} frames/s")
+        if error_rate <= max_error:
+            ceiling = wpm if ceiling is None else max(ceiling, wpm)
+        if trace_path is not None and len(wpm_list) == 1:
+            save_trace(trace, trace_path)
+            print(f"Saved the simulated trace to '{trace_path}'.")
+
+    if len(wpm_list) > 1:
+        if ceiling is None:
+            print(f"No speed stayed within a key error rate of {max_error:.3f}.")
+        else:
+            print(f"Fastest speed within a key error rate of {max_error:.3f}: {ceiling:.0f} wpm")
+    return ceiling
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Measure the detection logic on simulated typing")
+    parser.add_argument('corpus', metavar='FILE', help="Text file to type")
+    parser.add_argument('--wpm', type=float, nargs='+', default=[40.0],
+                        help="Typing speed in words per minute; several values sweep for the fastest usable speed")
+    parser.add_argument('--logic', choices=('press', 'tap'), default='press',
+                        help="Press logic of main.py or tap logic of tapboard_main.py")
+    parser.add_argument('--surface-model', action='store_true',
+                        help="Use the heights above the keyboard surface instead of the depth thresholds")
+    parser.add_argument('--press-height', type=float, default=0.012, metavar='M',
+                        help="Fingertip height above the surface, in metres, below which a key is pressed")
+    parser.add_argument('--max-error', type=float, default=0.05,
+                        help="Key error rate a speed must stay within to count as usable")
+    parser.add_argument('--trace', metavar='DIR', default=None,
+                        help="Also save the simulated landmark trace for trace_replay.py (single speed only)")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed of the simulation")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    run_typist_simulator(args.corpus, wpm_list=args.wpm, logic=args.logic, use_surface_model=args.surface_model,
+                         press_height=args.press_height, max_error=args.max_error, trace_path=args.trace,
+                         seed=args.seed)